@@ -1,4 +1,5 @@
 """Пакет содержит файлы:
+    - admin.py (служебные команды администраторов: /profile)
     - basic.py (выводит «Главное меню» и связанные утилиты)
     - cook.py (модуль «Меню на неделю»)
     - gpt.py (модуль «ChatGPT»)
@@ -0,0 +1,66 @@
+"""
+handlers.admin
+==============
+
+Служебные команды для администраторов бота (`ADMIN_IDS` в .env —
+Telegram id через запятую). Без `ADMIN_IDS` команды не регистрируются,
+а для остальных пользователей их просто нет.
+
+* `/profile [секунды]` — снять профиль работающего бота
+  (`services.profiler`, по умолчанию 30 с) и прислать отчёт файлом
+  `profile.txt`: задержка event loop, занятость CPU и горячие функции,
+  время по обработчикам, OpenAI и Bot API, точки ожидания задач.
+  Профиль снимается в фоне, бот в это время работает как обычно.
+"""
+
+import logging
+import os
+
+from telegram import InputFile, Update
+from telegram.ext import Application, CommandHandler, ContextTypes, filters
+
+from services import profiler
+from services.tasks import tasks
+
+logger = logging.getLogger(__name__)
+
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(",", " ").split()}
+DEFAULT_SECONDS = 30
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+        Команда `/profile [секунды]`: запустить профиль в фоне.
+
+        Длительность ограничена `services.profiler.MAX_SECONDS`;
+        одновременно идёт не больше одного профиля.
+    """
+    message = update.effective_message
+    if profiler.running():
+        await message.reply_text("⏱ Профиль уже снимается, дождитесь отчёта.")
+        return
+    args = context.args or []
+    seconds = int(args[0]) if args and args[0].isdigit() else DEFAULT_SECONDS
+    seconds = max(1, min(seconds, profiler.MAX_SECONDS))
+
+    await message.reply_text(f"⏱ Снимаю профиль {seconds} с…")
+    tasks.spawn(message.chat_id, _deliver(update, context, seconds),
+                name=f"profile:{message.chat_id}")
+
+
+async def _deliver(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                   seconds: int) -> None:
+    """Фоновая часть `profile`: снять профиль и прислать отчёт файлом."""
+    report = await profiler.run(context.application, seconds)
+    logger.info("Profile requested by %s:\n%s", update.effective_user.id, report)
+    await update.effective_message.reply_document(
+        InputFile(report.encode("utf-8"), filename="profile.txt"),
+        caption=report.split("\n", 2)[1][:1024],
+    )
+
+
+def register_handlers(app: Application) -> None:
+    if not ADMIN_IDS:
+        return
+    app.add_handler(CommandHandler("profile", profile,
+                                   filters=filters.User(user_id=ADMIN_IDS)))
@@ -22,7 +22,8 @@ from telegram.ext import (
     CommandHandler,
     CallbackQueryHandler,
 )
-from services import ui
+from services import nav, ui
+from services.tasks import tasks
 
 logger = logging.getLogger(__name__)
 
@@ -75,21 +76,18 @@ async def show_main_menu(update: Update,
 
         Side Effects
         ------------
-        • Отправляет/редактирует сообщение-картинку с клавиатурой.
+        • Отменяет незавершённые генерации чата (`services.tasks`):
+          все выходы из режимов (`_end_and_menu`, «Главное меню», /start)
+          проходят через эту функцию.
+        • Показывает меню через `services.nav`: редактирует карточку,
+          на кнопку которой нажали, или присылает новую.
         • Логирует факт показа меню.
     """
+    tasks.cancel(update.effective_chat.id)
     if update.callback_query:
         await update.callback_query.answer()
-        try:
-            await update.callback_query.message.delete()
-        except Exception:
-            pass
-
-    await update.effective_message.reply_photo(
-        IMAGE,
-        caption="👋 Привет! Выберите режим работы:",
-        reply_markup=_kb(),
-    )
+
+    await nav.show(update, IMAGE, "👋 Привет! Выберите режим работы:", _kb())
     logger.info("Меню показано пользователю %s", update.effective_user.id)
 
 
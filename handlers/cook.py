@@ -22,46 +22,40 @@ from telegram import Update
 from telegram.ext import (
     ContextTypes,
     CommandHandler,
-    CallbackQueryHandler,
 )
-from services import ui
+from services import nav, ui, validate
+from services.router import CallbackRouter, STALE_BUTTON
 from services.openai_client import get_week_menu
+from services.tasks import tasks
+from services.usage import QuotaExceeded
 
 logger = logging.getLogger(__name__)
 IMAGE = "images/cook.jpg"
 READY = "✅ Меню готово! Смотрите сообщение ниже 👇"
 
 
-async def _show_limits(update: Update, *, edit: bool = False):
+async def _show_limits(update: Update):
     """
         Отобразить клавиатуру выбора калорийности.
 
         Parameters
         ----------
         update : telegram.Update
-            Объект события (используется либо `effective_message`, либо
-            `callback_query` для редактирования).
-        edit : bool, default=False
-            * `False` — отправить **новое** сообщение-картинку с клавиатурой.
-            * `True`  — **заменить** подпись/клавиатуру у существующего
-              сообщения (используется при «🔄 Выбрать другой лимит»).
+            Объект события: команда `/cook` или callback, карточку
+            которого можно отредактировать.
 
         Side Effects
         ------------
-        • Отправляет или редактирует сообщение с картинкой `IMAGE`.
+        • Показывает `IMAGE` с клавиатурой через `services.nav`:
+          из меню и по «🔄 Выбрать другой лимит» карточка
+          редактируется на месте, по команде — присылается новая.
         • Не возвращает значения — чистый I/O.
     """
-    caption = "📋 Подбор меню на неделю\n\nВыберите дневной лимит ккал:"
-    kb = ui.get_cook_kcal_keyboard()
-
-    if edit:
-        await update.callback_query.edit_message_caption(
-            caption, reply_markup=kb, parse_mode="Markdown"
-        )
-    else:
-        await update.effective_message.reply_photo(
-            IMAGE, caption=caption, reply_markup=kb, parse_mode="Markdown"
-        )
+    await nav.show(
+        update, IMAGE,
+        "📋 Подбор меню на неделю\n\nВыберите дневной лимит ккал:",
+        ui.get_cook_kcal_keyboard(), parse_mode="Markdown",
+    )
 
 
 async def start_cook(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -79,6 +73,8 @@ async def start_cook(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context : telegram.ext.ContextTypes.DEFAULT_TYPE
             Контекст PTB. Здесь не используется, но обязателен по сигнатуре.
     """
+    if update.callback_query:
+        await update.callback_query.answer()
     await _show_limits(update)
 
 
@@ -86,30 +82,59 @@ async def kcal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
         Обработчик выбора конкретного лимита калорий.
 
-        • Извлекает число из callback-data (`cook_kcal:<N>`).
-        • Показывает «⏳ Готовлю меню…».
-        • Запрашивает меню у OpenAI (`services.openai_client.get_week_menu`).
-        • Отправляет результат отдельным сообщением.
-        • Обновляет исходное сообщение на «✅ Меню готово!».
+        • Берёт число из упакованной callback-data (`pack(cook_kcal, N)`),
+          уже декодированной маршрутизатором в `context.args`; значение
+          не из `ui.COOK_KCAL_PRESETS` отклоняется как устаревшая кнопка
+          (оно попало бы в промпт и ключ `services.store`).
+        • Показывает «⏳ Готовлю меню…» с кнопкой «🔙 Главное меню».
+        • Запускает `_deliver_menu` фоновой задачей чата
+          (`services.tasks`): обработчик сразу освобождается, а выход
+          в главное меню отменяет генерацию.
 
         Parameters
         ----------
         update : telegram.Update
-            Callback с данными вида `cook_kcal:2000`.
+            Callback с данными `pack(ui.CB_COOK_PREFIX, 2000)`.
         context : telegram.ext.ContextTypes.DEFAULT_TYPE
-            Контекст PTB (не используется).
+            Контекст PTB; `context.args[0]` — выбранный лимит.
     """
     q = update.callback_query
+    kcal, = context.args
+    if kcal not in ui.COOK_KCAL_PRESETS:               # подделанная callback-data
+        await q.answer(STALE_BUTTON)
+        return
     await q.answer()
-    kcal = int(q.data.split(":")[1])
 
     await q.edit_message_caption(
         f"⏳ Готовлю меню на {kcal} ккал/день…",
+        reply_markup=ui.get_back_keyboard(),
         parse_mode="Markdown",
     )
+    tasks.spawn(q.message.chat_id, _deliver_menu(q, kcal),
+                name=f"cook:{q.message.chat_id}")
+
+
+async def _deliver_menu(q, kcal: int) -> None:
+    """
+        Фоновая часть `kcal`: получить меню и доставить его.
+
+        • Запрашивает меню у OpenAI (`services.openai_client.get_week_menu`).
+        • Обновляет исходное сообщение на «✅ Меню готово!».
+        • Отправляет результат отдельными сообщениями: длинное меню
+          режется по абзацам, разметка каждой части проверяется
+          (`services.validate`), чтобы Telegram не отверг сообщение.
 
+        Parameters
+        ----------
+        q : telegram.CallbackQuery
+            Исходный callback (нужен для редактирования карточки).
+        kcal : int
+            Суточный лимит калорий.
+    """
     try:
-        menu = await get_week_menu(kcal)
+        menu = await get_week_menu(kcal, user_id=q.from_user.id)
+    except QuotaExceeded as exc:
+        menu = str(exc)
     except Exception as exc:                        # noqa: BLE001
         logger.exception("Menu error: %s", exc)
         menu = "⚠️ Не удалось получить меню."
@@ -118,14 +143,15 @@ async def kcal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         READY, reply_markup=ui.get_cook_result_keyboard(),
         parse_mode="Markdown",
     )
-    await q.message.reply_text(menu, parse_mode="Markdown")
+    for part in validate.split(menu):
+        await q.message.reply_text(validate.markdown(part), parse_mode="Markdown")
 
 
 async def back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
         Callback-обработчик «🔄 Выбрать другой лимит».
 
-        Просто вызывает `_show_limits(edit=True)`, чтобы заменить подпись и
+        Просто вызывает `_show_limits`, чтобы заменить подпись и
         клавиатуру в том же сообщении, не создавая нового.
 
         Parameters
@@ -136,17 +162,12 @@ async def back(update: Update, context: ContextTypes.DEFAULT_TYPE):
             PTB-контекст (не используется).
     """
     await update.callback_query.answer()
-    await _show_limits(update, edit=True)
+    await _show_limits(update)
 
 
-def register_handlers(app):
+def register_handlers(app, router: CallbackRouter):
     app.add_handler(CommandHandler("cook", start_cook))
 
-    app.add_handler(CallbackQueryHandler(start_cook,
-                                         pattern=f"^{ui.CB_COOK}$"))
-
-    app.add_handler(CallbackQueryHandler(kcal,
-                                         pattern=rf"^{ui.CB_COOK_PREFIX}:\d+$"))
-
-    app.add_handler(CallbackQueryHandler(back,
-                                         pattern=f"^{ui.CB_COOK_BACK}$"))
+    router.add(ui.CB_COOK, start_cook)
+    router.add(ui.CB_COOK_PREFIX, kcal, packed=True, arity=1)
+    router.add(ui.CB_COOK_BACK, back)
@@ -28,11 +28,13 @@ from telegram.ext import (
     ConversationHandler,
     CommandHandler,
     MessageHandler,
-    CallbackQueryHandler,
     filters,
 )
 from services.openai_client import ask_chatgpt
-from services import ui
+from services import nav, ui
+from services.debounce import debouncer
+from services.router import CallbackRouter
+from services.usage import QuotaExceeded
 from handlers import basic
 
 logger = logging.getLogger(__name__)
@@ -40,7 +42,7 @@ logger = logging.getLogger(__name__)
 # константы
 IMAGE = "images/chatgpt.jpg"
 ASK   = 0
-CB_STOP = "gpt_stop"
+CB_STOP = ui.CB_GPT_STOP
 
 # клавиатура под ответами
 def _kb() -> InlineKeyboardMarkup:
@@ -67,9 +69,8 @@ async def _end_and_menu(update: Update,
     """
         Унифицированное завершение диалога.
 
-        • Подтверждает callback (если есть).
-        • Пытается удалить сообщение-карточку с обложкой.
-        • Показывает главное меню.
+        • Показывает главное меню (`basic.show_main_menu` сам
+          подтверждает callback и редактирует карточку на месте).
         • Завершает разговор с помощью `ConversationHandler.END`.
 
         Parameters
@@ -85,12 +86,6 @@ async def _end_and_menu(update: Update,
             Константа `ConversationHandler.END` для корректного выхода
             из машины состояний.
     """
-    if update.callback_query:
-        await update.callback_query.answer()
-        try:
-            await update.callback_query.message.delete()
-        except Exception:
-            pass
     await basic.show_main_menu(update, context)
     return ConversationHandler.END
 
@@ -101,7 +96,8 @@ async def start(update: Update,
         Запустить «режим ChatGPT».
 
         Срабатывает на `/gpt` **или** на inline-кнопку из главного меню.
-        Отправляет картинку-обложку (`IMAGE`) с подписью и клавиатурой `_kb()`.
+        Показывает картинку-обложку (`IMAGE`) с подписью и клавиатурой `_kb()`
+        через `services.nav` — из меню карточка редактируется на месте.
 
         Returns
         -------
@@ -110,13 +106,8 @@ async def start(update: Update,
     """
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.delete()
 
-    await update.effective_message.reply_photo(
-        IMAGE,
-        caption="Спросите меня о чём-нибудь!",
-        reply_markup=_kb(),
-    )
+    await nav.show(update, IMAGE, "Спросите меня о чём-нибудь!", _kb())
     return ASK
 
 
@@ -126,45 +117,52 @@ async def reply(update: Update,
         Отправить пользовательский запрос в ChatGPT и показать ответ.
 
         Пайплайн:
-        1. Берём `update.message.text` — текст вопроса.
-        2. Вызываем `services.openai_client.ask_chatgpt`.
+        1. Берём `update.message.text` — текст вопроса — и отдаём его
+           в `services.debounce`: сообщения, пришедшие подряд в течение
+           короткого окна, склеиваются в один вопрос.
+        2. По истечении окна вызываем `services.openai_client.ask_chatgpt`.
         3. В случае исключения логируем и отправляем сообщение об ошибке.
-        4. Отправляем ответ вместе с клавиатурой `_kb()`.
+        4. Отправляем ответ на последнее сообщение вместе с клавиатурой `_kb()`.
 
         Returns
         -------
         int
             Состояние **ASK** — остаёмся в текущем режиме.
     """
-    question = update.message.text
-    try:
-        answer = await ask_chatgpt(question)
-    except Exception as exc:                  # noqa: BLE001
-        logger.exception("GPT error: %s", exc)
-        answer = "⚠️ Не удалось получить ответ. Попробуйте ещё раз."
-
-    await update.message.reply_text(answer, reply_markup=_kb())
+    message = update.message
+
+    async def _answer(question: str) -> None:
+        try:
+            answer = await ask_chatgpt(question, task="chat",
+                                       user_id=message.from_user.id)
+        except QuotaExceeded as exc:
+            answer = str(exc)
+        except Exception as exc:              # noqa: BLE001
+            logger.exception("GPT error: %s", exc)
+            answer = "⚠️ Не удалось получить ответ. Попробуйте ещё раз."
+        await message.reply_text(answer, reply_markup=_kb())
+
+    debouncer.submit(update.effective_chat.id, "gpt", message.text, _answer)
     return ASK
 
 
 def build_gpt_handler() -> ConversationHandler:
+    stop = (CallbackRouter("gpt.stop")
+            .add(CB_STOP, _end_and_menu)
+            .add(ui.CB_MAIN_MENU, _end_and_menu))
     return ConversationHandler(
         entry_points=[
             CommandHandler("gpt", start),
-            CallbackQueryHandler(start, pattern=f"^{ui.CB_GPT}$"),
+            CallbackRouter("gpt.entry").add(ui.CB_GPT, start).handler(),
         ],
         states={
             ASK: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, reply),
-                CallbackQueryHandler(_end_and_menu, pattern=f"^{CB_STOP}$"),
-                CallbackQueryHandler(_end_and_menu,
-                                    pattern=f"^{ui.CB_MAIN_MENU}$"),
+                stop.handler(),
             ]
         },
-        fallbacks=[CallbackQueryHandler(
-            _end_and_menu,
-            pattern=f"^({CB_STOP}|{ui.CB_MAIN_MENU})$",
-        )],
+        fallbacks=[stop.handler()],
+        name="gpt",
         per_chat=True,
         per_user=False,
     )
@@ -2,21 +2,27 @@
 handlers.quiz
 =============
 
-Динамический «Квиз» (викторина), в которой вопросы на лету
-генерирует ChatGPT.
+Динамический «Квиз» (викторина): вопросы выдаются из локального банка
+(`services.quiz_bank`) с настраиваемой долей свежих вопросов,
+которые на лету генерирует ChatGPT.
 
 Алгоритм работы модуля
 ----------------------
 1. Пользователь вызывает `/quiz` **или** нажимает кнопку «❓ Квиз»
    в главном меню.
 2. Боту показывается изображение-обложка и клавиатура с выбором темы.
-3. После выбора темы бот запрашивает у ChatGPT один вопрос
-   (`services.openai_client.get_quiz_question`) и предлагает три варианта ответа.
+3. После выбора темы бот берёт вопрос (`services.quiz_bank.serve`:
+   банк или ChatGPT) и предлагает три варианта ответа.
 4. Пользователь выбирает вариант:
-   • бот сообщает, правильный ли ответ;
-   • предлагает «➕ Ещё вопрос» (та же тема) или «🔙 Главное меню».
+   • бот сообщает, правильный ли ответ, и начисляет очки
+     (`services.quiz_stats`: счёт, серия, статистика по темам);
+   • предлагает «➕ Ещё вопрос» (та же тема), «🏆 Рейтинг»
+     (таблица лидеров и точность пользователя по темам)
+     или «🔙 Главное меню».
 5. При необходимости пользователь может вернуться в меню и начать сначала.
 
+Команда `/top` (и кнопка «🏆 Рейтинг») показывает таблицу лидеров.
+
 Внутри реализовано два состояния ConversationHandler:
 
 * **TOPIC**  – выбор темы;
@@ -25,15 +31,18 @@ handlers.quiz
 
 from __future__ import annotations
 import logging
+import os
+from typing import List, NamedTuple
 from telegram import (
     Update, InlineKeyboardMarkup as Mk, InlineKeyboardButton as Btn,
 )
 from telegram.ext import (
-    ContextTypes, ConversationHandler,
-    CommandHandler, CallbackQueryHandler,
+    ContextTypes, ConversationHandler, CommandHandler,
 )
-from services.ui import CB_QUIZ_RUN
-from services.openai_client import get_quiz_question
+from services import images, nav, ui, quiz_bank, quiz_stats, sessions
+from services.codec import PayloadStore, pack
+from services.router import CallbackRouter, STALE_BUTTON
+from services.usage import QuotaExceeded
 
 logger = logging.getLogger(__name__)
 IMAGE = "images/quiz.jpg"
@@ -45,6 +54,21 @@ TOPICS = {
     "sci":  "Наука",
     "mov":  "Кино",
 }
+_TOPIC_CODES = tuple(TOPICS)
+
+
+class Question(NamedTuple):
+    """Вопрос, на который ссылаются кнопки ответа (`quiz_ans`)."""
+    topic: str
+    text: str
+    options: List[str]
+    right: int
+
+
+# Серверная сторона кнопок: в callback-data уходит только ключ вопроса.
+QUESTIONS: PayloadStore[Question] = PayloadStore(
+    int(os.getenv("QUIZ_STORE_SIZE", "10000"))
+)
 
 def _topics_kb() -> Mk:
     """
@@ -53,37 +77,34 @@ def _topics_kb() -> Mk:
         Returns
         -------
         telegram.InlineKeyboardMarkup
-            Кнопки-строки вида «История», «Наука», … с callback-датой
-            `quiz_topic:<код_темы>`.
+            Кнопки-строки вида «История», «Наука», … с упакованной
+            callback-датой `quiz_topic:<индекс_темы>`.
     """
     return Mk([
-        [Btn(name, callback_data=f"quiz_topic:{code}")]
-        for code, name in TOPICS.items()
+        [Btn(TOPICS[code], callback_data=pack(ui.CB_QUIZ_TOPIC, i))]
+        for i, code in enumerate(_TOPIC_CODES)
     ])
 
 
-def _ans_kb(topic: str, q_id: int, options: list[str]) -> Mk:
+def _ans_kb(q_id: int, options: list[str]) -> Mk:
     """
         Создать клавиатуру с вариантами ответа на вопрос.
 
         Parameters
         ----------
-        topic : str
-            Код выбранной темы (hist/sci/mov) — нужен, чтобы затем
-            задавать дополнительные вопросы той же категории.
         q_id : int
-            Произвольный идентификатор вопроса (используем `id(text)`),
-            включается в callback-data, чтобы различать разные вопросы.
+            Ключ вопроса в `QUESTIONS`; по нему `handle_answer` находит
+            тему и правильный ответ.
         options : list[str]
             Список из трёх строк-вариантов ответа.
 
         Returns
         -------
         telegram.InlineKeyboardMarkup
-            Три вертикальные кнопки-варианта (`quiz_ans:<q_id>:<idx>`).
+            Три вертикальные кнопки-варианта (`pack(quiz_ans, q_id, idx)`).
     """
     return Mk([
-        [Btn(txt, callback_data=f"quiz_ans:{q_id}:{i}")]
+        [Btn(txt, callback_data=pack(ui.CB_QUIZ_ANS, q_id, i))]
         for i, txt in enumerate(options)
     ])
 
@@ -101,12 +122,15 @@ def _after_kb(topic: str) -> Mk:
         Returns
         -------
         telegram.InlineKeyboardMarkup
-            • «➕ Ещё вопрос» (`quiz_next:<topic>`)
+            • «➕ Ещё вопрос» (`pack(quiz_next, индекс_темы)`)
+            • «🏆 Рейтинг» (`quiz_top`)
             • «🔙 Главное меню» (`quiz_finish`)
     """
     return Mk([
-        [Btn("➕ Ещё вопрос", callback_data=f"quiz_next:{topic}")],
-        [Btn("🔙 Главное меню", callback_data="quiz_finish")],
+        [Btn("➕ Ещё вопрос",
+             callback_data=pack(ui.CB_QUIZ_NEXT, _TOPIC_CODES.index(topic)))],
+        [Btn("🏆 Рейтинг", callback_data=ui.CB_QUIZ_TOP)],
+        [Btn("🔙 Главное меню", callback_data=ui.CB_QUIZ_FINISH)],
     ])
 
 
@@ -124,12 +148,7 @@ async def start_quiz_command(update: Update,
     """
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.delete()
-    await update.effective_message.reply_photo(
-        IMAGE,
-        caption="📚 Выберите тему квиза:",
-        reply_markup=_topics_kb(),
-    )
+    await nav.show(update, IMAGE, "📚 Выберите тему квиза:", _topics_kb())
     return TOPIC
 
 
@@ -137,8 +156,8 @@ async def choose_topic(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     """
         Обработать кнопку выбора темы.
 
-        Сохраняет выбранный `topic_code` в `context.user_data`
-        и сразу же генерирует первый вопрос, вызывая `_ask_question`.
+        Сохраняет выбранный `topic_code` в сессии чата
+        (`services.sessions.quiz`) и сразу же генерирует первый вопрос, вызывая `_ask_question`.
 
         Returns
         -------
@@ -147,14 +166,16 @@ async def choose_topic(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     """
     q = update.callback_query
     await q.answer()
-    topic_code = q.data.split(":")[1]
-    context.user_data["topic"] = topic_code
+    idx, = context.args
+    if not 0 <= idx < len(_TOPIC_CODES):
+        return TOPIC
+    sessions.quiz.get(q.message.chat_id).topic = _TOPIC_CODES[idx]
     return await _ask_question(q, context)
 
 
 async def _ask_question(target, context) -> int:
     """
-        Запросить у ChatGPT вопрос и отобразить его пользователю.
+        Получить вопрос (банк или ChatGPT) и отобразить его пользователю.
 
         Parameters
         ----------
@@ -162,29 +183,53 @@ async def _ask_question(target, context) -> int:
             Объект, с помощью которого следует отправить/отредактировать
             сообщение (может быть как `CallbackQuery`, так и `Message`).
         context : telegram.ext.CallbackContext
-            PTB-контекст; используются `context.user_data['topic']`
-            и запись правильного ответа в `context.user_data['right']`.
+            PTB-контекст. Тема берётся из сессии чата
+            (`services.sessions.quiz`), сам вопрос с правильным ответом сохраняется в `QUESTIONS`.
+
+        Если вопроса нет ни в банке, ни от ChatGPT (в том числе при
+        исчерпанной квоте), пользователь видит причину и клавиатуру
+        `_after_kb()` — в `QUESTIONS` ничего не попадает.
 
         Returns
         -------
         int
-            Состояние **ASK** — остаёмся на этапе ответов.
+            Состояние **ASK** — остаёмся на этапе ответов; **TOPIC**, если
+            сессия чата истекла или вытеснена и тема неизвестна —
+            пользователь снова выбирает её.
     """
-    topic_code = context.user_data["topic"]
+    chat_id = target.message.chat_id
+    session = sessions.quiz.peek(chat_id)
+    if session is None or session.topic is None:
+        await _show(target, "📚 Выберите тему квиза:", _topics_kb())
+        return TOPIC
+    topic_code = sessions.quiz.get(chat_id).topic
     topic_ru   = TOPICS[topic_code]
 
-    q_text, options, right = await get_quiz_question(topic_ru)
-
-    context.user_data["right"] = right
+    try:
+        q_text, options, right = await quiz_bank.serve(
+            topic_code, topic_ru, user_id=target.from_user.id,
+        )
+    except QuotaExceeded as exc:
+        await _show(target, str(exc), _after_kb(topic_code))
+        return ASK
+    except Exception as exc:                        # noqa: BLE001
+        logger.exception("Quiz question error: %s", exc)
+        await _show(target, "⚠️ Не удалось получить вопрос. Попробуйте ещё раз.",
+                    _after_kb(topic_code))
+        return ASK
+
+    q_id = QUESTIONS.put(Question(topic_code, q_text, options, right))
+    await _show(target, q_text, _ans_kb(q_id, options))
+    return ASK
 
-    kb = _ans_kb(topic_code, id(q_text), options)
 
+async def _show(target, caption: str, kb: Mk) -> None:
+    """Заменить подпись карточки `target`, а если нельзя — прислать новую."""
     try:
-        await target.edit_message_caption(q_text, reply_markup=kb)
+        await target.edit_message_caption(caption, reply_markup=kb)
     except Exception:                               # noqa: BLE001
-        await target.message.reply_photo(IMAGE, caption=q_text, reply_markup=kb)
-
-    return ASK
+        await images.send_cover(target.message.reply_photo, IMAGE,
+                                caption=caption, reply_markup=kb)
 
 
 async def handle_answer(update: Update,
@@ -192,8 +237,13 @@ async def handle_answer(update: Update,
     """
         Обработать выбор варианта ответа пользователем.
 
-        • Сравнивает выбранный индекс с сохранённым `right`.
-        • Сообщает «✅ Верно!» или «❌ Неверно!».
+        • Находит вопрос по ключу из кнопки; если он уже вытеснен
+          из `QUESTIONS`, сообщает, что кнопка устарела.
+        • Засчитывает только первый ответ на вопрос
+          (`QuizSession.answered`).
+        • Сравнивает выбранный индекс с правильным ответом и записывает
+          результат в `services.quiz_stats`.
+        • Сообщает «✅ Верно!» или «❌ Неверно!» вместе со счётом и серией.
         • Показывает клавиатуру `_after_kb()`.
 
         Returns
@@ -203,38 +253,106 @@ async def handle_answer(update: Update,
             той же темы или вернуться в меню.
     """
     q = update.callback_query
+    q_id, chosen = context.args
+    question = QUESTIONS.get(q_id)
+    if question is None:
+        await q.answer(STALE_BUTTON)
+        return ASK
+    session = sessions.quiz.get(q.message.chat_id)
+    if session.answered == q_id:
+        await q.answer("Ответ на этот вопрос уже засчитан.")
+        return ASK
     await q.answer()
+    session.answered = q_id
 
-    chosen = int(q.data.split(":")[-1])
-    right  = context.user_data.get("right", -1)
-
-    msg = "✅ Верно!" if chosen == right else "❌ Неверно!"
-    topic_code = context.user_data["topic"]
-    await q.message.reply_text(msg, reply_markup=_after_kb(topic_code))
+    correct = chosen == question.right
+    msg = "✅ Верно!" if correct else "❌ Неверно!"
+    user = update.effective_user
+    try:
+        score = await quiz_stats.record_answer(
+            user.id, user.full_name, question.topic, correct,
+        )
+        msg += f"\n🏅 Счёт: {score.score} • серия: {score.streak}"
+    except Exception as exc:                        # noqa: BLE001
+        logger.exception("Quiz stats error: %s", exc)
+
+    await q.message.reply_text(msg, reply_markup=_after_kb(question.topic))
     return ASK
 
 
-async def next_or_finish(update: Update,
-                         context: ContextTypes.DEFAULT_TYPE) -> int:
+async def show_top(update: Update,
+                   context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+        Показать таблицу лидеров (`/top` или кнопка «🏆 Рейтинг»).
+
+        Читает готовые агрегаты `quiz_scores` и `quiz_topic_stats`,
+        поэтому не зависит от числа накопленных ответов. Под таблицей —
+        точность самого пользователя по темам. Состояние диалога
+        не меняет.
     """
-        Переключатель между «➕ Ещё вопрос» и «🔙 Главное меню».
+    if update.callback_query:
+        await update.callback_query.answer()
 
-        • Если callback-data начинается с `quiz_next:` —
-          запускаем `_ask_question` для той же темы.
-        • Иначе (`quiz_finish`) выходим из ConversationHandler
-          и показываем главное меню.
+    try:
+        leaders = await quiz_stats.leaderboard(10)
+        topics = await quiz_stats.topic_stats(update.effective_user.id)
+    except Exception as exc:                        # noqa: BLE001
+        logger.exception("Leaderboard error: %s", exc)
+        leaders, topics = None, {}
+
+    if leaders is None:
+        text = "⚠️ Рейтинг временно недоступен."
+    elif not leaders:
+        text = "🏆 Пока никто не отвечал. Будьте первым — /quiz"
+    else:
+        medals = ["🥇", "🥈", "🥉"]
+        lines = [
+            f"{medals[i] if i < 3 else f'{i + 1}.'} {row.name or 'Аноним'} — "
+            f"{row.score} очк. (ответов: {row.answered}, серия: {row.best_streak})"
+            for i, row in enumerate(leaders)
+        ]
+        text = "🏆 Таблица лидеров\n\n" + "\n".join(lines)
+    if topics:
+        mine = [
+            f"• {TOPICS.get(topic, topic)}: {correct}/{answered} "
+            f"({correct * 100 // answered}%)"
+            for topic, (answered, correct) in sorted(topics.items())
+            if answered
+        ]
+        text += "\n\n📊 Ваши темы\n" + "\n".join(mine)
+    await update.effective_message.reply_text(text)
+
+
+async def next_question(update: Update,
+                        context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+        Обработать «➕ Ещё вопрос»: новый вопрос темы, указанной
+        в кнопке (поэтому работает и под старыми карточками).
 
         Returns
         -------
         int
-            Либо **ASK** (новый вопрос), либо `ConversationHandler.END`.
+            Состояние **ASK**.
     """
     q = update.callback_query
     await q.answer()
+    idx, = context.args
+    if 0 <= idx < len(_TOPIC_CODES):
+        sessions.quiz.get(q.message.chat_id).topic = _TOPIC_CODES[idx]
+    return await _ask_question(q, context)
+
 
-    if q.data.startswith("quiz_next:"):
-        return await _ask_question(q, context)
+async def finish(update: Update,
+                 context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+        Обработать «🔙 Главное меню» (`quiz_finish`): выйти из
+        ConversationHandler и показать главное меню.
 
+        Returns
+        -------
+        int
+            `ConversationHandler.END`.
+    """
     from handlers.basic import show_main_menu
     await show_main_menu(update, context)
     return ConversationHandler.END
@@ -244,16 +362,19 @@ def build_quiz_handler() -> ConversationHandler:
     return ConversationHandler(
         entry_points=[
             CommandHandler("quiz", start_quiz_command),
-            CallbackQueryHandler(start_quiz_command, pattern=f"^{CB_QUIZ_RUN}$"),
+            CallbackRouter("quiz.entry").add(ui.CB_QUIZ_RUN, start_quiz_command).handler(),
         ],
         states={
-            TOPIC: [CallbackQueryHandler(choose_topic, pattern="^quiz_topic:")],
-            ASK: [
-                CallbackQueryHandler(handle_answer, pattern="^quiz_ans:"),
-                CallbackQueryHandler(next_or_finish,
-                                     pattern="^quiz_(next|finish)"),
-            ],
+            TOPIC: [CallbackRouter("quiz.topic")
+                    .add(ui.CB_QUIZ_TOPIC, choose_topic, packed=True, arity=1)
+                    .handler()],
+            ASK: [CallbackRouter("quiz.ask")
+                  .add(ui.CB_QUIZ_ANS, handle_answer, packed=True, arity=2)
+                  .add(ui.CB_QUIZ_NEXT, next_question, packed=True, arity=1)
+                  .add(ui.CB_QUIZ_TOP, show_top)
+                  .add(ui.CB_QUIZ_FINISH, finish).handler()],
         },
         fallbacks=[],
+        name="quiz",
         per_chat=True, per_user=False, per_message=False,
     )
@@ -16,7 +16,8 @@ handlers.random
 
 Для работы модуль использует:
 * `services.openai_client.get_random_fact` — асинхронную обёртку
-  над ChatGPT;
+  над ChatGPT (сначала факт берётся из буфера прогрева
+  `services.warmup`);
 * константу `CB_RANDOM_FACT` из `services.ui` — callback-id главной
   кнопки «Рандом-факт».
 """
@@ -30,12 +31,13 @@ from telegram import (
 from telegram.ext import (
     ContextTypes,
     CommandHandler,
-    CallbackQueryHandler,
 )
-from telegram.error import BadRequest
 
+from services import nav, validate, warmup
 from services.openai_client import get_random_fact
-from services.ui import CB_RANDOM_FACT
+from services.router import CallbackRouter
+from services.usage import QuotaExceeded
+from services.ui import CB_RANDOM_FACT, CB_RANDOM_MORE, CB_RANDOM_FINISH
 
 logger = logging.getLogger(__name__)
 IMAGE = "images/random.jpg"
@@ -47,35 +49,22 @@ def _kb() -> Mk:
 
         Кнопки
         -------
-        🧠 Ещё факт   → callback-data `random_more`
-        🔚 Закончить  → callback-data `random_finish`
+        🧠 Ещё факт   → callback-data `CB_RANDOM_MORE`
+        🔚 Закончить  → callback-data `CB_RANDOM_FINISH`
     """
     return Mk([
-        [Btn("🧠 Ещё факт",  callback_data="random_more")],
-        [Btn("🔚 Закончить", callback_data="random_finish")],
+        [Btn("🧠 Ещё факт",  callback_data=CB_RANDOM_MORE)],
+        [Btn("🔚 Закончить", callback_data=CB_RANDOM_FINISH)],
     ])
 
 
-async def _send_fact(target, fact: str):
-    """
-        Послать *новое* сообщение-карточку с фактом.
-
-        Parameters
-        ----------
-        target :
-            Объект, имеющий метод `.send_photo()` (обычно экземпляр
-            `telegram.Chat` или `telegram.Message`). Позволяет отправить
-            изображение с подписью.
-        fact : str
-            Текст факта (≤ 1024 символов) уже полученный от ChatGPT.
-    """
-    await target.send_photo(
-        IMAGE,
-        caption=fact[:1024],
-        reply_markup=_kb(),
-        parse_mode="Markdown",
-    )
-    logger.info("Факт отправлен")
+async def _fact(user_id: int) -> str:
+    """Факт от ChatGPT (с проверенной разметкой) или текст об исчерпанной квоте."""
+    try:
+        fact = warmup.take_fact(user_id) or await get_random_fact(user_id=user_id)
+    except QuotaExceeded as exc:
+        return str(exc)
+    return validate.markdown(fact, validate.CAPTION_LIMIT)
 
 
 async def random_fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -83,53 +72,43 @@ async def random_fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         Точка входа: команда `/random` **или** кнопка из главного меню.
 
         • Если вызов пришёл от callback-кнопки, сначала отвечаем на query
-          (`await .answer()`) и используем `update.effective_chat` для
-          отправки нового сообщения.
-        • В остальных случаях используем `update.effective_message`.
+          (`await .answer()`), и карточка меню заменяется карточкой
+          с фактом на месте (`services.nav`).
+        • Для команды `/random` присылается новое сообщение.
     """
     if update.callback_query:
         await update.callback_query.answer()
-        target_chat = update.effective_chat
-    else:
-        target_chat = update.effective_message
 
-    await _send_fact(target_chat, await get_random_fact())
+    fact = await _fact(update.effective_user.id)
+    await nav.show(update, IMAGE, fact, _kb(), parse_mode="Markdown")
+    logger.info("Факт отправлен")
 
 
 async def buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
         Универсальный обработчик двух callback-кнопок под фактом.
 
-        * `random_more`   → вытягивает новый факт из OpenAI и, по
-          возможности, **редактирует** подпись текущего сообщения
-          (`edit_message_caption`).
+        * `random_more`   → вытягивает новый факт из OpenAI и через
+          `services.nav` **редактирует** подпись текущего сообщения.
           Если Telegram не позволяет редактировать (часто из-за
-          превышения лимита 1-минуты), просто удаляем сообщение и
-          присылаем новое, чтобы интерфейс оставался чистым.
-        * `random_finish` → удаляет карточку с фактом и возвращает
-          пользователя в главное меню (`handlers.basic.show_main_menu`).
+          превышения лимита 1-минуты), сообщение удаляется и
+          присылается новое, чтобы интерфейс оставался чистым.
+        * `random_finish` → возвращает пользователя в главное меню
+          (`handlers.basic.show_main_menu` редактирует карточку на месте).
     """
     q = update.callback_query
-    await q.answer()
-
-    if q.data == "random_more":
-        fact = await get_random_fact()
-        try:
-            await q.edit_message_caption(fact, reply_markup=_kb(),
-                                         parse_mode="Markdown")
-        except BadRequest:
-            await q.message.delete()
-            await _send_fact(q.message, fact)
+    if q.data == CB_RANDOM_MORE:
+        await q.answer()
+        fact = await _fact(q.from_user.id)
+        await nav.show(update, IMAGE, fact, _kb(), parse_mode="Markdown")
         return
 
-    await q.message.delete()
     from handlers.basic import show_main_menu
     await show_main_menu(update, context)
 
 
-def register_handlers(app):
+def register_handlers(app, router: CallbackRouter):
     app.add_handler(CommandHandler("random", random_fact))
-    app.add_handler(CallbackQueryHandler(random_fact,
-                                         pattern=f"^{CB_RANDOM_FACT}$"))
-    app.add_handler(CallbackQueryHandler(buttons,
-                                         pattern="^random_(more|finish)$"))
+    router.add(CB_RANDOM_FACT, random_fact)
+    router.add(CB_RANDOM_MORE, buttons)
+    router.add(CB_RANDOM_FINISH, buttons)
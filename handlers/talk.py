@@ -11,9 +11,10 @@ handlers.talk
 
 1. Пользователь вызывает `/talk` **или** нажимает кнопку
    «🗣️ Диалог с личностью» в главном меню.
-2. Бот показывает список персон (`CHOOSE_PERSONA`).
-3. После выбора сохраняется имя персоны,
-   бот приглашает задать вопрос (`CHAT`).
+2. Бот показывает обложку `images/talk.jpg` со списком персон
+   (`CHOOSE_PERSONA`).
+3. После выбора сохраняется имя персоны, а подпись той же карточки
+   меняется на приглашение задать вопрос (`CHAT`).
 4. Все текстовые сообщения в состоянии `CHAT` переадресуются
    ChatGPT, который отвечает «от лица» выбранной личности.
 5. К каждому ответу прикреплены две кнопки:
@@ -40,16 +41,19 @@ from telegram.ext import (
     ConversationHandler,
     CommandHandler,
     MessageHandler,
-    CallbackQueryHandler,
     filters,
 )
-from services import ui
+from services import nav, sessions, ui
+from services.debounce import debouncer
+from services.router import CallbackRouter
+from services.usage import QuotaExceeded
 from services.openai_client import ask_chatgpt
 from handlers import basic
 
 logger = logging.getLogger(__name__)
 
 CHOOSE_PERSONA, CHAT = range(2)
+IMAGE = "images/talk.jpg"
 
 def _chat_kb() -> InlineKeyboardMarkup:
     """
@@ -87,12 +91,6 @@ async def _end_and_menu(update: Update,
         int
             `ConversationHandler.END` – сигнал о выходе из диалога.
     """
-    if update.callback_query:
-        await update.callback_query.answer()
-        try:
-            await update.callback_query.message.delete()
-        except Exception:        # noqa: BLE001
-            pass
     await basic.show_main_menu(update, context)
     return ConversationHandler.END
 
@@ -100,7 +98,8 @@ async def _end_and_menu(update: Update,
 async def start_talk(update: Update,
                      context: ContextTypes.DEFAULT_TYPE) -> int:
     """
-        Отобразить список доступных персон для выбора.
+        Отобразить обложку со списком доступных персон для выбора
+        (через `services.nav` — из меню карточка редактируется на месте).
 
         Переход в состояние
         -------------------
@@ -108,12 +107,9 @@ async def start_talk(update: Update,
     """
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.delete()
 
-    await update.effective_message.reply_text(
-        "Выберите собеседника:",
-        reply_markup=ui.get_persona_keyboard(),
-    )
+    await nav.show(update, IMAGE, "Выберите собеседника:",
+                   ui.get_persona_keyboard())
     return CHOOSE_PERSONA
 
 
@@ -122,8 +118,8 @@ async def choose_persona(update: Update,
     """
         Callback-хэндлер выбора конкретной личности.
 
-        1. Сохраняет выбранную персону в `context.user_data["persona"]`.
-        2. Заменяет предыдущее сообщение на приглашение к диалогу.
+        1. Сохраняет выбранную персону в сессии чата (`services.sessions.talk`).
+        2. Заменяет подпись карточки на приглашение к диалогу.
         3. Переводит ConversationHandler в состояние `CHAT`.
 
         Возврат
@@ -145,11 +141,10 @@ async def choose_persona(update: Update,
         # Нажали «Главное меню»
         return await _end_and_menu(update, context)
 
-    context.user_data["persona"] = persona
-    await query.message.edit_text(
-        f"Вы начали беседу с {persona}. Задайте вопрос!",
-        reply_markup=_chat_kb(),
-    )
+    sessions.talk.get(query.message.chat_id).persona = persona
+    await nav.show(update, IMAGE,
+                   f"Вы начали беседу с {persona}. Задайте вопрос!",
+                   _chat_kb())
     return CHAT
 
 async def talk_msg(update: Update,
@@ -157,56 +152,71 @@ async def talk_msg(update: Update,
     """
         Обработать текстовое сообщение пользователя в активной беседе.
 
-        1. Формирует *system prompt* для ChatGPT, указывая ему говорить
+        1. Передаёт текст в `services.debounce`, чтобы сообщения,
+           присланные подряд, ушли одним вопросом.
+        2. Формирует *system prompt* для ChatGPT, указывая ему говорить
            «от лица» выбранной личности и только по-русски.
-        2. Запрашивает ответ через `ask_chatgpt`.
-        3. Отправляет полученный ответ с клавиатурой `_chat_kb()`.
+        3. Запрашивает ответ через `ask_chatgpt`.
+        4. Отправляет полученный ответ с клавиатурой `_chat_kb()`.
 
         Возврат
         -------
         int
-            То же состояние `CHAT`, чтобы продолжить диалог.
+            То же состояние `CHAT`, чтобы продолжить диалог, либо
+            `CHOOSE_PERSONA`, если сессия чата истекла или вытеснена:
+            пользователь снова выбирает собеседника.
     """
-    persona = context.user_data.get("persona", "Собеседник")
-    prompt = (
-        f"Ты выступаешь в роли {persona}. "
-        "Отвечай дружелюбно и по-русски. "
-        f"Вопрос пользователя: «{update.message.text}»"
-    )
-
-    try:
-        answer = await ask_chatgpt(prompt)
-    except Exception as exc:
-        logger.exception("Persona error: %s", exc)
-        answer = "⚠️ Не удалось получить ответ. Попробуйте ещё раз."
-
-    await update.message.reply_text(answer, reply_markup=_chat_kb())
+    message = update.message
+    session = sessions.talk.peek(update.effective_chat.id)
+    if session is None or session.persona is None:
+        await nav.show(update, IMAGE, "Выберите собеседника:",
+                       ui.get_persona_keyboard())
+        return CHOOSE_PERSONA
+    persona = sessions.talk.get(update.effective_chat.id).persona
+
+    async def _answer(question: str) -> None:
+        prompt = (
+            f"Ты выступаешь в роли {persona}. "
+            "Отвечай дружелюбно и по-русски. "
+            f"Вопрос пользователя: «{question}»"
+        )
+        try:
+            answer = await ask_chatgpt(prompt, task="persona",
+                                       user_id=message.from_user.id)
+        except QuotaExceeded as exc:
+            answer = str(exc)
+        except Exception as exc:
+            logger.exception("Persona error: %s", exc)
+            answer = "⚠️ Не удалось получить ответ. Попробуйте ещё раз."
+        await message.reply_text(answer, reply_markup=_chat_kb())
+
+    debouncer.submit(update.effective_chat.id, "talk", message.text, _answer)
     return CHAT
 
 
 def build_talk_handler() -> ConversationHandler:
+    personas = (CallbackRouter("talk.persona")
+                .add(ui.CB_P_EINSTEIN, choose_persona)
+                .add(ui.CB_P_OPPENHEIMER, choose_persona)
+                .add(ui.CB_P_KURCHATOV, choose_persona)
+                .add(ui.CB_MAIN_MENU, _end_and_menu))
+    end = (CallbackRouter("talk.end")
+           .add(ui.CB_END_TALK, _end_and_menu)
+           .add(ui.CB_MAIN_MENU, _end_and_menu))
     return ConversationHandler(
         entry_points=[
             CommandHandler("talk", start_talk),
-            CallbackQueryHandler(start_talk, pattern=f"^{ui.CB_PERSONA_TALK}$"),
+            CallbackRouter("talk.entry").add(ui.CB_PERSONA_TALK, start_talk).handler(),
         ],
         states={
-            CHOOSE_PERSONA: [
-                CallbackQueryHandler(choose_persona, pattern=f"^{ui.CB_P_EINSTEIN}$"),
-                CallbackQueryHandler(choose_persona, pattern=f"^{ui.CB_P_OPPENHEIMER}$"),
-                CallbackQueryHandler(choose_persona, pattern=f"^{ui.CB_P_KURCHATOV}$"),
-                CallbackQueryHandler(_end_and_menu, pattern=f"^{ui.CB_MAIN_MENU}$"),
-            ],
+            CHOOSE_PERSONA: [personas.handler()],
             CHAT: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, talk_msg),
-                CallbackQueryHandler(_end_and_menu, pattern=f"^{ui.CB_END_TALK}$"),
-                CallbackQueryHandler(_end_and_menu, pattern=f"^{ui.CB_MAIN_MENU}$"),
+                end.handler(),
             ],
         },
-        fallbacks=[CallbackQueryHandler(
-            _end_and_menu,
-            pattern=f"^({ui.CB_END_TALK}|{ui.CB_MAIN_MENU})$"
-        )],
+        fallbacks=[end.handler()],
+        name="talk",
         per_chat=True,
         per_user=False,
     )
@@ -4,16 +4,20 @@ handlers.translator
 
 Модуль «🌐 Переводчик».
 
-Позволяет пользователю выбрать целевой язык (английский, испанский,
-китайский) и отправить текст на перевод. Ответ формируется ChatGPT-м.
+Позволяет пользователю выбрать один или несколько целевых языков
+(английский, испанский, китайский) и отправить текст на перевод.
+Ответ формируется ChatGPT-м.
 
 Сценарий работы
 ---------------
 1. `/translator` или кнопка «Переводчик» в главном меню.
 2. Бот показывает картинку `images/translator.jpg` и клавиатуру
-   с вариантами языков (`CHOOSE_LANG`).
-3. После выбора языка бот приглашает ввести текст (`TRANSLATE`).
-4. Каждое последующее сообщение переводится на выбранный язык.
+   с вариантами языков (`CHOOSE_LANG`); каждое нажатие отмечает
+   или снимает язык (✅), «Готово» подтверждает выбор.
+3. После выбора языков бот приглашает ввести текст (`TRANSLATE`).
+4. Каждое последующее сообщение переводится сразу на все выбранные
+   языки (`services.openai_client.translate_many`: один проход,
+   кэш по языкам) и приходит одним ответом.
 5. Внизу ответа – две кнопки:
    • «🌐 Сменить язык»  – возвращает к выбору языка.
    • «🔙 Главное меню»  – завершает модуль и открывает меню.
@@ -24,10 +28,13 @@ import logging
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler,
-    CallbackQueryHandler, MessageHandler, filters,
+    MessageHandler, filters,
 )
-from services import ui
-from services.openai_client import ask_chatgpt
+from services import nav, sessions, ui
+from services.debounce import debouncer
+from services.router import CallbackRouter
+from services.usage import QuotaExceeded
+from services.openai_client import translate_many
 from handlers import basic
 
 logger = logging.getLogger(__name__)
@@ -37,26 +44,35 @@ IMAGE = "images/translator.jpg"
 CHOOSE_LANG, TRANSLATE = range(2)
 
 LANG_MAP = {
-    "lang_en": ("английский", "English"),
-    "lang_es": ("испанский",  "Spanish"),
-    "lang_zh": ("китайский",  "Chinese"),
+    ui.CB_LANG_EN: ("английский", "English"),
+    ui.CB_LANG_ES: ("испанский",  "Spanish"),
+    ui.CB_LANG_ZH: ("китайский",  "Chinese"),
 }
 
 
-def _lang_kb() -> InlineKeyboardMarkup:
+def _lang_kb(selected: tuple[str, ...]) -> InlineKeyboardMarkup:
     """
-        Построить клавиатуру для выбора языка перевода.
+        Построить клавиатуру для выбора языков перевода.
+
+        Parameters
+        ----------
+        selected : tuple[str, ...]
+            Уже отмеченные коды языков — помечаются «✅».
 
         Returns
         -------
         telegram.InlineKeyboardMarkup
-            * N строк – по кнопке на каждый язык (`LANG_MAP`)
+            * N строк – по кнопке-переключателю на каждый язык (`LANG_MAP`)
+            * «✅ Готово» – если выбран хотя бы один язык
             * Последняя строка – «🔙 Главное меню»
     """
     rows = [
-        [InlineKeyboardButton(name.capitalize(), callback_data=code)]
+        [InlineKeyboardButton(("✅ " if code in selected else "") + name.capitalize(),
+                              callback_data=code)]
         for code, (name, _) in LANG_MAP.items()
     ]
+    if selected:
+        rows.append([InlineKeyboardButton("✅ Готово", callback_data=ui.CB_LANG_DONE)])
     rows.append([InlineKeyboardButton("🔙 Главное меню",
                                       callback_data=ui.CB_MAIN_MENU)])
     return InlineKeyboardMarkup(rows)
@@ -67,11 +83,11 @@ def _after_kb() -> InlineKeyboardMarkup:
         Клавиатура, прикрепляемая к каждому переведённому сообщению.
 
         Содержит две кнопки:
-        1. «🌐 Сменить язык»  – callback `translator_change`
+        1. «🌐 Сменить язык»  – callback `ui.CB_TRANSLATOR_CHANGE`
         2. «🔙 Главное меню» – callback `ui.CB_MAIN_MENU`
     """
     return InlineKeyboardMarkup([[
-        InlineKeyboardButton("🌐 Сменить язык", callback_data="translator_change"),
+        InlineKeyboardButton("🌐 Сменить язык", callback_data=ui.CB_TRANSLATOR_CHANGE),
         InlineKeyboardButton("🔙 Главное меню", callback_data=ui.CB_MAIN_MENU),
     ]])
 
@@ -103,12 +119,11 @@ async def start(update: Update,
     """
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.message.delete()
 
-    await update.effective_message.reply_photo(
-        IMAGE,
-        caption="🌐 Выберите язык, на который нужно перевести:",
-        reply_markup=_lang_kb(),
+    await nav.show(
+        update, IMAGE,
+        "🌐 Выберите языки, на которые нужно перевести:",
+        _lang_kb(sessions.translator.get(update.effective_chat.id).lang_codes),
     )
     return CHOOSE_LANG
 
@@ -116,28 +131,52 @@ async def start(update: Update,
 async def choose_lang(update: Update,
                       context: ContextTypes.DEFAULT_TYPE) -> int:
     """
-        Callback-хэндлер выбора языка.
+        Callback-хэндлер кнопки языка: отметить или снять язык.
 
-        Сохраняет выбранный callback-id в `context.user_data["lang_code"]`
-        и приглашает отправить текст для перевода.
+        Список выбранных кодов хранится в сессии чата
+        (`TranslatorSession.lang_codes`) в порядке нажатия; клавиатура перерисовывается на месте.
 
         Возврат
         -------
         int
-            Состояние `TRANSLATE` (готов к приёму текста) либо
-            `ConversationHandler.END`, если нажато «Главное меню».
+            Состояние `CHOOSE_LANG` — ждём «Готово».
     """
     query = update.callback_query
     await query.answer()
 
-    if query.data == ui.CB_MAIN_MENU:
-        return await _end(update, context)
+    session = sessions.translator.get(query.message.chat_id)
+    selected = session.lang_codes
+    if query.data in selected:
+        session.lang_codes = tuple(c for c in selected if c != query.data)
+    else:
+        session.lang_codes = selected + (query.data,)
+
+    await query.edit_message_reply_markup(reply_markup=_lang_kb(session.lang_codes))
+    return CHOOSE_LANG
 
-    context.user_data["lang_code"] = query.data
-    lang_ru, _ = LANG_MAP[query.data]
 
+async def langs_done(update: Update,
+                     context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+        Callback-хэндлер «✅ Готово»: подтвердить выбранные языки
+        и пригласить отправить текст для перевода.
+
+        Возврат
+        -------
+        int
+            Состояние `TRANSLATE` (готов к приёму текста) либо
+            `CHOOSE_LANG`, если не выбрано ни одного языка.
+    """
+    query = update.callback_query
+    selected = sessions.translator.get(query.message.chat_id).lang_codes
+    if not selected:
+        await query.answer("Отметьте хотя бы один язык.")
+        return CHOOSE_LANG
+    await query.answer()
+
+    names = ", ".join(LANG_MAP[code][0] for code in selected)
     await query.edit_message_caption(
-        f"✏️ Отправьте текст, который нужно перевести на *{lang_ru}*.",
+        f"✏️ Отправьте текст, который нужно перевести на *{names}*.",
         parse_mode="Markdown",
         reply_markup=_after_kb(),
     )
@@ -150,13 +189,14 @@ async def do_translate(update: Update,
         Обработать либо перевод текста, либо нажатие вспомогательных кнопок.
 
         • Если пришёл `CallbackQuery`:
-            - `translator_change` → снова показ выбора языка (`start`)
+            - `ui.CB_TRANSLATOR_CHANGE` → снова показ выбора языка (`start`)
             - `ui.CB_MAIN_MENU`  → выход из модуля (`_end`)
         • Если пришло обычное текстовое сообщение:
-            1. Берёт сохранённый язык из `context.user_data`.
-            2. Составляет prompt и отправляет его в ChatGPT через
-               `ask_chatgpt`.
-            3. Отправляет результат + `_after_kb()`.
+            1. Берёт сохранённые языки из сессии чата (`services.sessions`).
+            2. Передаёт текст в `services.debounce`: текст, разрезанный
+               Telegram на несколько сообщений, переводится целиком.
+            3. Переводит текст на все языки разом (`translate_many`).
+            4. Отправляет все переводы одним сообщением + `_after_kb()`.
 
         Returns
         -------
@@ -169,52 +209,66 @@ async def do_translate(update: Update,
         cb = update.callback_query
         await cb.answer()
 
-        if cb.data == "translator_change":
+        if cb.data == ui.CB_TRANSLATOR_CHANGE:
             return await start(update, context)
         return await _end(update, context)
 
-    lang_code = context.user_data.get("lang_code")
-    if not lang_code:                           # вдруг обошли логику
+    lang_codes = sessions.translator.get(update.effective_chat.id).lang_codes
+    if not lang_codes:                          # вдруг обошли логику
         return await start(update, context)
 
-    lang_ru, lang_en = LANG_MAP[lang_code]
-    prompt = (
-        f"Переведи следующий текст на {lang_ru} без добавления пояснений.\n\n"
-        f"Текст: «{update.message.text}»"
-    )
-
-    try:
-        translation = await ask_chatgpt(prompt, temperature=0.3)
-    except Exception as exc:
-        logger.exception("Translator error: %s", exc)
-        translation = "⚠️ Не удалось перевести, попробуйте ещё."
-
-    await update.message.reply_text(translation, reply_markup=_after_kb())
+    targets = {code: LANG_MAP[code][0] for code in lang_codes}
+    message = update.message
+
+    async def _answer(text: str) -> None:
+        try:
+            results = await translate_many(text, targets,
+                                           user_id=message.from_user.id)
+        except QuotaExceeded as exc:
+            translation = str(exc)
+        except Exception as exc:
+            logger.exception("Translator error: %s", exc)
+            translation = "⚠️ Не удалось перевести, попробуйте ещё."
+        else:
+            if len(results) == 1:
+                translation = next(iter(results.values()))
+            else:
+                translation = "\n\n".join(
+                    f"🌐 {LANG_MAP[code][0].capitalize()}:\n{result}"
+                    for code, result in results.items()
+                )
+            translation = translation[:4096]
+        await message.reply_text(translation, reply_markup=_after_kb())
+
+    debouncer.submit(update.effective_chat.id, "translator", message.text, _answer)
     return TRANSLATE
 
 
 def build_translator_handler() -> ConversationHandler:
     """ConversationHandler, который нужно добавить в Application."""
+    langs = (CallbackRouter("translator.lang")
+             .add(ui.CB_LANG_DONE, langs_done)
+             .add(ui.CB_MAIN_MENU, _end))
+    for code in LANG_MAP:
+        langs.add(code, choose_lang)
+    buttons = (CallbackRouter("translator.after")
+               .add(ui.CB_TRANSLATOR_CHANGE, do_translate)
+               .add(ui.CB_MAIN_MENU, do_translate))
     return ConversationHandler(
         entry_points=[
             CommandHandler("translator", start),
-            CallbackQueryHandler(start, pattern=f"^{ui.CB_TRANSLATOR}$"),
+            CallbackRouter("translator.entry").add(ui.CB_TRANSLATOR, start).handler(),
         ],
         states={
-            CHOOSE_LANG: [
-                CallbackQueryHandler(choose_lang,
-                                     pattern="^(lang_en|lang_es|lang_zh)$"),
-                CallbackQueryHandler(_end, pattern=f"^{ui.CB_MAIN_MENU}$"),
-            ],
+            CHOOSE_LANG: [langs.handler()],
             TRANSLATE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, do_translate),
-                CallbackQueryHandler(do_translate,
-                                     pattern="^(translator_change|" +
-                                             f"{ui.CB_MAIN_MENU})$"),
+                buttons.handler(),
             ],
         },
-        fallbacks=[CallbackQueryHandler(_end,
-                                       pattern=f"^{ui.CB_MAIN_MENU}$")],
+        fallbacks=[CallbackRouter("translator.fallback")
+                   .add(ui.CB_MAIN_MENU, _end).handler()],
+        name="translator",
         per_chat=True,
         per_user=False,
     )
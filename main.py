@@ -14,19 +14,29 @@ main.py — точка входа Telegram-бота «neural_tg_bot».
     • При вызове как «python main.py» выполняется блок
       `if __name__ == "__main__":`, который логирует старт и
       запускает polling-цикл через Application.run_polling().
+    • «python main.py --workers N [--webhook]» — кластерный режим:
+      супервизор, фронт и N воркеров (`services.cluster`).
 """
 
+import argparse
+import asyncio
 import logging
 from pathlib import Path
 from os import getenv
+from typing import Optional
 
 from dotenv import load_dotenv
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
 )
-from handlers import basic, random, gpt, talk, quiz, cook, translator
+from telegram.request import BaseRequest
+from handlers import admin, basic, random, gpt, talk, quiz, cook, translator
+from services import (
+    cluster, images, lifecycle, loopmon, profiler, recorder, runtime, sessions,
+    store, sweeper, usage, warmup,
+)
+from services.router import CallbackRouter, assert_unique
 from services.ui import CB_MAIN_MENU
 
 load_dotenv()
@@ -48,36 +58,113 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def build_app() -> Application:
+async def _post_init(app: Application) -> None:
+    """Загружает обложки, расход OpenAI, сессии и индекс сохранённых ответов,
+    запускает очистку диалогов, прогрев и монитор задержки event loop."""
+    loopmon.start()
+    await images.load()
+    await usage.load()
+    await sessions.load()
+    await store.load()
+    sweeper.start(app)
+    warmup.start(quiz.TOPICS)
+
+
+async def _post_stop(app: Application) -> None:
+    """Дожидается фоновых генераций, пока `Bot` ещё может отвечать."""
+    await lifecycle.drain()
+
+
+async def _post_shutdown(app: Application) -> None:
+    """Сбрасывает учёт, сессии, журнал апдейтов и метрики, закрывает SQLite."""
+    await lifecycle.flush()
+
+
+def build_app(request: Optional[BaseRequest] = None) -> Application:
     """Собирает и возвращает готовый объект `Application`.
 
+        `request` подменяет HTTP-транспорт Bot API (например,
+        заглушкой `services.replay.StubRequest` в нагрузочных прогонах);
+        по умолчанию — `services.profiler.TimedRequest`, который
+        замеряет методы Bot API только во время `/profile`, а для
+        `getUpdates` — `services.runtime.JSONRequest`; оба разбирают
+        ответы через orjson при `FAST_RUNTIME=1`.
+
         Шаги:
-            1. Создаёт экземпляр `Application` с токеном из .env.
+            1. Создаёт экземпляр `Application` с токеном из .env,
+               хуком `post_init` (обложки `services.images`, счётчики
+               `services.usage`, сессии `services.sessions`,
+               индекс ответов `services.store`, фоновый прогрев
+               `services.warmup`) и хуками
+               остановки `services.lifecycle`:
+               `post_stop` дожидается фоновых генераций, `post_shutdown`
+               сбрасывает учёт, сессии и журналы.
             2. Регистрирует:
-               – /start-команду (`basic.show_main_menu`);
+               – запись апдейтов в журнал, если задан `UPDATE_LOG`
+                 (`services.recorder`, группа -1);
+               – /start-команду (`basic.show_main_menu`)
+                 и /top (`quiz.show_top`);
+               – /profile для `ADMIN_IDS` (`admin.profile`);
                – модульные обработчики «random», «cook»;
                – Conversation-обработчики GPT, Talk, Quiz, Translator;
-               – CallbackQuery-обработчик «Главное меню».
-            3. Отдаёт настроенный объект без запуска polling-цикла.
+               – корневой `CallbackRouter` (кнопки random/cook
+                 и «Главное меню») — последним, после диалогов;
+               – завершение диалогов по простою (`services.sweeper`,
+                 группа -2).
+            3. Проверяет, что никакой callback не заявлен дважды
+               (`services.router.assert_unique`).
+            4. Отдаёт настроенный объект без запуска polling-цикла.
     """
-    app = Application.builder().token(TOKEN).build()
+    builder = (Application.builder().token(TOKEN)
+               .post_init(_post_init)
+               .post_stop(_post_stop)
+               .post_shutdown(_post_shutdown))
+    if request is None:
+        builder = (builder.request(profiler.TimedRequest(connection_pool_size=256))
+                   .get_updates_request(runtime.JSONRequest(connection_pool_size=1)))
+    else:
+        builder = builder.request(request)
+    app = builder.build()
+    recorder.register(app)
+    lifecycle.on_shutdown("usage", usage.flush)
+    lifecycle.on_shutdown("sessions", sessions.save)
+    lifecycle.on_shutdown("store", store.stop)
+    lifecycle.on_shutdown("recorder", recorder.flush)
+    lifecycle.on_shutdown("sweeper", sweeper.stop)
+    lifecycle.on_shutdown("warmup", warmup.stop)
+    lifecycle.on_shutdown("loopmon", loopmon.stop)
+    root = CallbackRouter("root")
 
     app.add_handler(CommandHandler("start", basic.show_main_menu))
+    app.add_handler(CommandHandler("top", quiz.show_top))
+    admin.register_handlers(app)
 
-    random.register_handlers(app)
-    cook.register_handlers(app)
+    random.register_handlers(app, root)
+    cook.register_handlers(app, root)
     app.add_handler(gpt.build_gpt_handler())
     app.add_handler(translator.build_translator_handler())
     app.add_handler(talk.build_talk_handler())
     app.add_handler(quiz.build_quiz_handler())
 
-    app.add_handler(
-        CallbackQueryHandler(basic.show_main_menu, pattern=f"^{CB_MAIN_MENU}$")
-    )
+    root.add(CB_MAIN_MENU, basic.show_main_menu)
+    app.add_handler(root.handler())
+    sweeper.register(app)
 
+    assert_unique(app.handlers[0])
     return app
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telegram-бот")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="число процессов-воркеров (services.cluster)")
+    parser.add_argument("--webhook", action="store_true",
+                        help="принимать апдейты вебхуком (только с services.cluster)")
+    args = parser.parse_args()
+
     logger.info("Бот запускается…")
-    build_app().run_polling(allowed_updates=["message", "callback_query"])
+    runtime.install()
+    if args.workers > 1 or args.webhook:
+        asyncio.run(cluster.supervise(max(args.workers, 1), webhook=args.webhook))
+    else:
+        build_app().run_polling(allowed_updates=cluster.ALLOWED_UPDATES)
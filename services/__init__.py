@@ -1,4 +1,29 @@
 """Пакет содержит файлы:
     - openai_client.py (функции для работы с chatgpt)
+    - gate.py (адаптивный лимит одновременных запросов к OpenAI, полосы приоритета)
+    - model_router.py (профили моделей по задачам и маршрутизация по задержке)
+    - cluster.py (многопроцессный режим: фронт и воркеры по шардам chat_id)
+    - runtime.py (необязательный быстрый рантайм: uvloop и orjson, бенчмарк)
+    - loopmon.py (постоянный монитор задержки event loop и стеки блокировок)
+    - profiler.py (профиль по запросу: задержка цикла, CPU, обработчики, OpenAI, Bot API)
+    - metrics.py (счётчики, gauge-и и гистограммы в памяти процесса)
+    - debounce.py (склейка сообщений, присланных подряд, в один запрос)
+    - validate.py (локальная проверка и починка Markdown, JSON квиза и меню)
+    - tasks.py (реестр фоновых генераций по чатам и их отмена)
+    - lifecycle.py (плавная остановка: дождаться генераций, сбросить данные)
     - ui.py (общие клавиатуры)
+    - images.py (обложки режимов: загрузка в память, пережатие, file_id)
+    - nav.py (переходы между экранами редактированием карточки на месте)
+    - router.py (диспетчер callback-запросов по префиксу)
+    - store.py (дисковое хранилище ответов OpenAI: ключ по содержимому, TTL, уплотнение)
+    - warmup.py (прогрев фактов, вопросов квиза и меню при старте и ночью)
+    - sessions.py (сессии режимов по чатам: __slots__, LRU с TTL, сохранение)
+    - sweeper.py (завершение брошенных диалогов по простою, куча сроков)
+    - codec.py (компактная упаковка callback_data и хранилище состояний кнопок)
+    - db.py (общее SQLite-подключение в отдельном потоке)
+    - quiz_stats.py (очки, серии и таблица лидеров квиза)
+    - quiz_bank.py (локальный банк вопросов и гибридная выдача)
+    - usage.py (учёт токенов по пользователям и задачам, квоты и лимит частоты)
+    - recorder.py (обезличенный журнал входящих апдейтов, gzip-JSONL)
+    - replay.py (нагрузочный прогон по журналу с заглушками Telegram/OpenAI)
 """
\ No newline at end of file
@@ -0,0 +1,483 @@
+"""
+services.cluster
+================
+
+Многопроцессный режим: супервизор, фронт и N воркеров,
+шардированных по `chat_id`.
+
+Один процесс бота упирается в одно ядро: разбор JSON Telegram,
+сборка клавиатур, логирование. В этом режиме
+
+    python main.py --workers 4              # фронт забирает getUpdates
+    python main.py --workers 4 --webhook    # фронт принимает вебхук
+
+процесс `main.py` становится **супервизором**: запускает N воркеров
+(`python -m services.cluster worker ...`), перезапускает упавших
+и сам работает **фронтом** — получает апдейты и раздаёт их воркерам.
+
+* **Шардирование.** Апдейт уходит воркеру `shard_of(chat_id, N)`
+  (crc32 от id чата), поэтому все апдейты одного чата обрабатывает
+  один и тот же процесс: состояния `ConversationHandler`, сессии
+  (`services.sessions`), фоновые задачи и дребезг сообщений остаются
+  локальными и работают без изменений. Каждый воркер — обычное
+  `main.build_app()`, которое обрабатывает свои апдейты по одному,
+  как PTB по умолчанию.
+* **IPC.** Воркер слушает Unix-сокет; фронт шлёт в него сырой JSON
+  апдейта кадрами `<длина: 4 байта big-endian><JSON>` — без разбора
+  в объекты PTB на стороне фронта.
+* **Обратное давление.** У каждого воркера во фронте очередь на
+  `CLUSTER_QUEUE` апдейтов (по умолчанию 1000). Воркер читает
+  следующий кадр, только обработав предыдущий; когда сокет и очередь
+  заполнены, фронт перестаёт забирать `getUpdates` (или не отвечает
+  вебхуку, пока апдейт не встанет в очередь) — Telegram придерживает
+  апдейты у себя, память фронта не растёт.
+* **Вебхук** (`--webhook`): минимальный HTTP/1.1-сервер на
+  `WEBHOOK_LISTEN` (по умолчанию `127.0.0.1:8080`) за обратным
+  прокси с TLS; адрес для Telegram — `WEBHOOK_URL`, секрет —
+  `WEBHOOK_SECRET` (проверяется заголовок
+  `X-Telegram-Bot-Api-Secret-Token`). Путь и секрет проверяются
+  до чтения тела; неверный `Content-Length` получает 400, тело больше
+  `WEBHOOK_MAX_BODY` (1 МиБ) — 413, тело, не являющееся JSON-объектом,
+  — 400. После отказа до чтения тела соединение закрывается.
+* **Ошибки `getUpdates`** (`ok: false`, сеть): пауза
+  `parameters.retry_after` из ответа, иначе экспоненциальная
+  от 1 до 30 секунд — фронт не долбит Bot API повторами.
+* **Остановка** (SIGTERM/SIGINT супервизору): фронт перестаёт брать
+  апдейты, досылает очереди и закрывает сокеты; воркер, получив
+  конец потока, останавливает приложение штатно (`services.lifecycle`:
+  дождаться генераций, сбросить учёт).
+
+Общие ресурсы: SQLite-база одна на всех (WAL допускает несколько
+процессов); журнал апдейтов `UPDATE_LOG` каждый воркер пишет в свой
+файл (`updates.w0.jsonl.gz`, …); квоты `services.usage` и `/profile`
+действуют в пределах воркера.
+
+Замер на одной машине:
+
+    python -m services.cluster bench --workers 1,2,4 --updates 20000
+
+прогоняет синтетические апдейты (`services.replay.synthetic_updates`)
+через фронт и воркеры с заглушками Telegram/OpenAI
+(`services.replay`) и печатает пропускную способность и CPU.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from services import metrics, runtime
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.getenv("CLUSTER_QUEUE", "1000"))
+POLL_BACKOFF_MAX = 30.0
+WEBHOOK_MAX_BODY = 1 << 20
+ALLOWED_UPDATES = ["message", "callback_query"]
+_HEADER = struct.Struct(">I")
+
+_shard = os.getenv("CLUSTER_SHARD", "")          # "i/N" в процессе воркера
+_index, _count = (int(x) for x in _shard.split("/")) if _shard else (0, 1)
+
+
+def shard_of(chat_id: int, count: int) -> int:
+    """Номер воркера для чата."""
+    return zlib.crc32(chat_id.to_bytes(8, "big", signed=True)) % count
+
+
+def owns(chat_id: int) -> bool:
+    """Принадлежит ли чат этому процессу (вне кластера — всегда)."""
+    return _count <= 1 or shard_of(chat_id, _count) == _index
+
+
+def leader() -> bool:
+    """Первый воркер кластера (вне кластера — всегда): общая фоновая работа."""
+    return _index == 0
+
+
+def route_key(update: Dict[str, Any]) -> int:
+    """`chat_id` апдейта (для callback без сообщения — id пользователя)."""
+    query = update.get("callback_query") or {}
+    message = update.get("message") or update.get("edited_message") or query.get("message")
+    if message:
+        return message["chat"]["id"]
+    return (query.get("from") or {}).get("id", 0)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Прочитать кадр; `None` — собеседник закрыл соединение."""
+    try:
+        size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+# ───────────────────────────── воркер ─────────────────────────────
+
+async def run_worker(socket_path: str, stub: Optional[List[float]] = None) -> None:
+    """Обслуживать апдейты из сокета `socket_path` до конца потока.
+
+    `stub` — `[telegram_ms, openai_ms]` заглушек `services.replay`
+    для замеров без сети.
+    """
+    import main
+    from telegram import Update
+    from services import openai_client, replay, usage
+
+    request = None
+    if stub is not None:
+        request = replay.StubRequest(stub[0] / 1000)
+        openai_client.client = replay.StubOpenAI(stub[1] / 1000)
+        usage.QUOTAS.clear()
+    app = main.build_app(request=request)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+    done = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, done.set)
+    loop.add_signal_handler(signal.SIGINT, lambda: None)   # останавливает супервизор
+    processed = 0
+
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonlocal processed
+        while (frame := await read_frame(reader)) is not None:
+            try:
+                await app.process_update(Update.de_json(runtime.loads(frame), app.bot))
+            except Exception as exc:                  # noqa: BLE001
+                logger.exception("Update failed in worker %d: %s", _index, exc)
+            processed += 1
+        writer.close()
+        done.set()
+
+    Path(socket_path).unlink(missing_ok=True)
+    server = await asyncio.start_unix_server(serve, path=socket_path)
+    logger.info("Worker %d/%d listening on %s", _index, _count, socket_path)
+    await done.wait()
+    server.close()
+
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    print(f"worker {_index}: processed={processed} cpu={time.process_time():.3f}", flush=True)
+
+
+# ───────────────────────────── фронт ─────────────────────────────
+
+class Dispatcher:
+    """Раздача сырых апдейтов воркерам по шардам с ограниченными очередями."""
+
+    def __init__(self, sockets: List[str]) -> None:
+        self.sockets = sockets
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(QUEUE_SIZE) for _ in sockets]
+        self._senders: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._senders = [asyncio.create_task(self._send(i), name=f"cluster-send-{i}")
+                         for i in range(len(self.sockets))]
+
+    async def submit(self, raw: bytes, chat_id: int) -> None:
+        """Поставить апдейт в очередь его воркера (ждёт, если очередь полна)."""
+        queue = self.queues[shard_of(chat_id, len(self.queues))]
+        if queue.full():
+            metrics.inc("cluster.backpressure")
+        await queue.put(raw)
+
+    async def _connect(self, index: int) -> asyncio.StreamWriter:
+        delay = 0.05
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.sockets[index])
+                return writer
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+    async def _send(self, index: int) -> None:
+        queue = self.queues[index]
+        writer = await self._connect(index)
+        while (raw := await queue.get()) is not None:
+            while True:
+                try:
+                    writer.write(_HEADER.pack(len(raw)) + raw)
+                    await writer.drain()
+                    break
+                except ConnectionError as exc:
+                    logger.warning("Worker %d connection lost (%s), reconnecting", index, exc)
+                    writer = await self._connect(index)
+            metrics.inc("cluster.dispatched", worker=index)
+        writer.close()
+
+    async def close(self) -> None:
+        """Дослать очереди и закрыть сокеты (воркеры увидят конец потока)."""
+        for queue in self.queues:
+            await queue.put(None)
+        await asyncio.gather(*self._senders, return_exceptions=True)
+
+
+async def poll(dispatcher: Dispatcher, token: str, stop: asyncio.Event) -> None:
+    """Фронт на long polling: `getUpdates` без разбора в объекты PTB."""
+    url = f"https://api.telegram.org/bot{token}/"
+    offset = 0
+    backoff = 0.0
+    async with httpx.AsyncClient(timeout=40) as http:
+        await http.post(url + "deleteWebhook")
+        stopped = asyncio.create_task(stop.wait())
+        while not stop.is_set():
+            fetch = asyncio.create_task(http.post(url + "getUpdates", json={
+                "offset": offset, "timeout": 25, "allowed_updates": ALLOWED_UPDATES,
+            }))
+            await asyncio.wait({fetch, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not fetch.done():                     # остановка посреди long poll
+                fetch.cancel()
+                break
+            try:
+                payload = runtime.loads(fetch.result().content)
+            except (httpx.HTTPError, ValueError) as exc:
+                logger.warning("getUpdates failed: %s", exc)
+                payload = {}
+            if not isinstance(payload, dict):
+                payload = {}
+            if not payload.get("ok"):
+                if payload:
+                    logger.warning("getUpdates error %s: %s", payload.get("error_code"),
+                                   payload.get("description"))
+                backoff = min(max(backoff * 2, 1.0), POLL_BACKOFF_MAX)
+                delay = (payload.get("parameters") or {}).get("retry_after") or backoff
+                try:                                 # пауза, прерываемая остановкой
+                    await asyncio.wait_for(stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            backoff = 0.0
+            for update in payload.get("result") or []:
+                await dispatcher.submit(runtime.dumps(update).encode(), route_key(update))
+                offset = update["update_id"] + 1
+        if offset:                                   # подтвердить выданные апдейты
+            await http.post(url + "getUpdates", json={"offset": offset, "timeout": 0})
+
+
+async def serve_webhook(dispatcher: Dispatcher, token: str, stop: asyncio.Event) -> None:
+    """Фронт-вебхук: минимальный HTTP/1.1 с keep-alive."""
+    host, _, port = os.getenv("WEBHOOK_LISTEN", "127.0.0.1:8080").rpartition(":")
+    path = os.getenv("WEBHOOK_PATH", "/telegram")
+    secret = os.getenv("WEBHOOK_SECRET", "")
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while (line := await reader.readline()):
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                status = None
+                if method != "POST" or target != path:
+                    status = "404 Not Found"
+                elif secret and headers.get("x-telegram-bot-api-secret-token") != secret:
+                    status = "403 Forbidden"
+                else:
+                    try:
+                        length = int(headers.get("content-length", 0))
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        status = "400 Bad Request"
+                    elif length > WEBHOOK_MAX_BODY:
+                        status = "413 Payload Too Large"
+                if status is not None:
+                    # Тело не прочитано — соединение дальше не разобрать.
+                    writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n"
+                                 f"Connection: close\r\n\r\n".encode())
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length)
+                status = "200 OK"
+                try:
+                    update = runtime.loads(body)
+                except ValueError:
+                    update = None
+                if isinstance(update, dict):
+                    await dispatcher.submit(body, route_key(update))
+                else:
+                    status = "400 Bad Request"
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError) as exc:
+            logger.debug("Webhook connection dropped: %s", exc)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host or "127.0.0.1", int(port))
+    webhook_url = os.getenv("WEBHOOK_URL", "")
+    if webhook_url:
+        async with httpx.AsyncClient(timeout=20) as http:
+            await http.post(f"https://api.telegram.org/bot{token}/setWebhook", json={
+                "url": webhook_url, "secret_token": secret or None,
+                "allowed_updates": ALLOWED_UPDATES, "max_connections": 40,
+            })
+    logger.info("Webhook front listening on %s:%s%s", host, port, path)
+    await stop.wait()
+    server.close()
+    await server.wait_closed()
+
+
+# ───────────────────────────── супервизор ─────────────────────────────
+
+class Supervisor:
+    """Запуск и перезапуск воркеров."""
+
+    def __init__(self, count: int, worker_args: List[str] = (),
+                 env: Optional[Dict[str, str]] = None) -> None:
+        self.count = count
+        self.dir = Path(tempfile.mkdtemp(prefix="bot-cluster-"))
+        self.sockets = [str(self.dir / f"worker-{i}.sock") for i in range(count)]
+        self.worker_args = list(worker_args)
+        self.env = env or {}
+        self.procs: List[Optional[asyncio.subprocess.Process]] = [None] * count
+        self.output: List[str] = []
+        self.stopping = False
+        self._watchers: List[asyncio.Task] = []
+
+    def _worker_env(self, index: int) -> Dict[str, str]:
+        env = dict(os.environ, **self.env, CLUSTER_SHARD=f"{index}/{self.count}")
+        log = env.get("UPDATE_LOG")
+        if log:
+            path = Path(log)
+            stem, _, suffix = path.name.partition(".")
+            env["UPDATE_LOG"] = str(path.with_name(f"{stem}.w{index}.{suffix}"))
+        return env
+
+    async def _watch(self, index: int) -> None:
+        root = Path(__file__).resolve().parent.parent
+        while True:
+            proc = self.procs[index] = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "services.cluster", "worker",
+                "--socket", self.sockets[index], *self.worker_args,
+                env=self._worker_env(index), cwd=root, stdout=asyncio.subprocess.PIPE,
+            )
+            out, _ = await proc.communicate()
+            self.output.append(out.decode().strip())
+            if self.stopping:
+                return
+            metrics.inc("cluster.restarts", worker=index)
+            logger.warning("Worker %d exited with %s, restarting", index, proc.returncode)
+            await asyncio.sleep(1)
+
+    def start(self) -> None:
+        self._watchers = [asyncio.create_task(self._watch(i), name=f"cluster-worker-{i}")
+                          for i in range(self.count)]
+
+    async def wait(self, timeout: float) -> None:
+        """Дождаться выхода воркеров после закрытия сокетов, затем добить."""
+        self.stopping = True
+        _, late = await asyncio.wait(self._watchers, timeout=timeout)
+        for proc in self.procs:
+            if late and proc is not None and proc.returncode is None:
+                proc.kill()
+        if late:
+            await asyncio.wait(late, timeout=5)
+
+
+async def supervise(count: int, *, webhook: bool = False) -> None:
+    """Запустить воркеров и фронт; работать до SIGTERM/SIGINT."""
+    from services.lifecycle import DRAIN_SECONDS
+
+    token = os.environ["TG_BOT_TOKEN"]
+    supervisor = Supervisor(count)
+    supervisor.start()
+    dispatcher = Dispatcher(supervisor.sockets)
+    await dispatcher.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("Cluster: %d workers, front=%s, %s", count,
+                "webhook" if webhook else "polling", runtime.describe())
+
+    front = asyncio.create_task((serve_webhook if webhook else poll)(dispatcher, token, stop))
+    await stop.wait()
+    logger.info("Cluster stopping: flushing queues to workers")
+    try:
+        await asyncio.wait_for(front, timeout=30)
+    except asyncio.TimeoutError:
+        front.cancel()
+    await dispatcher.close()
+    await supervisor.wait(DRAIN_SECONDS + 10)
+
+
+# ───────────────────────────── бенчмарк ─────────────────────────────
+
+async def bench(count: int, updates: int, telegram_ms: float, openai_ms: float) -> str:
+    """Прогнать `updates` синтетических апдейтов через фронт и `count` воркеров."""
+    from services.replay import synthetic_updates
+
+    env = {"BOT_DB_PATH": str(Path(tempfile.mkdtemp()) / "bench.db"), "UPDATE_LOG": "",
+           "TG_BOT_TOKEN": os.getenv("TG_BOT_TOKEN", "0:bench"),
+           "CHATGPT_TOKEN": os.getenv("CHATGPT_TOKEN", "bench")}
+    supervisor = Supervisor(count, ["--stub", str(telegram_ms), str(openai_ms)], env)
+    supervisor.start()
+    dispatcher = Dispatcher(supervisor.sockets)
+    await dispatcher.start()
+
+    payloads = [(runtime.dumps(u).encode(), route_key(u)) for u in synthetic_updates(updates)]
+    front_cpu = time.process_time()
+    started = time.monotonic()
+    for raw, chat_id in payloads:
+        await dispatcher.submit(raw, chat_id)
+    await dispatcher.close()
+    await supervisor.wait(600)
+    elapsed = time.monotonic() - started
+    front_cpu = time.process_time() - front_cpu
+
+    worker_cpu = sum(float(line.rsplit("cpu=", 1)[1]) for out in supervisor.output
+                     for line in out.splitlines() if "cpu=" in line)
+    return (f"workers={count}: {updates} updates in {elapsed:.1f}s — "
+            f"{updates / elapsed:.0f} upd/s; CPU/upd: front {front_cpu * 1000 / updates:.3f} ms, "
+            f"workers {worker_cpu * 1000 / updates:.2f} ms")
+
+
+def _cli() -> None:
+    parser = argparse.ArgumentParser(description="Кластерный режим бота")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="процесс-воркер (запускает супервизор)")
+    worker.add_argument("--socket", required=True)
+    worker.add_argument("--stub", nargs=2, type=float, metavar=("TELEGRAM_MS", "OPENAI_MS"))
+    bench_cmd = sub.add_parser("bench", help="замер пропускной способности")
+    bench_cmd.add_argument("--workers", default="1,2,4",
+                           help="список числа воркеров через запятую")
+    bench_cmd.add_argument("--updates", type=int, default=20_000)
+    bench_cmd.add_argument("--telegram-ms", type=float, default=0)
+    bench_cmd.add_argument("--openai-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    runtime.install()
+    if args.command == "worker":
+        asyncio.run(run_worker(args.socket, args.stub))
+        return
+    print(f"CPU: {os.cpu_count()}, {runtime.describe()}")
+    for count in (int(x) for x in args.workers.split(",")):
+        print(asyncio.run(bench(count, args.updates, args.telegram_ms, args.openai_ms)),
+              flush=True)
+
+
+if __name__ == "__main__":
+    _cli()
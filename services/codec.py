@@ -0,0 +1,154 @@
+"""
+services.codec
+==============
+
+Компактное кодирование `callback_data` и серверное хранилище состояний
+для inline-кнопок.
+
+Telegram ограничивает `callback_data` 64 байтами, поэтому в кнопку
+кладётся только префикс-маршрут (`services.ui`) и короткая полезная
+нагрузка — последовательность целых чисел, упакованных varint-ами
+и закодированных в base64url без паддинга:
+
+    quiz_ans:AgQ      ← (1, 2)
+    cook_kcal:0A8     ← (1000,)
+
+Всё, что не помещается в несколько чисел (текст вопроса, правильный
+ответ, тема), хранится на сервере в `PayloadStore`, а в кнопку уходит
+лишь выданный им ключ.
+
+Функции модуля не зависят от Telegram и легко тестируются.
+"""
+
+from __future__ import annotations
+import base64
+import itertools
+import secrets
+from collections import OrderedDict
+from typing import Generic, Optional, Tuple, TypeVar
+
+SEP = ":"                    # services.ui.CB_SEP
+MAX_CALLBACK_BYTES = 64
+
+T = TypeVar("T")
+
+
+class CallbackDataError(ValueError):
+    """Нагрузка кнопки повреждена, устарела или не проходит проверку."""
+
+
+def _zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def encode_payload(*values: int) -> str:
+    """Упаковать целые числа в строку base64url (zigzag + varint)."""
+    buf = bytearray()
+    for value in values:
+        n = _zigzag(int(value))
+        while True:
+            byte = n & 0x7F
+            n >>= 7
+            if n:
+                buf.append(byte | 0x80)
+            else:
+                buf.append(byte)
+                break
+    return base64.urlsafe_b64encode(bytes(buf)).rstrip(b"=").decode("ascii")
+
+
+def decode_payload(payload: str, arity: Optional[int] = None) -> Tuple[int, ...]:
+    """Распаковать строку, полученную из `encode_payload`.
+
+    Parameters
+    ----------
+    payload:
+        Часть `callback_data` после разделителя.
+    arity:
+        Ожидаемое количество чисел; `None` — без проверки.
+
+    Raises
+    ------
+    CallbackDataError
+        Строка не является корректной нагрузкой или содержит
+        неожиданное количество значений.
+    """
+    try:
+        raw = base64.b64decode(payload + "=" * (-len(payload) % 4),
+                               altchars=b"-_", validate=True)
+    except (ValueError, TypeError) as exc:
+        raise CallbackDataError(f"bad base64 payload {payload!r}") from exc
+
+    values = []
+    n = shift = 0
+    for byte in raw:
+        n |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            if shift > 63:
+                raise CallbackDataError("varint is too long")
+            continue
+        values.append(_unzigzag(n))
+        n = shift = 0
+    if shift:
+        raise CallbackDataError("truncated varint")
+    if arity is not None and len(values) != arity:
+        raise CallbackDataError(f"expected {arity} values, got {len(values)}")
+    return tuple(values)
+
+
+def pack(tag: str, *values: int) -> str:
+    """Собрать `callback_data` вида `<tag>:<payload>`.
+
+    Raises
+    ------
+    ValueError
+        Результат длиннее лимита Telegram в 64 байта.
+    """
+    data = f"{tag}{SEP}{encode_payload(*values)}" if values else tag
+    if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data!r}")
+    return data
+
+
+class PayloadStore(Generic[T]):
+    """Ограниченное LRU-хранилище «ключ → объект» для состояний кнопок.
+
+    Ключи — монотонно растущие целые числа, поэтому их удобно
+    передавать через `pack`. Счётчик стартует со случайного значения,
+    чтобы кнопки, оставшиеся в чатах с прошлого запуска, не указывали
+    на новые записи. При переполнении вытесняются самые старые записи;
+    кнопки, ссылающиеся на них, считаются устаревшими.
+
+    Parameters
+    ----------
+    maxsize:
+        Максимальное число хранимых объектов.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self._items: "OrderedDict[int, T]" = OrderedDict()
+        self._ids = itertools.count(secrets.randbelow(1 << 31) + 1)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, value: T) -> int:
+        """Сохранить объект и вернуть его ключ."""
+        key = next(self._ids)
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return key
+
+    def get(self, key: int) -> Optional[T]:
+        """Вернуть объект по ключу или `None`, если он вытеснен."""
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
@@ -0,0 +1,90 @@
+"""
+services.db
+===========
+
+Общее подключение к локальной SQLite-базе бота.
+
+* Файл базы — `BOT_DB_PATH` из .env (по умолчанию `data/bot.db`).
+* Режим WAL + `synchronous=NORMAL`: чтения не блокируют запись,
+  а fsync выполняется только на чекпойнтах.
+* Все обращения идут через **один** фоновый поток (`Database.call`),
+  поэтому event loop бота никогда не ждёт диск, а соединение не нужно
+  защищать блокировками.
+
+Схему таблиц объявляют сами модули-потребители
+(`services.quiz_stats` и др.) через `Database.ensure_schema`.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = Path(os.getenv(
+    "BOT_DB_PATH",
+    Path(__file__).resolve().parent.parent / "data" / "bot.db",
+))
+
+R = TypeVar("R")
+
+
+class Database:
+    """SQLite-соединение, обслуживаемое выделенным потоком.
+
+    Parameters
+    ----------
+    path:
+        Путь к файлу базы; каталог создаётся при первом подключении.
+    """
+
+    def __init__(self, path: Path | str = DB_PATH) -> None:
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._schemas: Set[str] = set()
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="sqlite")
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn = conn
+            logger.info("SQLite opened: %s", self.path)
+        return self._conn
+
+    def run(self, fn: Callable[..., R], *args: Any) -> R:
+        """Синхронно выполнить `fn(conn, *args)` (только из потока базы)."""
+        return fn(self._connection(), *args)
+
+    async def call(self, fn: Callable[..., R], *args: Any) -> R:
+        """Выполнить `fn(conn, *args)` в потоке базы и дождаться результата."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.run, fn, *args)
+
+    def ensure_schema(self, name: str, script: str) -> None:
+        """Один раз за процесс выполнить DDL-скрипт `script` (из потока базы)."""
+        if name not in self._schemas:
+            self._connection().executescript(script)
+            self._schemas.add(name)
+
+    def close(self) -> None:
+        """Закрыть соединение и остановить поток базы."""
+        def _close() -> None:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        self._executor.submit(_close).result()
+        self._executor.shutdown(wait=True)
+
+
+db = Database()
@@ -0,0 +1,106 @@
+"""
+services.debounce
+=================
+
+Склейка «очередей» сообщений в чат-режимах (`/gpt`, `/talk`, `/translator`).
+
+Длинный текст Telegram режет на несколько сообщений, а люди часто
+дописывают вопрос следом. Раньше каждое сообщение запускало отдельный
+запрос к ChatGPT. `Debouncer` копит сообщения одного чата в течение
+короткого окна (`CHAT_DEBOUNCE_MS`, по умолчанию 700 мс) и отправляет их
+одним запросом. Новое сообщение:
+
+* перезапускает окно ожидания;
+* отменяет уже идущую генерацию по предыдущим сообщениям этой же
+  очереди — её текст не теряется, а входит в новый, объединённый запрос.
+
+Обработчик PTB при этом возвращается сразу, а ответ отправляет фоновая
+задача (см. `submit`). Задача регистрируется в `services.tasks` под
+`chat_id`, поэтому выход из режима отменяет и ожидание, и генерацию.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services import metrics
+from services.tasks import tasks
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = float(os.getenv("CHAT_DEBOUNCE_MS", "700")) / 1000
+
+
+class _Burst:
+    __slots__ = ("parts", "task")
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class Debouncer:
+    """Окно склейки сообщений по ключу `(режим, chat_id)`.
+
+    Parameters
+    ----------
+    delay:
+        Длительность окна в секундах.
+    """
+
+    def __init__(self, delay: float = DEBOUNCE_SECONDS) -> None:
+        self.delay = delay
+        self._pending: Dict[Tuple[str, int], _Burst] = {}
+
+    def submit(self, chat_id: int, mode: str, text: str,
+               callback: Callable[[str], Awaitable[None]]) -> None:
+        """Добавить сообщение в очередь `(mode, chat_id)`.
+
+        Parameters
+        ----------
+        chat_id:
+            Чат, под которым задача регистрируется в `services.tasks`.
+        mode:
+            Режим (`gpt`, `talk`, …): очереди разных режимов не смешиваются.
+        text:
+            Текст сообщения.
+        callback:
+            Корутина-функция, которая получит склеенный текст всех
+            сообщений очереди и отправит ответ. Используется callback
+            **последнего** сообщения, чтобы ответить на него.
+        """
+        key = (mode, chat_id)
+        burst = self._pending.get(key)
+        if burst is None:
+            burst = self._pending[key] = _Burst()
+        elif burst.task is not None and not burst.task.done():
+            burst.task.cancel()
+            metrics.inc("debounce.superseded")
+        burst.parts.append(text)
+        burst.task = tasks.spawn(chat_id, self._fire(key, burst, callback),
+                                 name=f"debounce:{mode}:{chat_id}")
+
+    async def _fire(self, key: Tuple[str, int], burst: _Burst,
+                    callback: Callable[[str], Awaitable[None]]) -> None:
+        try:
+            await asyncio.sleep(self.delay)
+            await callback("\n".join(burst.parts))
+            if len(burst.parts) > 1:
+                metrics.inc("debounce.merged", len(burst.parts) - 1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:                        # noqa: BLE001
+            logger.exception("Debounced handler failed: %s", exc)
+        finally:
+            if (self._pending.get(key) is burst
+                    and burst.task is asyncio.current_task()):
+                del self._pending[key]
+
+    def pending(self) -> int:
+        """Число очередей, по которым ещё не отправлен ответ."""
+        return len(self._pending)
+
+
+debouncer = Debouncer()
@@ -0,0 +1,302 @@
+"""
+services.gate
+=============
+
+Ограничение одновременных запросов к OpenAI с полосами приоритета.
+
+Живые диалоги, генерации, которых ждёт пользователь, и фоновое
+заполнение кэшей (`services.warmup`, дозревание вопросов квиза)
+делят одну конкурентность OpenAI. Запрос занимает слот в одной из
+полос (`LANES`):
+
+* `interactive` — диалоги `/gpt` и `/talk` (задачи `chat`, `persona`);
+* `bulk` — остальные запросы, которых ждёт пользователь: меню, квиз,
+  перевод, факт;
+* `background` — запросы без пользователя (`user_id=None`).
+
+Не больше `OPENAI_CONCURRENCY` запросов (по умолчанию 16) выполняются
+одновременно; остальные ждут в очереди своей полосы. Освободившийся
+слот получает:
+
+1. `interactive` или `bulk` — плавным взвешенным round-robin
+   по весам `OPENAI_LANE_WEIGHTS` (по умолчанию 3 : 1), поэтому поток
+   меню не останавливает диалоги, но и сам не голодает;
+2. `background` — только если живых запросов в очереди нет: ожидающая
+   фоновая работа уступает очередь любому пришедшему позже живому
+   запросу. Кроме того, фоновая полоса никогда не занимает больше
+   `OPENAI_BACKGROUND_SHARE` слотов (по умолчанию четверть, минимум
+   один), так что у живых запросов всегда есть свободный запас.
+
+Уже отправленные запросы не прерываются — вытесняется только очередь.
+
+Адаптивный лимит
+----------------
+Верный лимит заранее неизвестен и меняется в течение дня: слишком
+низкий теряет пропускную способность, слишком высокий вызывает шквал
+429. Поэтому `OPENAI_CONCURRENCY` — только стартовое значение,
+а дальше лимит ведёт AIMD (`AdaptiveLimit`) по каждому ответу OpenAI
+(`observe()` из `services.openai_client`):
+
+* **рост** — `+1/limit` за каждый успешный ответ, пока очередь
+  упирается в лимит, а время на токен остаётся в пределах допуска
+  (см. ниже), то есть примерно +1 за «поколение» запросов;
+* **сброс** — 429 или таймаут умножают лимит на `OPENAI_BACKOFF`
+  (по умолчанию 0.7). Снова сбросить может только запрос, начатый
+  после предыдущего сброса, — одна перегрузка не обрушивает лимит
+  до минимума;
+* **задержка** — время ответа LLM определяется в основном его длиной,
+  а не нагрузкой, поэтому сравнивается время на токен: `elapsed /
+  (completion_tokens + TTFT_TOKENS)`, где слагаемое учитывает ожидание
+  первого токена. Базовое значение — медленно «всплывающий» минимум
+  по задаче, отношение сглаживается EWMA. Пока оно выше
+  `OPENAI_LATENCY_TOLERANCE` (по умолчанию 2; `0` — не учитывать),
+  лимит не растёт. Снижать лимит по задержке (×0.9, с тем же правилом
+  «раз за поколение») — по желанию, `OPENAI_LATENCY_CUTS=1`:
+  по умолчанию лимит уменьшают только 429 и таймауты;
+* лимит держится в `[OPENAI_CONCURRENCY_MIN, OPENAI_CONCURRENCY_MAX]`
+  (по умолчанию 2…64); `OPENAI_ADAPTIVE=0` фиксирует его.
+
+Метрики: гистограмма `openai.queue_ms{lane}` (время ожидания слота),
+gauge-и `openai.in_flight{lane}`, `openai.queued{lane}`, `openai.limit`
+и `openai.latency_ratio`, счётчик решений
+`openai.limit_changes{action=grow|cut, reason=saturated|latency|overload}`.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+LANES = ("interactive", "bulk", "background")
+LIVE = LANES[:2]
+TASK_LANES = {"chat": "interactive", "persona": "interactive"}
+
+CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+WEIGHTS: Dict[str, int] = {"interactive": 3, "bulk": 1}
+WEIGHTS.update(json.loads(os.getenv("OPENAI_LANE_WEIGHTS", "{}")))
+BACKGROUND_SHARE = float(os.getenv("OPENAI_BACKGROUND_SHARE", "0.25"))
+
+ADAPTIVE = os.getenv("OPENAI_ADAPTIVE", "1") not in ("", "0")
+MIN_LIMIT = int(os.getenv("OPENAI_CONCURRENCY_MIN", "2"))
+MAX_LIMIT = int(os.getenv("OPENAI_CONCURRENCY_MAX", "64"))
+LATENCY_TOLERANCE = float(os.getenv("OPENAI_LATENCY_TOLERANCE", "2"))
+LATENCY_CUTS = os.getenv("OPENAI_LATENCY_CUTS", "0") not in ("", "0")
+BACKOFF = float(os.getenv("OPENAI_BACKOFF", "0.7"))
+LATENCY_BACKOFF = 0.9
+BASELINE_DRIFT = 1.001      # базовая задержка «всплывает» на 0.1 % за ответ
+TTFT_TOKENS = 40            # ожидание первого токена ≈ генерации 40 токенов
+SMOOTHING = 0.1
+
+
+def lane_for(task: str, user_id: object) -> str:
+    """Полоса по умолчанию: без пользователя — фон, иначе по задаче."""
+    if user_id is None:
+        return "background"
+    return TASK_LANES.get(task, "bulk")
+
+
+class AdaptiveLimit:
+    """AIMD-регулятор лимита по задержке и перегрузкам (см. описание модуля).
+
+    Parameters
+    ----------
+    initial, minimum, maximum:
+        Стартовый лимит и его границы.
+    """
+
+    def __init__(self, initial: int, minimum: int = MIN_LIMIT,
+                 maximum: int = MAX_LIMIT) -> None:
+        self.minimum = max(1, min(minimum, maximum))
+        self.maximum = max(self.minimum, maximum)
+        self.value = float(min(max(initial, self.minimum), self.maximum))
+        self.ratio = 1.0
+        self._baseline: Dict[str, float] = {}
+        self._cut_at = float("-inf")
+
+    def _cut(self, factor: float, reason: str, now: float) -> None:
+        self._cut_at = now
+        before = self.value
+        self.value = max(self.minimum, self.value * factor)
+        if int(self.value) != int(before):
+            metrics.inc("openai.limit_changes", action="cut", reason=reason)
+            logger.info("OpenAI concurrency %.1f → %.1f (%s)", before, self.value, reason)
+
+    def update(self, task: str, started: float, elapsed: float,
+               overload: bool, saturated: bool, tokens: Optional[int] = None) -> int:
+        """Учесть один ответ и вернуть новый целый лимит.
+
+        Parameters
+        ----------
+        task:
+            Задача (`chat`, `menu`, …) — у каждой своя базовая задержка.
+        started:
+            `time.monotonic()` начала запроса.
+        elapsed:
+            Длительность запроса, секунды.
+        overload:
+            Ответ 429 или таймаут.
+        saturated:
+            Были ли в момент ответа заняты все слоты — без этого рост
+            лимита ничем не подтверждён.
+        tokens:
+            `completion_tokens` ответа; без них задержка не учитывается.
+        """
+        now = started + elapsed
+        if overload:
+            if started >= self._cut_at:
+                self._cut(BACKOFF, "overload", now)
+            return int(self.value)
+        if LATENCY_TOLERANCE > 0 and tokens is not None:
+            per_token = elapsed / (tokens + TTFT_TOKENS)
+            baseline = min(per_token, self._baseline.get(task, per_token) * BASELINE_DRIFT)
+            self._baseline[task] = baseline
+            self.ratio += SMOOTHING * (per_token / max(baseline, 1e-6) - self.ratio)
+            metrics.set_gauge("openai.latency_ratio", round(self.ratio, 2))
+            if self.ratio > LATENCY_TOLERANCE:
+                if LATENCY_CUTS and started >= self._cut_at:
+                    self._cut(LATENCY_BACKOFF, "latency", now)
+                return int(self.value)
+        if saturated and self.value < self.maximum:
+            before = self.value
+            self.value = min(self.maximum, self.value + 1 / self.value)
+            if int(self.value) != int(before):
+                metrics.inc("openai.limit_changes", action="grow", reason="saturated")
+        return int(self.value)
+
+
+class PriorityGate:
+    """Семафор на `limit` слотов с очередями по полосам.
+
+    Parameters
+    ----------
+    limit:
+        Сколько запросов выполняются одновременно; можно менять на лету
+        через `set_limit()`.
+    adaptive:
+        Вести лимит `AdaptiveLimit` по ответам из `observe()`.
+    """
+
+    def __init__(self, limit: int = CONCURRENCY, adaptive: bool = ADAPTIVE) -> None:
+        self.limit = max(1, limit)
+        self.control = AdaptiveLimit(limit) if adaptive else None
+        if self.control is not None:
+            self.limit = int(self.control.value)
+        metrics.set_gauge("openai.limit", self.limit)
+        self._active: Dict[str, int] = dict.fromkeys(LANES, 0)
+        self._queues: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._credit: Dict[str, int] = dict.fromkeys(LIVE, 0)
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько слотов занято сейчас."""
+        return sum(self._active.values())
+
+    def live(self) -> int:
+        """Живые запросы: выполняющиеся и ждущие слота, без фоновых."""
+        return sum(self._active[lane] + len(self._queues[lane]) for lane in LIVE)
+
+    def _background_cap(self) -> int:
+        return max(1, int(self.limit * BACKGROUND_SHARE))
+
+    def _pick(self) -> str | None:
+        waiting = [lane for lane in LIVE if self._queues[lane]]
+        if waiting:
+            total = sum(WEIGHTS[lane] for lane in waiting)
+            for lane in waiting:
+                self._credit[lane] += WEIGHTS[lane]
+            best = max(waiting, key=self._credit.__getitem__)
+            self._credit[best] -= total
+            return best
+        if self._queues["background"] and self._active["background"] < self._background_cap():
+            return "background"
+        return None
+
+    def _wake(self) -> None:
+        while self.in_flight < self.limit:
+            lane = self._pick()
+            if lane is None:
+                break
+            waiter = self._queues[lane].popleft()
+            if waiter.done():
+                continue
+            self._active[lane] += 1
+            waiter.set_result(None)
+        self._report()
+
+    def _report(self) -> None:
+        for lane in LANES:
+            metrics.set_gauge("openai.in_flight", self._active[lane], lane=lane)
+            metrics.set_gauge("openai.queued", len(self._queues[lane]), lane=lane)
+
+    def _admit_now(self, lane: str) -> bool:
+        if self.in_flight >= self.limit or any(self._queues[q] for q in LIVE):
+            return False
+        if lane == "background":
+            return (not self._queues["background"]
+                    and self._active["background"] < self._background_cap())
+        return True
+
+    def set_limit(self, limit: int) -> None:
+        """Поменять число слотов; при росте ожидающие пропускаются сразу."""
+        self.limit = max(1, limit)
+        metrics.set_gauge("openai.limit", self.limit)
+        self._wake()
+
+    def observe(self, task: str, started: float, elapsed: float,
+                overload: bool = False, tokens: Optional[int] = None) -> None:
+        """Обратная связь от запроса, ещё держащего слот (для адаптивного лимита)."""
+        if self.control is None:
+            return
+        queued = sum(len(q) for q in self._queues.values())
+        limit = self.control.update(task, started, elapsed, overload,
+                                    saturated=self.in_flight + queued >= self.limit,
+                                    tokens=tokens)
+        if limit != self.limit:
+            self.set_limit(limit)
+
+    async def acquire(self, lane: str) -> None:
+        """Дождаться слота в полосе `lane`."""
+        started = time.perf_counter()
+        if self._admit_now(lane):
+            self._active[lane] += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[lane].append(waiter)
+            self._report()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release(lane)
+                elif waiter in self._queues[lane]:
+                    self._queues[lane].remove(waiter)
+                    self._report()
+                raise
+        metrics.observe("openai.queue_ms", (time.perf_counter() - started) * 1000, lane=lane)
+        self._report()
+
+    def release(self, lane: str) -> None:
+        """Вернуть слот полосы `lane`."""
+        self._active[lane] -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, lane: str) -> AsyncIterator[None]:
+        """`async with gate.slot(lane):` — слот на время запроса."""
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+
+gate = PriorityGate()
@@ -0,0 +1,199 @@
+"""
+services.images
+===============
+
+Обложки режимов: загрузка при старте, пережатие и повторная отправка
+по `file_id`.
+
+Раньше обработчики передавали в `reply_photo` путь к файлу, и PTB
+синхронно читал JPEG с диска прямо в event loop при каждом показе меню.
+Теперь:
+
+* `load()` один раз при старте (`post_init` в `main.py`) читает все
+  `images/*.jpg` через `aiofiles` и держит байты в памяти;
+* если установлен Pillow, картинка, которая больше `IMAGE_MAX_SIDE`
+  (по умолчанию 1280 px — столько Telegram всё равно оставит) или
+  просто тяжелее, чем нужно, пережимается в progressive JPEG
+  с качеством `IMAGE_QUALITY` (по умолчанию 85); без Pillow байты
+  отправляются как есть;
+* результат пережатия кэшируется в `data/images/` под именем
+  с blake2b-хэшем исходника и параметрами кодирования: изменился
+  файл или настройки — изменился ключ, и кэш пересобирается сам;
+* после первой отправки Telegram возвращает `file_id`, и дальше
+  обложка уходит без загрузки байтов (`send_cover`). `file_id`
+  привязан к хэшу содержимого, поэтому новая картинка после
+  перезапуска не спутается со старой.
+
+Если обложки нет на диске (например, `images/translator.jpg`),
+показывается общая `bot.jpg`.
+"""
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Union
+
+import aiofiles
+from telegram import InputFile, Message
+from telegram.error import BadRequest
+
+try:
+    from PIL import Image
+except ImportError:                                 # Pillow не обязателен
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = Path("images")
+CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", "data/images"))
+MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+DEFAULT_COVER = "bot.jpg"
+
+
+class Cover(NamedTuple):
+    """Обложка, готовая к отправке."""
+    name: str
+    data: bytes
+    digest: str
+
+
+_covers: Dict[str, Cover] = {}
+_file_ids: Dict[str, str] = {}
+_shown: Dict[str, str] = {}                         # file_unique_id → digest
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _reencode(data: bytes) -> Optional[bytes]:
+    """Пережать JPEG под Telegram; `None` — оставить исходник."""
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "JPEG", quality=QUALITY,
+                                optimize=True, progressive=True)
+    encoded = out.getvalue()
+    return encoded if len(encoded) < len(data) else None
+
+
+async def _prepare(path: Path) -> Cover:
+    async with aiofiles.open(path, "rb") as fh:
+        data = await fh.read()
+    if Image is None:
+        return Cover(path.name, data, _digest(data))
+
+    cached = CACHE_DIR / f"{path.stem}.{_digest(data)}.{MAX_SIDE}q{QUALITY}.jpg"
+    if cached.exists():
+        async with aiofiles.open(cached, "rb") as fh:
+            data = await fh.read()
+        return Cover(path.name, data, _digest(data))
+
+    encoded = await asyncio.to_thread(_reencode, data)
+    if encoded is not None:
+        logger.info("Cover %s re-encoded: %d → %d bytes",
+                    path.name, len(data), len(encoded))
+        data = encoded
+    for stale in CACHE_DIR.glob(f"{path.stem}.*.jpg"):
+        stale.unlink(missing_ok=True)
+    async with aiofiles.open(cached, "wb") as fh:
+        await fh.write(data)
+    return Cover(path.name, data, _digest(data))
+
+
+async def load(directory: Path = IMAGES_DIR) -> int:
+    """Загрузить (и при необходимости пережать) все обложки каталога.
+
+    Returns
+    -------
+    int
+        Число загруженных обложек.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    paths = sorted(directory.glob("*.jpg"))
+    covers = await asyncio.gather(*(_prepare(p) for p in paths),
+                                  return_exceptions=True)
+    for path, cover_ in zip(paths, covers):
+        if isinstance(cover_, Exception):
+            logger.error("Cover %s not loaded: %s", path, cover_)
+            continue
+        _covers[cover_.name] = cover_
+    logger.info("Covers loaded: %d (%d KiB)", len(_covers),
+                sum(len(c.data) for c in _covers.values()) // 1024)
+    return len(_covers)
+
+
+def _lookup(path: str) -> Optional[Cover]:
+    return _covers.get(Path(path).name) or _covers.get(DEFAULT_COVER)
+
+
+def cover(path: str) -> Union[str, InputFile]:
+    """Что передать в `send_photo` / `reply_photo` вместо пути к файлу.
+
+    Parameters
+    ----------
+    path : str
+        Путь вида `images/quiz.jpg` (константа `IMAGE` обработчика).
+
+    Returns
+    -------
+    str | telegram.InputFile
+        `file_id` уже отправленной обложки, байты из памяти или —
+        если `load()` ещё не выполнялся — сам путь, как раньше.
+    """
+    found = _lookup(path)
+    if found is None:
+        return path
+    return _file_ids.get(found.digest) or InputFile(found.data, filename=found.name)
+
+
+def remember(path: str, message: Message) -> None:
+    """Запомнить `file_id` обложки из отправленного сообщения."""
+    found = _lookup(path)
+    if found is not None and message.photo:
+        _file_ids[found.digest] = message.photo[-1].file_id
+        _shown[message.photo[-1].file_unique_id] = found.digest
+
+
+def is_shown(message: Optional[Message], path: str) -> bool:
+    """Показывает ли сообщение уже обложку `path` (тогда медиа не меняем)."""
+    if message is None or not message.photo:
+        return False
+    found = _lookup(path)
+    return (found is not None
+            and _shown.get(message.photo[-1].file_unique_id) == found.digest)
+
+
+async def send_cover(send: Callable[..., Awaitable[Message]], path: str,
+                     **kwargs) -> Message:
+    """Отправить обложку и запомнить её `file_id`.
+
+    Parameters
+    ----------
+    send : callable
+        Метод PTB, принимающий фото первым аргументом
+        (`message.reply_photo`, `chat.send_photo`, …).
+    path : str
+        Путь к обложке (`images/*.jpg`).
+    **kwargs
+        Остальные аргументы `send` (`caption`, `reply_markup`, …).
+
+    Если Telegram отверг сохранённый `file_id`, обложка один раз
+    переотправляется байтами.
+    """
+    photo = cover(path)
+    try:
+        message = await send(photo, **kwargs)
+    except BadRequest:
+        found = _lookup(path)
+        if found is None or not isinstance(photo, str):
+            raise
+        _file_ids.pop(found.digest, None)
+        message = await send(cover(path), **kwargs)
+    remember(path, message)
+    return message
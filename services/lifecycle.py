@@ -0,0 +1,91 @@
+"""
+services.lifecycle
+==================
+
+Плавная остановка бота для деплоев без потери запросов.
+
+`run_polling` сам ловит SIGTERM/SIGINT и останавливает приложение
+в таком порядке: перестаёт забирать апдейты у Telegram (невыбранные
+достаются следующему экземпляру), дообрабатывает уже полученные,
+вызывает `post_stop`, закрывает `Bot` и вызывает `post_shutdown`.
+Но ответы ChatGPT и недельное меню готовятся в фоновых задачах
+(`services.tasks`), которых PTB не видит: раньше они обрывались
+вместе с event loop, и пользователь так и не получал ответа.
+
+Этот модуль добавляет два шага:
+
+* `drain()` (из `post_stop`, пока `Bot` ещё работает) ждёт все
+  фоновые задачи чатов и задачи, зарегистрированные через `track()`,
+  но не дольше `SHUTDOWN_DRAIN_SECONDS` (по умолчанию 25 — с запасом
+  укладывается в стандартные 30 с на остановку контейнера);
+  не успевшие задачи отменяются;
+* `flush()` (из `post_shutdown`) по очереди выполняет хуки
+  `on_shutdown` — сброс учёта, журналов, итоговых метрик — и
+  закрывает SQLite. Ошибка одного хука не мешает остальным.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Set
+
+from services import metrics
+from services.db import db
+from services.tasks import tasks
+
+logger = logging.getLogger(__name__)
+
+DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "25"))
+
+_background: Set[asyncio.Task] = set()
+_hooks: Dict[str, Callable[[], Awaitable[object]]] = {}
+
+
+def track(task: asyncio.Task) -> asyncio.Task:
+    """Дождаться `task` при остановке (для фоновых задач вне чатов)."""
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+def on_shutdown(name: str, hook: Callable[[], Awaitable[object]]) -> None:
+    """Зарегистрировать корутину-функцию сброса; повтор имени заменяет хук."""
+    _hooks[name] = hook
+
+
+async def drain(timeout: float = DRAIN_SECONDS) -> int:
+    """Дождаться незавершённых фоновых задач, остальные отменить.
+
+    Returns
+    -------
+    int
+        Сколько задач пришлось отменить по истечении `timeout`.
+    """
+    pending = set(tasks.all()) | _background
+    if not pending:
+        return 0
+    logger.info("Draining %d background task(s), deadline %.0fs",
+                len(pending), timeout)
+    started = time.monotonic()
+    _, late = await asyncio.wait(pending, timeout=timeout)
+    for task in late:
+        task.cancel()
+    if late:
+        await asyncio.wait(late, timeout=1)
+        metrics.inc("lifecycle.cancelled", len(late))
+        logger.warning("Drain deadline hit: %d task(s) cancelled", len(late))
+    metrics.observe("lifecycle.drain_seconds", time.monotonic() - started)
+    return len(late)
+
+
+async def flush() -> None:
+    """Выполнить хуки `on_shutdown`, записать итоговые метрики, закрыть SQLite."""
+    for name, hook in _hooks.items():
+        try:
+            await hook()
+        except Exception as exc:                      # noqa: BLE001
+            logger.exception("Shutdown hook %s failed: %s", name, exc)
+    logger.info("Final metrics:\n%s", metrics.render())
+    await asyncio.to_thread(db.close)
@@ -0,0 +1,123 @@
+"""
+services.loopmon
+================
+
+Постоянный монитор задержки event loop и детектор «медленных колбэков».
+
+Бот работает в одном asyncio-цикле, поэтому любая синхронная работа
+в обработчике (чтение файла, запись лога в `FileHandler`, `json.loads`
+большого ответа) задерживает все чаты сразу. `/profile`
+(`services.profiler`) помогает разобраться по запросу, а этот модуль
+работает всегда и стоит почти ничего:
+
+* **пульс** — задача раз в `LOOP_MONITOR_INTERVAL` секунд (по умолчанию
+  0.25) засыпает и замеряет, насколько позже проснулась; отставание
+  пишется в гистограмму `loop.lag_ms`, а отставание больше
+  `LOOP_SLOW_MS` (по умолчанию 100) — ещё и в счётчик `loop.stalls`;
+* **сторож** — поток, который следит за временем последнего пульса.
+  Если пульс опаздывает больше чем на `LOOP_SLOW_MS`, значит, цикл
+  прямо сейчас занят одним колбэком: сторож снимает стек потока цикла
+  (один раз за блокировку), пишет его в лог с уровнем WARNING
+  и увеличивает `loop.slow_callbacks{where=...}`, где `where` —
+  ближайшая к вершине стека функция бота. Последние блокировки
+  доступны через `recent()`.
+
+`LOOP_MONITOR_INTERVAL=0` выключает монитор.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, NamedTuple, Optional
+
+from services import metrics
+from services.profiler import own_frame, where
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.25"))
+SLOW_MS = float(os.getenv("LOOP_SLOW_MS", "100"))
+STACK_DEPTH = 20
+
+
+class Stall(NamedTuple):
+    """Блокировка цикла, пойманная сторожем."""
+    at: float           # unix-время
+    blocked_ms: float   # сколько цикл был занят к моменту снимка
+    where: str
+    stack: str
+
+
+_recent: Deque[Stall] = deque(maxlen=20)
+_beat = 0.0
+_heartbeat: Optional[asyncio.Task] = None
+_stop = threading.Event()
+
+
+def recent() -> list:
+    """Последние пойманные блокировки, новые в конце."""
+    return list(_recent)
+
+
+async def _pulse() -> None:
+    global _beat
+    _beat = time.perf_counter()
+    while True:
+        await asyncio.sleep(INTERVAL)
+        now = time.perf_counter()
+        lag = max((now - _beat - INTERVAL) * 1000, 0.0)
+        _beat = now
+        metrics.observe("loop.lag_ms", lag)
+        if lag >= SLOW_MS:
+            metrics.inc("loop.stalls")
+
+
+def _watch(loop_thread: int) -> None:
+    reported = 0.0
+    while not _stop.wait(SLOW_MS / 2000):
+        beat = _beat
+        overdue = (time.perf_counter() - beat - INTERVAL) * 1000
+        if overdue < SLOW_MS or beat == reported:
+            continue
+        reported = beat
+        frame = sys._current_frames().get(loop_thread)
+        if frame is None:
+            continue
+        own = own_frame(frame)
+        place = where(own or frame)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+        _recent.append(Stall(time.time(), overdue, place, stack))
+        metrics.inc("loop.slow_callbacks", where=place)
+        logger.warning("Event loop blocked for %.0f ms in %s:\n%s", overdue, place, stack)
+
+
+def start() -> bool:
+    """Запустить пульс и сторожа (из `post_init`).
+
+    Returns
+    -------
+    bool
+        `False`, если монитор выключен или уже запущен.
+    """
+    global _heartbeat
+    if INTERVAL <= 0 or (_heartbeat is not None and not _heartbeat.done()):
+        return False
+    _stop.clear()
+    _heartbeat = asyncio.get_running_loop().create_task(_pulse(), name="loop-heartbeat")
+    threading.Thread(target=_watch, args=(threading.get_ident(),),
+                     name="loop-watchdog", daemon=True).start()
+    return True
+
+
+async def stop() -> None:
+    """Остановить монитор (хук `services.lifecycle`)."""
+    _stop.set()
+    if _heartbeat is not None and not _heartbeat.done():
+        _heartbeat.cancel()
+        await asyncio.gather(_heartbeat, return_exceptions=True)
@@ -0,0 +1,145 @@
+"""
+services.metrics
+================
+
+Минимальный in-process реестр метрик: счётчики, gauge-и и гистограммы
+с метками. Внешних зависимостей нет; `render()` отдаёт текст в формате,
+близком к Prometheus exposition, а `snapshot()` — словарь для логов
+и админ-команд.
+
+Гистограммы логарифмические (шаг ≈ 19 %): память не растёт с числом
+наблюдений, а перцентили считаются с относительной погрешностью
+в пределах одного бакета — этого достаточно для p50/p95/p99.
+
+Пример
+------
+>>> metrics.inc("openai.truncated", task="menu")
+>>> metrics.observe("openai.completion_tokens", 812, task="menu")
+>>> metrics.histogram("openai.completion_tokens", task="menu").percentile(0.95)
+"""
+
+from __future__ import annotations
+import math
+from typing import Dict, Iterator, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+_Key = Tuple[str, Labels]
+
+_GROWTH = 2 ** 0.25
+_LOG_GROWTH = math.log(_GROWTH)
+
+
+def _key(name: str, labels: Dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Логарифмическая гистограмма неотрицательных значений."""
+
+    __slots__ = ("count", "total", "max", "_buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets: Dict[int, int] = {}
+
+    def observe(self, value: float) -> None:
+        """Добавить наблюдение."""
+        value = max(float(value), 0.0)
+        idx = math.ceil(math.log(value) / _LOG_GROWTH) if value > 0 else -10_000
+        self._buckets[idx] = self._buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Оценка q-перцентиля (0 < q ≤ 1) по верхней границе бакета."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx in sorted(self._buckets):
+            seen += self._buckets[idx]
+            if seen >= rank:
+                return 0.0 if idx == -10_000 else min(_GROWTH ** idx, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """count / mean / p50 / p95 / p99 / max."""
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 3),
+            "p50": round(self.percentile(0.50), 3),
+            "p95": round(self.percentile(0.95), 3),
+            "p99": round(self.percentile(0.99), 3),
+            "max": round(self.max, 3),
+        }
+
+
+_counters: Dict[_Key, float] = {}
+_gauges: Dict[_Key, float] = {}
+_histograms: Dict[_Key, Histogram] = {}
+
+
+def inc(name: str, value: float = 1, **labels: object) -> None:
+    """Увеличить счётчик `name` с метками `labels`."""
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: object) -> None:
+    """Установить текущее значение gauge."""
+    _gauges[_key(name, labels)] = value
+
+
+def histogram(name: str, **labels: object) -> Histogram:
+    """Гистограмма `name` с метками (создаётся при первом обращении)."""
+    key = _key(name, labels)
+    hist = _histograms.get(key)
+    if hist is None:
+        hist = _histograms[key] = Histogram()
+    return hist
+
+
+def observe(name: str, value: float, **labels: object) -> None:
+    """Добавить наблюдение в гистограмму."""
+    histogram(name, **labels).observe(value)
+
+
+def _fmt(name: str, labels: Labels) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _iter_lines() -> Iterator[str]:
+    for (name, labels), value in sorted(_counters.items()):
+        yield f"{_fmt(name, labels)} {value:g}"
+    for (name, labels), value in sorted(_gauges.items()):
+        yield f"{_fmt(name, labels)} {value:g}"
+    for (name, labels), hist in sorted(_histograms.items(), key=lambda kv: kv[0]):
+        for stat, value in hist.summary().items():
+            yield f"{_fmt(name + '_' + stat, labels)} {value:g}"
+
+
+def render() -> str:
+    """Все метрики одной строкой на значение."""
+    return "\n".join(_iter_lines())
+
+
+def snapshot() -> Dict[str, object]:
+    """Все метрики словарём `{имя{метки}: значение | summary}`."""
+    data: Dict[str, object] = {}
+    for (name, labels), value in _counters.items():
+        data[_fmt(name, labels)] = value
+    for (name, labels), value in _gauges.items():
+        data[_fmt(name, labels)] = value
+    for (name, labels), hist in _histograms.items():
+        data[_fmt(name, labels)] = hist.summary()
+    return data
@@ -0,0 +1,167 @@
+"""
+services.model_router
+=====================
+
+Реестр профилей моделей по задачам и маршрутизация с учётом задержки.
+
+Каждая функция `services.openai_client` обращается к OpenAI от имени
+**задачи** (`fact`, `quiz`, `translate`, `menu`, `chat`, `persona`).
+Профиль задачи задаёт:
+
+* `models` — цепочку моделей: первая основная, остальные — запасные
+  (используются при ошибке и при превышении бюджета задержки);
+* `max_tokens` — потолок длины ответа (`None` — без ограничения);
+* `temperature` — температура по умолчанию;
+* `p95_budget_ms` — бюджет p95-задержки основной модели;
+* `continuations` — сколько раз дозапрашивать продолжение ответа,
+  оборванного по `max_tokens`.
+
+Настройка без правок кода
+-------------------------
+`OPENAI_MODEL` задаёт модель по умолчанию для всех профилей, а
+`OPENAI_PROFILES` — JSON-строку или путь к JSON-файлу с переопределениями:
+
+    {"menu": {"models": ["gpt-4o-mini", "gpt-3.5-turbo"], "max_tokens": 2500},
+     "fact": {"temperature": 1.0}}
+
+Маршрутизация по задержке
+-------------------------
+Для каждой пары (задача, модель) хранится скользящее окно последних
+замеров (`LATENCY_WINDOW` секунд): у задач разная длина ответа, поэтому
+медленные `menu` не портят p95 коротких `fact` на той же модели.
+Если p95 основной модели задачи превышает бюджет задачи, трафик
+переводится на запасную модель с наименьшим p95 — среди тех, у которых
+есть хотя бы `_MIN_SAMPLES` свежих замеров. Запасная модель без
+замеров получает пробный запрос раз в `_PROBE_EVERY` маршрутизаций,
+пока не наберёт их. Основная модель без свежих замеров снова
+становится первой, поэтому получает пробный трафик, как только её
+старые замеры устареют, — и остаётся, если укладывается в бюджет.
+"""
+
+from __future__ import annotations
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+LATENCY_WINDOW = float(os.getenv("OPENAI_LATENCY_WINDOW", "300"))
+_MAX_SAMPLES = 256
+_MIN_SAMPLES = 5
+_PROBE_EVERY = 20
+
+
+class TaskProfile(NamedTuple):
+    """Параметры обращения к OpenAI для одной задачи."""
+    models: Tuple[str, ...]
+    max_tokens: Optional[int] = None
+    temperature: float = 0.8
+    p95_budget_ms: Optional[float] = None
+    continuations: int = 0
+
+
+PROFILES: Dict[str, TaskProfile] = {
+    "fact":      TaskProfile((DEFAULT_MODEL,), 100,  0.95, 4_000),
+    "quiz":      TaskProfile((DEFAULT_MODEL,), 200,  0.85, 6_000),
+    "translate": TaskProfile((DEFAULT_MODEL,), 1500, 0.3,  6_000, 1),
+    "menu":      TaskProfile((DEFAULT_MODEL,), 3500, 0.65, 60_000, 1),
+    "chat":      TaskProfile((DEFAULT_MODEL,), 1000, 0.8,  15_000),
+    "persona":   TaskProfile((DEFAULT_MODEL,), 800,  0.8,  15_000),
+}
+
+_samples: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = defaultdict(
+    lambda: deque(maxlen=_MAX_SAMPLES)
+)
+_routed: Dict[str, int] = defaultdict(int)      # задача → маршрутизаций сверх бюджета
+
+
+def _load_overrides(raw: str) -> None:
+    path = Path(raw)
+    text = path.read_text(encoding="utf-8") if path.is_file() else raw
+    for task, fields in json.loads(text).items():
+        base = PROFILES.get(task, TaskProfile((DEFAULT_MODEL,)))
+        if "models" in fields:
+            fields["models"] = tuple(fields["models"])
+        PROFILES[task] = base._replace(**fields)
+    logger.info("OpenAI profiles overridden: %s", ", ".join(PROFILES))
+
+
+if os.getenv("OPENAI_PROFILES"):
+    _load_overrides(os.environ["OPENAI_PROFILES"])
+
+
+def profile(task: str) -> TaskProfile:
+    """Профиль задачи; неизвестные задачи получают профиль `chat`."""
+    return PROFILES.get(task) or PROFILES["chat"]
+
+
+def observe(task: str, model: str, seconds: float) -> None:
+    """Записать длительность успешного ответа модели на задачу.
+
+    Неудачные обращения не пишутся: быстрый 429 или обрыв соединения
+    занизил бы p95 и маршрутизация предпочла бы сбоящую модель.
+    """
+    _samples[(task, model)].append((time.monotonic(), seconds * 1000))
+
+
+def _window(task: str, model: str) -> Deque[Tuple[float, float]]:
+    """Замеры пары (задача, модель) за последние `LATENCY_WINDOW` секунд."""
+    window = _samples.get((task, model))
+    if window is None:
+        return deque()
+    horizon = time.monotonic() - LATENCY_WINDOW
+    while window and window[0][0] < horizon:
+        window.popleft()
+    return window
+
+
+def p95(task: str, model: str) -> Optional[float]:
+    """p95 задержки модели на задаче в мс за последние `LATENCY_WINDOW` секунд."""
+    window = _window(task, model)
+    if not window:
+        return None
+    values = sorted(ms for _, ms in window)
+    return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+
+def route(task: str) -> List[str]:
+    """Порядок моделей для задачи: первой — та, что укладывается в бюджет.
+
+    Returns
+    -------
+    list[str]
+        Цепочка моделей; следующие элементы используются как запасные
+        при ошибке предыдущих.
+    """
+    prof = profile(task)
+    chain = list(prof.models)
+    if prof.p95_budget_ms is None or len(chain) < 2:
+        return chain
+    primary = p95(task, chain[0])
+    if primary is None or primary <= prof.p95_budget_ms:
+        return chain
+    sampled = {m: p95(task, m) for m in chain[1:]
+               if len(_window(task, m)) >= _MIN_SAMPLES}
+    choice = min(sampled, key=sampled.get, default=None)
+    if choice is None or sampled[choice] >= primary:
+        choice = None
+        unsampled = [m for m in chain[1:] if m not in sampled]
+        _routed[task] += 1
+        if unsampled and _routed[task] % _PROBE_EVERY == 0:
+            choice = unsampled[0]
+    if choice is not None:
+        logger.info("Route %s: %s p95=%.0fms > %.0fms, using %s",
+                    task, chain[0], primary, prof.p95_budget_ms, choice)
+        chain.remove(choice)
+        chain.insert(0, choice)
+    return chain
+
+
+def stats() -> Dict[str, Optional[float]]:
+    """Текущий p95 по парам `задача/модель`, по которым есть замеры."""
+    return {f"{task}/{model}": p95(task, model) for task, model in list(_samples)}
@@ -0,0 +1,94 @@
+"""
+services.nav
+============
+
+Переходы между экранами «обложка + подпись + клавиатура» без
+пересоздания сообщения.
+
+Раньше каждый переход (главное меню → режим → главное меню) удалял
+карточку и присылал новую: два запроса к Bot API плюс загрузка
+картинки. `show()` редактирует сообщение, на кнопку которого нажали:
+
+* та же обложка уже на экране (`images.is_shown`) —
+  `edit_message_caption`, без медиа вовсе;
+* другая обложка — `edit_message_media` с `file_id` (или байтами,
+  если обложка ещё ни разу не отправлялась);
+* команда (`/start`, `/gpt`, …), текстовое сообщение (ответ ChatGPT,
+  результат квиза) или Telegram отказал в редактировании
+  (сообщение старше 48 ч и т. п.) — как раньше: удалить и прислать
+  новое.
+
+Счётчики `nav.edited` / `nav.resent` в `services.metrics` показывают,
+какая доля переходов обходится одним запросом.
+"""
+
+from __future__ import annotations
+import logging
+from typing import Optional
+
+from telegram import InputMediaPhoto, Message, Update
+from telegram.error import BadRequest, TelegramError
+
+from services import images, metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def show(update: Update, path: str, caption: str,
+               reply_markup=None, *, parse_mode: Optional[str] = None) -> Message:
+    """
+        Показать экран: отредактировать текущее сообщение или прислать новое.
+
+        Parameters
+        ----------
+        update : telegram.Update
+            Команда или callback, инициировавший переход. Callback-query
+            должен быть уже подтверждён (`answer()`) вызывающим кодом.
+        path : str
+            Обложка экрана (`images/*.jpg`).
+        caption : str
+            Подпись под обложкой.
+        reply_markup : telegram.InlineKeyboardMarkup, optional
+            Клавиатура экрана.
+        parse_mode : str, optional
+            Режим разметки подписи.
+
+        Returns
+        -------
+        telegram.Message
+            Сообщение, на котором теперь показан экран.
+    """
+    query = update.callback_query
+    message = query.message if query else None
+
+    if message is not None and message.photo:
+        try:
+            if images.is_shown(message, path):
+                edited = await query.edit_message_caption(
+                    caption, reply_markup=reply_markup, parse_mode=parse_mode,
+                )
+            else:
+                edited = await query.edit_message_media(
+                    InputMediaPhoto(images.cover(path), caption=caption,
+                                    parse_mode=parse_mode),
+                    reply_markup=reply_markup,
+                )
+                if isinstance(edited, Message):
+                    images.remember(path, edited)
+            metrics.inc("nav.edited")
+            return edited if isinstance(edited, Message) else message
+        except BadRequest as exc:
+            if "not modified" in str(exc).lower():
+                return message
+            logger.info("Edit-in-place failed, resending: %s", exc)
+
+    if message is not None:
+        try:
+            await message.delete()
+        except TelegramError:
+            pass
+    metrics.inc("nav.resent")
+    return await images.send_cover(
+        update.effective_message.reply_photo, path,
+        caption=caption, reply_markup=reply_markup, parse_mode=parse_mode,
+    )
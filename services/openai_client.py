@@ -6,39 +6,149 @@ services.openai_client
 скрывает все детали сетевого обращения и отдаёт готовые строки для
 Telegram-бота.
 
-Содержит четыре утилиты высокого уровня:
+Содержит пять утилит высокого уровня:
 
 * **ask_chatgpt** — универсальный запрос/ответ к ChatGPT;
 * **get_random_fact** — короткий «эмодзи + научный факт»;
 * **get_week_menu** — недельное меню на N ккал с готовым списком покупок;
-* **get_quiz_question** — один JSON-вопрос викторины.
+* **get_quiz_question** — один JSON-вопрос викторины;
+* **translate_many** — перевод одного текста сразу на несколько языков
+  (один структурированный запрос или параллельные запросы для длинных
+  текстов) с кэшем переводов по языкам.
+
+Недельные меню и переводы дополнительно сохраняются на диск
+(`services.store`) и переживают перезапуск; повтор из хранилища
+не обращается к OpenAI и не расходует квоту. Факты не сохраняются —
+они должны быть случайными.
+
+Модель, температура, бюджет длины ответа (`max_tokens`, его можно
+переопределить на вызов) и число дозапросов при обрыве ответа по лимиту
+выбираются по **задаче**
+(`fact`, `quiz`, `translate`, `menu`, `chat`, `persona`) из реестра
+`services.model_router`; там же — запасные модели и переключение
+на более быструю модель при превышении бюджета p95. Фактический расход
+токенов против бюджета и число обрывов пишутся в `services.metrics`.
+
+Одновременных запросов не больше лимита `services.gate`; слоты
+раздаются по полосам приоритета: диалоги впереди меню и переводов,
+фоновое заполнение кэшей — после всех. Сам лимит подстраивается
+под задержку ответов, 429 и таймауты OpenAI (AIMD).
+
+Если передан `user_id`, запрос сначала проходит квоты и ограничение
+частоты `services.usage` (иначе — `QuotaExceeded` без обращения
+к OpenAI), а `resp.usage` учитывается за пользователем и задачей.
 
 Все функции ничего не знают о Telegram, поэтому легко тестируются.
 """
 
 from __future__ import annotations
-import os, json, logging
-from typing import Any, Dict, List, Tuple
+import os, logging, time, asyncio, hashlib, re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import openai
 
+from services import metrics, model_router, profiler, runtime, store, usage, validate
+from services.gate import gate, lane_for
+
 load_dotenv()
 _API_KEY = os.getenv("CHATGPT_TOKEN", "")
 if not _API_KEY:
     raise RuntimeError("CHATGPT_TOKEN не найден в .env")
 
 client = openai.AsyncOpenAI(api_key=_API_KEY)
-_MODEL = "gpt-3.5-turbo"
+_MODEL = model_router.DEFAULT_MODEL
 
 logger = logging.getLogger(__name__)
 
 
+_CONTINUE = "Продолжи ровно с того места, где остановился, без повторов."
+
+
+def in_flight() -> int:
+    """Сколько живых (не фоновых) запросов к OpenAI выполняется или ждёт слота."""
+    return gate.live()
+
+
+_OVERLOAD = (openai.RateLimitError, openai.APITimeoutError)
+
+
+def _observe(task: str, model: str, started: float,
+             exc: Optional[Exception] = None, resp: Any = None) -> None:
+    elapsed = time.monotonic() - started
+    profiler.note("openai", f"{task}:{model}", elapsed)
+    if exc is None:
+        model_router.observe(task, model, elapsed)
+        spent = getattr(resp, "usage", None)
+        gate.observe(task, started, elapsed,
+                     tokens=getattr(spent, "completion_tokens", None))
+    elif isinstance(exc, _OVERLOAD):
+        gate.observe(task, started, elapsed, overload=True)
+
+
+async def _complete(messages: List[Dict[str, Any]], *, task: str, lane: str,
+                    model: Optional[str], params: Dict[str, Any]) -> Any:
+    """Один запрос к OpenAI в слоте полосы `lane` (`services.gate`)."""
+    async with gate.slot(lane):
+        return await _complete_chain(messages, task=task, model=model, params=params)
+
+
+async def _complete_chain(messages: List[Dict[str, Any]], *, task: str,
+                          model: Optional[str], params: Dict[str, Any]) -> Any:
+    """Перебор цепочки моделей задачи."""
+    last_exc: Exception | None = None
+    for name in [model] if model else model_router.route(task):
+        started = time.monotonic()
+        try:
+            resp = await client.chat.completions.create(
+                model=name,
+                messages=messages,
+                **params,
+            )
+        except Exception as exc:                     # noqa: BLE001
+            _observe(task, name, started, exc)
+            logger.warning("OpenAI %s (%s) failed: %s", name, task, exc)
+            last_exc = exc
+            continue
+        _observe(task, name, started, resp=resp)
+        return resp
+
+    logger.error("OpenAI request failed for task %s: %s", task, last_exc)
+    raise RuntimeError("Не удалось получить ответ от ChatGPT") from last_exc
+
+
+def _record_usage(task: str, resp: Any, budget: Optional[int],
+                  user_id: Optional[int], requests: int = 1) -> None:
+    """Телеметрия и учёт: фактические токены против бюджета `max_tokens`.
+
+    `requests=0` — дозапрос продолжения: квоте запросов он не стоит.
+    """
+    finish = resp.choices[0].finish_reason or "unknown"
+    metrics.inc("openai.requests", task=task, finish=finish)
+    spent = getattr(resp, "usage", None)
+    if spent is None:
+        usage.record(user_id, task, 0, 0, requests=requests)
+        return
+    usage.record(user_id, task, spent.prompt_tokens, spent.completion_tokens,
+                 requests=requests)
+    metrics.observe("openai.prompt_tokens", spent.prompt_tokens, task=task)
+    metrics.observe("openai.completion_tokens", spent.completion_tokens, task=task)
+    if budget:
+        metrics.observe("openai.budget_used", spent.completion_tokens / budget, task=task)
+
+
 async def ask_chatgpt(
     user_text: str,
     *,
     system_prompt: str | None = None,
-    temperature: float = 0.8,
-    model: str = _MODEL,
+    temperature: Optional[float] = None,
+    model: Optional[str] = None,
+    task: str = "chat",
+    max_tokens: Optional[int] = None,
+    continuations: Optional[int] = None,
+    user_id: Optional[int] = None,
+    lane: Optional[str] = None,
+    requests: int = 1,
 ) -> str:
     """Отправить запрос в ChatGPT и вернуть сырой ответ.
 
@@ -51,58 +161,126 @@ async def ask_chatgpt(
         Если `None`, контекст не устанавливается.
     temperature:
         Степень стохастичности (0 = максимально детерминированный
-        ответ, 1 и выше — более креативный).
+        ответ, 1 и выше — более креативный). `None` — из профиля задачи.
     model:
-        Идентификатор модели OpenAI; по умолчанию *gpt-3.5-turbo*.
+        Идентификатор модели OpenAI. Если задан, маршрутизация и
+        запасные модели не используются.
+    task:
+        Имя профиля в `services.model_router` (`chat` по умолчанию):
+        определяет цепочку моделей, `max_tokens` и температуру.
+    max_tokens:
+        Бюджет длины ответа для этого вызова; `None` — из профиля,
+        `0` — без ограничения.
+    continuations:
+        Сколько раз дозапросить продолжение, если ответ оборван по
+        лимиту (`finish_reason == "length"`); `None` — из профиля.
+    user_id:
+        Telegram-id пользователя, от имени которого идёт запрос:
+        проверка квот и учёт токенов в `services.usage`.
+    lane:
+        Полоса приоритета в `services.gate` (`interactive`, `bulk`,
+        `background`); `None` — по задаче и наличию `user_id`.
+    requests:
+        Сколько запросов пользователя засчитать вызову. `0` — вызов
+        входит в действие, квоты которого вызывающий код уже проверил
+        и сам учтёт запросом (`translate_many`): `usage.check`
+        не повторяется, учитываются только токены.
 
     Returns
     -------
     str
-        Содержимое первого choices[].message.content без
-        начальных/конечных пробелов.
+        Содержимое первого choices[].message.content (вместе с
+        продолжениями) без начальных/конечных пробелов.
 
     Raises
     ------
+    QuotaExceeded
+        Пользователь исчерпал квоту или слишком часто обращается
+        к ChatGPT; запрос в OpenAI не отправлялся.
     RuntimeError
-        Оборачивает оригинальное исключение SDK, чтобы
+        Оборачивает исключение SDK последней модели цепочки, чтобы
         вызывающий код мог единообразно обработать ошибку.
     """
+    stamp = usage.check(user_id, task) if requests else None
+    lane = lane or lane_for(task, user_id)
     messages: List[Dict[str, Any]] = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
     messages.append({"role": "user", "content": user_text})
 
+    profile = model_router.profile(task)
+    budget = profile.max_tokens if max_tokens is None else max_tokens
+    rounds = profile.continuations if continuations is None else continuations
+    params: Dict[str, Any] = {
+        "temperature": profile.temperature if temperature is None else temperature,
+    }
+    if budget:
+        params["max_tokens"] = budget
+
+    parts: List[str] = []
     try:
-        resp = await client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=messages,
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as exc:                         # noqa: BLE001
-        logger.exception("OpenAI request failed: %s", exc)
-        raise RuntimeError("Не удалось получить ответ от ChatGPT") from exc
-
-async def get_random_fact() -> str:
+        while True:
+            resp = await _complete(messages, task=task, lane=lane, model=model, params=params)
+            _record_usage(task, resp, budget, user_id, requests=0 if parts else requests)
+            choice = resp.choices[0]
+            text = choice.message.content or ""
+            parts.append(text)
+            if choice.finish_reason != "length":
+                break
+            metrics.inc("openai.truncated", task=task)
+            if rounds <= 0:
+                logger.info("OpenAI answer for %s truncated at %s tokens", task, budget)
+                break
+            rounds -= 1
+            messages = messages + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": _CONTINUE},
+            ]
+    except BaseException:
+        usage.refund(user_id, task, stamp)
+        raise
+    return "".join(parts).strip()
+
+
+async def get_random_fact(*, user_id: Optional[int] = None) -> str:
     """Вернуть одну научную «факт-строку» с эмодзи в начале.
 
-        Использует `ask_chatgpt()` с слегка увеличенной temperature,
-        чтобы получать более разнообразные результаты.
+        Использует профиль `fact`: слегка увеличенная temperature для
+        разнообразия и короткий `max_tokens`.
     """
     return await ask_chatgpt(
         "Приведи один интересный научный факт одной строкой, "
         "начав с подходящего emoji.",
-        temperature=0.95,
+        task="fact", user_id=user_id,
     )
 
 
-async def get_week_menu(kcal: int) -> str:
+def menu_prompt(kcal: int) -> str:
+    """Промпт недельного меню на `kcal` ккал/день (он же ключ в `services.store`)."""
+    return (
+        f"Составь ПОЛНОЕ меню на 7 дней (обозначения дней: Пн, Вт, Ср, Чт, Пт, Сб, Вс) "
+        f"около {kcal} ккал/день.\n"
+        "На каждый день пять приёмов пищи: Завтрак, Перекус, Обед, Полдник, Ужин.\n"
+        "Формат вывода строго такой:\n"
+        "*Меню* (~ XXXX ккал/день)\n\n"
+        "Пн\n• Завтрак: блюдо – 250 г ≈ XXX ккал\n"
+        "… (и т.д. для Перекуса, Обеда, Полдника, Ужина)\n\n"
+        "Вт\n• …\n…\n\n"
+        "(и так далее до Вс)\n\n"
+        "*Список покупок*\n— продукт: количество (шт/кг)\n\n"
+        "Без пояснений и лишних символов. Включи все 7 дней."
+    )
+
+
+async def get_week_menu(kcal: int, *, user_id: Optional[int] = None) -> str:
     """Сгенерировать полное 7-дневное меню с лимитом калорий.
 
         Parameters
         ----------
         kcal:
             Целевой суточный лимит (± небольшая погрешность).
+        user_id:
+            Пользователь для квот и учёта (`services.usage`).
 
         Returns
         -------
@@ -114,31 +292,36 @@ async def get_week_menu(kcal: int) -> str:
         -----
         * Формат ответа строго задаётся промптом, поэтому парсинг
           не понадобится — можно сразу отправлять в Telegram.
-        * Температура снижена до 0.65, чтобы меню было реалистичным.
+        * Профиль `menu`: температура снижена до 0.65, чтобы меню было
+          реалистичным, и большой `max_tokens` под 7 дней.
+        * Пропущенные дни восполняются локально (`services.validate.menu`),
+          без повторного запроса.
+        * Меню на ту же калорийность повторяется из `services.store`
+          в пределах TTL пространства `menu` (по умолчанию сутки).
     """
-    prompt = (
-        f"Составь ПОЛНОЕ меню на 7 дней (обозначения дней: Пн, Вт, Ср, Чт, Пт, Сб, Вс) "
-        f"около {kcal} ккал/день.\n"
-        "На каждый день пять приёмов пищи: Завтрак, Перекус, Обед, Полдник, Ужин.\n"
-        "Формат вывода строго такой:\n"
-        "*Меню* (~ XXXX ккал/день)\n\n"
-        "Пн\n• Завтрак: блюдо – 250 г ≈ XXX ккал\n"
-        "… (и т.д. для Перекуса, Обеда, Полдника, Ужина)\n\n"
-        "Вт\n• …\n…\n\n"
-        "(и так далее до Вс)\n\n"
-        "*Список покупок*\n— продукт: количество (шт/кг)\n\n"
-        "Без пояснений и лишних символов. Включи все 7 дней."
-    )
-    return await ask_chatgpt(prompt, temperature=0.65)
+    prompt = menu_prompt(kcal)
+    cached = await store.get("menu", prompt)
+    if cached is not None:
+        return cached
+    menu = validate.menu(await ask_chatgpt(prompt, task="menu", user_id=user_id))
+    await store.put("menu", menu, prompt)
+    return menu
 
 
-async def get_quiz_question(topic_ru: str) -> Tuple[str, List[str], int]:
+async def get_quiz_question(topic_ru: str, *, strict: bool = False,
+                            user_id: Optional[int] = None) -> Tuple[str, List[str], int]:
     """Сгенерировать один вопрос викторины по заданной теме.
 
         Parameters
         ----------
         topic_ru:
             Тема на русском («История», «Наука», …).
+        strict:
+            Если `True`, некорректный ответ модели приводит к
+            `ValueError` вместо заглушки — так поступает
+            `services.quiz_bank`, чтобы не сохранять мусор в банк.
+        user_id:
+            Пользователь для квот и учёта (`services.usage`).
 
         Returns
         -------
@@ -149,7 +332,10 @@ async def get_quiz_question(topic_ru: str) -> Tuple[str, List[str], int]:
             * `options` — список из трёх вариантов ответа;
             * `right_index` — номер правильного варианта (0-2).
 
-            При ошибке JSON-парсинга возвращается заглушка
+            Ответ разбирается и по возможности чинится локально
+            (`services.validate.quiz`: JSON в ```-блоке, ответ буквой
+            или текстом, лишние варианты). Если починить не удалось
+            (и `strict=False`), возвращается заглушка
             «Ошибка генерации вопроса» + три тривиальных варианта, 0.
     """
     prompt = (
@@ -159,10 +345,151 @@ async def get_quiz_question(topic_ru: str) -> Tuple[str, List[str], int]:
         '{ "q": "вопрос", "options": ["A","B","C"], "answer": N }\n'
         "где N — индекс правильного варианта (0-2). Без комментариев."
     )
-    raw = await ask_chatgpt(prompt, temperature=0.85)
+    raw = await ask_chatgpt(prompt, task="quiz", user_id=user_id)
     try:
-        data = json.loads(raw)
-        return data["q"], data["options"], int(data["answer"])
-    except Exception as exc:                          # noqa: BLE001
+        return validate.quiz(raw)
+    except ValueError as exc:
         logger.warning("Bad quiz JSON: %s / %s", raw, exc)
+        if strict:
+            raise ValueError("Некорректный вопрос от ChatGPT") from exc
         return "Ошибка генерации вопроса.", ["1", "2", "3"], 0
+
+
+# ───────────────────────────── переводы ─────────────────────────────
+
+# Тексты длиннее порога переводятся параллельными запросами по языкам:
+# один JSON с несколькими длинными переводами генерируется дольше,
+# чем самый длинный из них по отдельности.
+_FANOUT_CHARS = int(os.getenv("TRANSLATE_FANOUT_CHARS", "600"))
+_TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "2048"))
+_translations: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
+
+
+def _translation_key(lang: str, text: str) -> Tuple[str, bytes]:
+    return lang, hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _cache_translation(lang: str, text: str, translation: str) -> None:
+    _translations[_translation_key(lang, text)] = translation
+    while len(_translations) > _TRANSLATION_CACHE_SIZE:
+        _translations.popitem(last=False)
+
+
+# Перевод не длиннее исходника: ~1 токен на символ с запасом — верхняя
+# оценка даже для китайского; потолок — на каждый язык (длинный текст
+# доберёт дозапрос профиля `translate`).
+_BUDGET_BASE, _BUDGET_CAP = 32, 1500
+
+
+def translation_budget(text: str, langs: int = 1) -> int:
+    """Бюджет `max_tokens` для перевода `text` на `langs` языков:
+    `min(_BUDGET_CAP, 32 + len(text))` на каждый язык."""
+    return langs * min(_BUDGET_CAP, _BUDGET_BASE + len(text))
+
+
+async def _translate_one(text: str, lang: str, user_id: Optional[int]) -> str:
+    prompt = (
+        f"Переведи следующий текст на {lang} без добавления пояснений.\n\n"
+        f"Текст: «{text}»"
+    )
+    return await ask_chatgpt(prompt, task="translate", user_id=user_id,
+                             max_tokens=translation_budget(text), requests=0)
+
+
+async def _translate_batch(text: str, targets: Dict[str, str],
+                           user_id: Optional[int]) -> Dict[str, str]:
+    keys = ", ".join(f'"{code}": "перевод на {lang}"' for code, lang in targets.items())
+    prompt = (
+        "Переведи текст сразу на несколько языков без пояснений.\n"
+        "Верни строго JSON-объект без комментариев и markdown:\n"
+        f"{{{keys}}}\n\n"
+        f"Текст: «{text}»"
+    )
+    raw = await ask_chatgpt(prompt, task="translate", user_id=user_id,
+                            max_tokens=translation_budget(text, len(targets)),
+                            requests=0)
+    match = re.search(r"\{.*\}", raw, re.S)
+    try:
+        data = runtime.loads(match.group(0) if match else raw)
+    except ValueError:
+        logger.warning("Bad batch translation JSON: %s", raw)
+        return {}
+    return {code: str(data[code]).strip() for code in targets
+            if isinstance(data, dict) and data.get(code)}
+
+
+async def translate_many(text: str, targets: Dict[str, str], *,
+                         user_id: Optional[int] = None) -> Dict[str, str]:
+    """Перевести `text` на все языки `targets` за один проход.
+
+    Parameters
+    ----------
+    text:
+        Исходный текст.
+    targets:
+        `{код: название языка}` в нужном порядке, например
+        `{"lang_en": "английский", "lang_es": "испанский"}`.
+    user_id:
+        Пользователь для квот и учёта (`services.usage`); переводы
+        из кэша квоту не расходуют.
+
+    Returns
+    -------
+    dict[str, str]
+        `{код: перевод}` в порядке `targets`.
+
+    Notes
+    -----
+    * Уже переведённое берётся из кэша в памяти (ключ — язык + хэш
+      текста), затем из `services.store`.
+    * Несколько языков для короткого текста — один JSON-запрос;
+      для длинного текста или если JSON не удалось разобрать —
+      параллельные запросы по языкам.
+    * Все новые переводы попадают в кэш и в `services.store`.
+    * Квоты `services.usage` проверяются один раз на вызов, и он
+      считается одним запросом пользователя, сколько бы запросов
+      к OpenAI ни понадобилось.
+    """
+    result: Dict[str, str] = {}
+    missing: Dict[str, str] = {}
+    for code, lang in targets.items():
+        cached = _translations.get(_translation_key(lang, text))
+        if cached is None:
+            missing[code] = lang
+        else:
+            _translations.move_to_end(_translation_key(lang, text))
+            result[code] = cached
+    for code, lang in list(missing.items()):
+        stored = await store.get("translate", lang, text)
+        if stored is not None:
+            result[code] = stored
+            _cache_translation(missing.pop(code), text, stored)
+    fresh: Dict[str, str] = {}
+    if not missing:
+        return {code: result[code] for code in targets}
+
+    stamp = usage.check(user_id, "translate")
+    try:
+        if len(missing) > 1 and len(text) <= _FANOUT_CHARS:
+            batch = await _translate_batch(text, missing, user_id)
+            for code, translation in batch.items():
+                result[code] = translation
+                fresh[code] = missing[code]
+                _cache_translation(missing.pop(code), text, translation)
+
+        if missing:
+            translations = await asyncio.gather(
+                *(_translate_one(text, lang, user_id) for lang in missing.values())
+            )
+            for (code, lang), translation in zip(missing.items(), translations):
+                result[code] = translation
+                fresh[code] = lang
+                _cache_translation(lang, text, translation)
+    except BaseException:
+        usage.refund(user_id, "translate", stamp)
+        raise
+    usage.record(user_id, "translate", 0, 0)
+
+    for code, lang in fresh.items():
+        await store.put("translate", result[code], lang, text)
+    return {code: result[code] for code in targets}
@@ -0,0 +1,302 @@
+"""
+services.profiler
+=================
+
+Профилирование работающего бота по запросу (команда `/profile`
+в `handlers.admin`).
+
+Когда бот «тормозит», неясно, куда уходит время: на ожидание OpenAI,
+на Bot API или на CPU (JSON, сборку клавиатур). `run(app, seconds)`
+на заданное время включает сбор и возвращает текстовый отчёт:
+
+* **задержка event loop** — таймер на 10 мс, насколько позже он
+  срабатывает (p50/p95/p99/max);
+* **CPU** — фоновый поток раз в `PROFILE_SAMPLE_MS` мс (по умолчанию 5)
+  снимает стек потока event loop (`sys._current_frames`): доля сэмплов
+  вне `select()` — занятость цикла, а самые частые функции — сырые
+  (листовые) и ближайшие из кода бота;
+* **по обработчикам** — на время профиля колбэки обработчиков PTB
+  оборачиваются таймером, метка — как в `services.replay`
+  (`cmd:/start`, `cb:quiz_ans`, `text`);
+* **OpenAI и Bot API** — длительность каждого `chat.completions.create`
+  (`services.openai_client`, по задаче и модели) и каждого метода
+  Bot API (`TimedRequest`), плюс десять самых долгих вызовов;
+* **точки ожидания** — раз в 100 мс по всем задачам asyncio:
+  на каком `await` своего кода и какой библиотеки задача стоит.
+  Сумма — в «задаче-секундах».
+
+Вне профиля ничего не включено: поток и таймер не запущены, колбэки
+не обёрнуты, а `note()` и `TimedRequest` сводятся к проверке `None`.
+"""
+
+from __future__ import annotations
+import asyncio
+import heapq
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, BaseHandler, ConversationHandler
+from telegram.request import BaseRequest, RequestData
+
+from services.metrics import Histogram
+from services.runtime import JSONRequest
+from services.router import split_callback
+
+MAX_SECONDS = 300
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_MS", "5")) / 1000
+_TICK = 0.01                    # шаг таймера задержки цикла
+_TASK_EVERY = 10                # снимать задачи каждые N шагов (100 мс)
+_TOP = 15
+
+_ROOT = str(Path(__file__).resolve().parent.parent)
+_IDLE = {"select", "poll", "control"}       # ожидание в selectors.*
+
+
+def _own(filename: str) -> bool:
+    return filename.startswith(_ROOT) and "site-packages" not in filename
+
+
+def where(frame) -> str:
+    """`путь:строка функция` для кадра (путь — от корня бота, если он свой)."""
+    path = frame.f_code.co_filename
+    if _own(path):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        path = "/".join(Path(path).parts[-2:])
+    return f"{path}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+def own_frame(frame):
+    """Ближайший к вершине стека кадр из кода бота (или `None`)."""
+    while frame is not None and not _own(frame.f_code.co_filename):
+        frame = frame.f_back
+    return frame
+
+
+def label(update: object) -> str:
+    """Метка обработчика: `cmd:/x`, `cb:<префикс>` или `text`."""
+    if not isinstance(update, Update):
+        return type(update).__name__
+    if update.callback_query:
+        return "cb:" + split_callback(update.callback_query.data or "")[0]
+    message = update.effective_message
+    text = (message.text if message else None) or ""
+    if text.startswith("/"):
+        return "cmd:" + text.split()[0].split("@")[0]
+    return "text"
+
+
+class Profile:
+    """Данные одного профиля."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.started = time.perf_counter()
+        self.timings: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.slowest: List[Tuple[float, str]] = []
+        self.lag = Histogram()
+        self.cpu_samples = 0
+        self.idle_samples = 0
+        self.cpu_leaf: Counter = Counter()
+        self.cpu_own: Counter = Counter()
+        self.task_samples = 0
+        self.awaits: Counter = Counter()
+
+    def note(self, kind: str, name: str, seconds: float) -> None:
+        ms = seconds * 1000
+        self.timings[kind, name].observe(ms)
+        item = (ms, f"{kind} {name}")
+        if len(self.slowest) < 10:
+            heapq.heappush(self.slowest, item)
+        elif ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def sample_cpu(self, thread_id: int) -> None:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            return
+        self.cpu_samples += 1
+        code = frame.f_code
+        if code.co_name in _IDLE and code.co_filename.endswith("selectors.py"):
+            self.idle_samples += 1
+            return
+        self.cpu_leaf[where(frame)] += 1
+        own = own_frame(frame)
+        if own is not None:
+            self.cpu_own[where(own)] += 1
+
+    def sample_tasks(self) -> None:
+        self.task_samples += 1
+        current = asyncio.current_task()
+        for task in asyncio.all_tasks():
+            if task is current:
+                continue
+            leaf = own = None
+            coro = task.get_coro()
+            while coro is not None:
+                frame = (getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+                         or getattr(coro, "ag_frame", None))
+                if frame is None:
+                    break
+                leaf = frame
+                if _own(frame.f_code.co_filename):
+                    own = frame
+                coro = (getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+                        or getattr(coro, "ag_await", None))
+            if leaf is not None:
+                key = where(leaf) if own in (None, leaf) else f"{where(own)} → {where(leaf)}"
+                self.awaits[key] += 1
+
+    def report(self) -> str:
+        """Текстовый отчёт."""
+        elapsed = time.perf_counter() - self.started
+        busy = self.cpu_samples - self.idle_samples
+        lag = self.lag.summary()
+        lines = [
+            f"Профиль за {elapsed:.1f} с",
+            f"Event loop занят {busy / max(self.cpu_samples, 1):.0%} "
+            f"({self.cpu_samples} сэмплов по {SAMPLE_INTERVAL * 1000:.0f} мс); "
+            f"задержка таймера, мс: p50 {lag['p50']:.1f}, p95 {lag['p95']:.1f}, "
+            f"p99 {lag['p99']:.1f}, max {lag['max']:.1f}",
+        ]
+        titles = {"handler": "Обработчики", "openai": "OpenAI (задача:модель)",
+                  "bot": "Bot API"}
+        for kind, title in titles.items():
+            rows = sorted(((name, h) for (k, name), h in self.timings.items() if k == kind),
+                          key=lambda item: -item[1].total)
+            lines += ["", f"{title}, мс", f"{'':<32}{'count':>7}{'p50':>9}{'p95':>9}"
+                                           f"{'max':>9}{'всего, с':>11}"]
+            lines += [f"{name:<32}{h.count:>7}{h.percentile(0.5):>9.0f}"
+                      f"{h.percentile(0.95):>9.0f}{h.max:>9.0f}{h.total / 1000:>11.1f}"
+                      for name, h in rows] or ["—"]
+        lines += ["", "Самые долгие вызовы, мс"]
+        lines += [f"{ms:>9.0f}  {what}" for ms, what in sorted(self.slowest, reverse=True)] or ["—"]
+        for title, counter in (("CPU: код бота", self.cpu_own),
+                               ("CPU: листовые функции", self.cpu_leaf)):
+            lines += ["", f"{title}, % занятых сэмплов"]
+            lines += [f"{n * 100 / max(busy, 1):>6.1f}%  {place}"
+                      for place, n in counter.most_common(_TOP)] or ["—"]
+        lines += ["", "Точки ожидания задач, задача·с"]
+        step = _TICK * _TASK_EVERY
+        lines += [f"{n * step:>8.1f}  {place}"
+                  for place, n in self.awaits.most_common(_TOP)] or ["—"]
+        return "\n".join(lines)
+
+
+_profile: Optional[Profile] = None
+
+
+def running() -> bool:
+    """Идёт ли сейчас профиль."""
+    return _profile is not None
+
+
+def note(kind: str, name: str, seconds: float) -> None:
+    """Учесть длительность вызова, если идёт профиль (иначе ничего)."""
+    if _profile is not None:
+        _profile.note(kind, name, seconds)
+
+
+def _timed(callback: Callable) -> Callable:
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            note("handler", label(update), time.perf_counter() - started)
+    return wrapper
+
+
+def _wrap_handlers(app: Application) -> Callable[[], None]:
+    """Обернуть колбэки обработчиков таймером; вернуть функцию отката."""
+    wrapped: Dict[int, Tuple[BaseHandler, Callable]] = {}
+
+    def visit(handler: BaseHandler) -> None:
+        if isinstance(handler, ConversationHandler):
+            for inner in (*handler.entry_points, *handler.fallbacks,
+                          *(h for hs in handler.states.values() for h in hs)):
+                visit(inner)
+        elif handler.callback is not None and id(handler) not in wrapped:
+            wrapped[id(handler)] = (handler, handler.callback)
+            handler.callback = _timed(handler.callback)
+
+    for group, handlers in app.handlers.items():
+        if group >= 0:
+            for handler in handlers:
+                visit(handler)
+
+    def restore() -> None:
+        for handler, callback in wrapped.values():
+            handler.callback = callback
+    return restore
+
+
+async def run(app: Application, seconds: float) -> str:
+    """Снять профиль за `seconds` секунд и вернуть отчёт.
+
+    Raises
+    ------
+    RuntimeError
+        Профиль уже идёт.
+    """
+    global _profile
+    if _profile is not None:
+        raise RuntimeError("profile is already running")
+    profile = _profile = Profile(min(seconds, MAX_SECONDS))
+    restore = _wrap_handlers(app)
+    stop = threading.Event()
+    loop_thread = threading.get_ident()
+
+    def sampler() -> None:
+        while not stop.wait(SAMPLE_INTERVAL):
+            profile.sample_cpu(loop_thread)
+
+    thread = threading.Thread(target=sampler, name="profiler", daemon=True)
+    thread.start()
+    try:
+        deadline = time.perf_counter() + profile.seconds
+        last = time.perf_counter()
+        ticks = 0
+        while last < deadline:
+            await asyncio.sleep(_TICK)
+            now = time.perf_counter()
+            profile.lag.observe((now - last - _TICK) * 1000)
+            last = now
+            ticks += 1
+            if ticks % _TASK_EVERY == 0:
+                profile.sample_tasks()
+    finally:
+        stop.set()
+        restore()
+        _profile = None
+        await asyncio.to_thread(thread.join)
+    return profile.report()
+
+
+class TimedRequest(JSONRequest):
+    """`JSONRequest`, замеряющий методы Bot API, пока идёт профиль."""
+
+    __slots__ = ()
+
+    async def do_request(self, url: str, method: str,
+                         request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        profile = _profile
+        if profile is None:
+            return await super().do_request(url, method, request_data, read_timeout,
+                                            write_timeout, connect_timeout, pool_timeout)
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, read_timeout,
+                                            write_timeout, connect_timeout, pool_timeout)
+        finally:
+            profile.note("bot", url.rsplit("/", 1)[-1], time.perf_counter() - started)
@@ -0,0 +1,265 @@
+"""
+services.quiz_bank
+==================
+
+Локальный банк вопросов для `/quiz` и гибридная выдача «банк + ChatGPT».
+
+* Хранилище — таблица `quiz_bank` в SQLite (`services.db`) с индексом
+  `(topic, difficulty)` и уникальным отпечатком текста вопроса,
+  поэтому повторы не накапливаются.
+* Банк пополняется **только** принятыми ответами модели: JSON прошёл
+  проверку схемы в `get_quiz_question(strict=True)`.
+* При первом обращении банк целиком поднимается в память
+  (`topic, difficulty → список вопросов`), дальше выдача — это
+  `random.choice` без обращения к диску.
+
+Политика выдачи (`serve`)
+-------------------------
+* С вероятностью `QUIZ_FRESH_RATIO` (по умолчанию 0.2) или если банк
+  по теме пуст — запрашиваем свежий вопрос у ChatGPT.
+* Если ChatGPT не уложился в `QUIZ_LLM_TIMEOUT` секунд, а в банке
+  есть вопросы, отдаём вопрос из банка; генерация доезжает в фоне
+  и пополняет банк.
+* Если ChatGPT недоступен или квота пользователя исчерпана — отдаём
+  вопрос из банка; если и банк пуст, исключение (в том числе
+  `QuotaExceeded`) получает вызывающий код.
+
+Прогрев офлайн
+--------------
+    python -m services.quiz_bank warm hist История 50
+    python -m services.quiz_bank import questions.jsonl
+    python -m services.quiz_bank stats
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from services import lifecycle, runtime
+from services.db import db
+from services.openai_client import get_quiz_question
+
+logger = logging.getLogger(__name__)
+
+FRESH_RATIO = float(os.getenv("QUIZ_FRESH_RATIO", "0.2"))
+LLM_TIMEOUT = float(os.getenv("QUIZ_LLM_TIMEOUT", "6"))
+
+QuizItem = Tuple[str, List[str], int]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_bank (
+    id         INTEGER PRIMARY KEY,
+    topic      TEXT    NOT NULL,
+    difficulty INTEGER NOT NULL DEFAULT 1,
+    question   TEXT    NOT NULL,
+    options    TEXT    NOT NULL,
+    answer     INTEGER NOT NULL,
+    digest     BLOB    NOT NULL UNIQUE,
+    created    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quiz_bank_topic ON quiz_bank (topic, difficulty);
+"""
+
+_cache: Dict[Tuple[str, int], List[QuizItem]] = defaultdict(list)
+_digests: Set[bytes] = set()
+_loaded = False
+_load_lock = asyncio.Lock()
+
+
+def _digest(question: str) -> bytes:
+    return hashlib.blake2b(" ".join(question.lower().split()).encode(),
+                           digest_size=16).digest()
+
+
+def _load_all(conn: sqlite3.Connection) -> List[tuple]:
+    db.ensure_schema("quiz_bank", _SCHEMA)
+    return conn.execute(
+        "SELECT topic, difficulty, question, options, answer, digest FROM quiz_bank"
+    ).fetchall()
+
+
+def _insert(conn: sqlite3.Connection, topic: str, difficulty: int,
+            item: QuizItem, digest: bytes) -> bool:
+    db.ensure_schema("quiz_bank", _SCHEMA)
+    question, options, answer = item
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO quiz_bank "
+        "(topic, difficulty, question, options, answer, digest, created) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (topic, difficulty, question, json.dumps(options, ensure_ascii=False),
+         answer, digest, int(time.time())),
+    )
+    return cur.rowcount > 0
+
+
+async def load() -> int:
+    """Поднять банк в память (повторные вызовы бесплатны).
+
+    Returns
+    -------
+    int
+        Количество вопросов в банке.
+    """
+    global _loaded
+    async with _load_lock:
+        if not _loaded:
+            for topic, difficulty, question, options, answer, digest in await db.call(_load_all):
+                _cache[(topic, difficulty)].append((question, runtime.loads(options), answer))
+                _digests.add(digest)
+            _loaded = True
+            logger.info("Quiz bank loaded: %d questions", len(_digests))
+    return len(_digests)
+
+
+async def add(topic: str, item: QuizItem, difficulty: int = 1) -> bool:
+    """Сохранить принятый вопрос в банк.
+
+    Returns
+    -------
+    bool
+        `True`, если вопрос новый; `False`, если такой уже есть.
+    """
+    await load()
+    digest = _digest(item[0])
+    if digest in _digests:
+        return False
+    _digests.add(digest)
+    _cache[(topic, difficulty)].append(item)
+    try:
+        return await db.call(_insert, topic, difficulty, item, digest)
+    except Exception as exc:                          # noqa: BLE001
+        logger.warning("Quiz bank insert failed: %s", exc)
+        return False
+
+
+async def pick(topic: str, difficulty: int = 1) -> Optional[QuizItem]:
+    """Случайный вопрос из банка или `None`, если по теме пусто."""
+    await load()
+    items = _cache.get((topic, difficulty))
+    return random.choice(items) if items else None
+
+
+async def count(topic: str, difficulty: int = 1) -> int:
+    """Сколько вопросов по теме в банке."""
+    await load()
+    return len(_cache.get((topic, difficulty), ()))
+
+
+async def _fresh(topic: str, topic_ru: str, difficulty: int,
+                 user_id: Optional[int] = None) -> QuizItem:
+    item = await get_quiz_question(topic_ru, strict=True, user_id=user_id)
+    await add(topic, item, difficulty)
+    return item
+
+
+async def serve(topic: str, topic_ru: str, difficulty: int = 1, *,
+                user_id: Optional[int] = None) -> QuizItem:
+    """Выдать вопрос по политике «банк + доля свежих» (см. описание модуля).
+
+    Parameters
+    ----------
+    topic:
+        Код темы (`hist`, `sci`, …) — ключ банка.
+    topic_ru:
+        Название темы для промпта ChatGPT.
+    difficulty:
+        Уровень сложности (пока в боте используется только 1).
+    user_id:
+        Пользователь, за которым учитывается свежая генерация
+        (`services.usage`); при исчерпанной квоте вопрос берётся из банка.
+
+    Raises
+    ------
+    QuotaExceeded
+        Квота исчерпана, а в банке по теме нет вопросов.
+    RuntimeError
+        ChatGPT недоступен, а в банке по теме нет вопросов.
+    """
+    banked = await pick(topic, difficulty)
+    if banked is not None and random.random() >= FRESH_RATIO:
+        return banked
+
+    task = asyncio.create_task(_fresh(topic, topic_ru, difficulty, user_id))
+    try:
+        if banked is None:
+            return await task
+        return await asyncio.wait_for(asyncio.shield(task), LLM_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.info("Quiz LLM slower than %.1fs, serving from bank", LLM_TIMEOUT)
+        lifecycle.track(task)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return banked
+    except Exception as exc:                          # noqa: BLE001
+        if banked is None:
+            raise
+        logger.warning("Quiz LLM failed (%s), serving from bank", exc)
+        return banked
+
+
+# ────────────────────────── офлайн-прогрев ──────────────────────────
+
+async def _warm(topic: str, topic_ru: str, count: int, difficulty: int) -> None:
+    added = 0
+    for _ in range(count):
+        try:
+            added += await add(topic, await get_quiz_question(topic_ru, strict=True),
+                               difficulty)
+        except Exception as exc:                      # noqa: BLE001
+            logger.warning("Warm-up question failed: %s", exc)
+    print(f"{topic}: +{added} (всего {len(_cache[(topic, difficulty)])})")
+
+
+async def _import(path: str) -> None:
+    added = 0
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            item = (row["q"], list(row["options"]), int(row["answer"]))
+            if len(item[1]) == 3 and 0 <= item[2] < 3:
+                added += await add(row["topic"], item, int(row.get("difficulty", 1)))
+    print(f"Импортировано вопросов: {added}")
+
+
+async def _stats() -> None:
+    await load()
+    for (topic, difficulty), items in sorted(_cache.items()):
+        print(f"{topic}\tсложность {difficulty}\t{len(items)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m services.quiz_bank",
+                                     description="Управление банком вопросов квиза")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    warm = sub.add_parser("warm", help="сгенерировать вопросы через ChatGPT")
+    warm.add_argument("topic")
+    warm.add_argument("topic_ru")
+    warm.add_argument("count", type=int)
+    warm.add_argument("--difficulty", type=int, default=1)
+    imp = sub.add_parser("import", help="загрузить JSONL {topic,q,options,answer}")
+    imp.add_argument("path")
+    sub.add_parser("stats", help="сколько вопросов по темам")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.cmd == "warm":
+        coro = _warm(args.topic, args.topic_ru, args.count, args.difficulty)
+    elif args.cmd == "import":
+        coro = _import(args.path)
+    else:
+        coro = _stats()
+    asyncio.run(coro)
+
+
+if __name__ == "__main__":
+    main()
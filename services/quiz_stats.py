@@ -0,0 +1,155 @@
+"""
+services.quiz_stats
+===================
+
+Очки, серии и статистика по темам для `/quiz`, плюс таблица лидеров `/top`.
+
+Хранилище — SQLite (`services.db`):
+
+* `quiz_answers` — журнал ответов (append-only, индекс по пользователю);
+* `quiz_scores` — **агрегаты** по пользователю: очки, число ответов,
+  текущая и лучшая серия. Обновляются инкрементально одним UPSERT
+  в той же транзакции, что и запись ответа;
+* `quiz_topic_stats` — агрегаты «пользователь × тема».
+
+Таблица лидеров читает только `quiz_scores` по индексу
+`(score DESC, best_streak DESC)`, поэтому её стоимость не зависит
+от количества накопленных ответов.
+"""
+
+from __future__ import annotations
+import sqlite3
+import time
+from typing import List, NamedTuple
+
+from services.db import db
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_answers (
+    id       INTEGER PRIMARY KEY,
+    user_id  INTEGER NOT NULL,
+    topic    TEXT    NOT NULL,
+    correct  INTEGER NOT NULL,
+    ts       INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quiz_answers_user ON quiz_answers (user_id, ts);
+
+CREATE TABLE IF NOT EXISTS quiz_scores (
+    user_id     INTEGER PRIMARY KEY,
+    name        TEXT    NOT NULL DEFAULT '',
+    score       INTEGER NOT NULL DEFAULT 0,
+    answered    INTEGER NOT NULL DEFAULT 0,
+    streak      INTEGER NOT NULL DEFAULT 0,
+    best_streak INTEGER NOT NULL DEFAULT 0,
+    updated     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS quiz_scores_rank
+    ON quiz_scores (score DESC, best_streak DESC);
+
+CREATE TABLE IF NOT EXISTS quiz_topic_stats (
+    user_id  INTEGER NOT NULL,
+    topic    TEXT    NOT NULL,
+    answered INTEGER NOT NULL DEFAULT 0,
+    correct  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, topic)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_SCORE = """
+INSERT INTO quiz_scores (user_id, name, score, answered, streak, best_streak, updated)
+VALUES (:user_id, :name, :correct, 1, :correct, :correct, :ts)
+ON CONFLICT (user_id) DO UPDATE SET
+    name        = excluded.name,
+    score       = score + excluded.score,
+    answered    = answered + 1,
+    streak      = CASE WHEN excluded.score THEN streak + 1 ELSE 0 END,
+    best_streak = MAX(best_streak, CASE WHEN excluded.score THEN streak + 1 ELSE 0 END),
+    updated     = excluded.updated
+"""
+
+_UPSERT_TOPIC = """
+INSERT INTO quiz_topic_stats (user_id, topic, answered, correct)
+VALUES (:user_id, :topic, 1, :correct)
+ON CONFLICT (user_id, topic) DO UPDATE SET
+    answered = answered + 1,
+    correct  = correct + excluded.correct
+"""
+
+
+class Score(NamedTuple):
+    """Агрегаты пользователя после очередного ответа."""
+    score: int
+    answered: int
+    streak: int
+    best_streak: int
+
+
+class Leader(NamedTuple):
+    """Строка таблицы лидеров."""
+    name: str
+    score: int
+    answered: int
+    best_streak: int
+
+
+def _conn(conn: sqlite3.Connection) -> sqlite3.Connection:
+    db.ensure_schema("quiz_stats", _SCHEMA)
+    return conn
+
+
+def _record(conn: sqlite3.Connection, user_id: int, name: str,
+            topic: str, correct: bool) -> Score:
+    conn = _conn(conn)
+    params = {"user_id": user_id, "name": name[:64], "topic": topic,
+              "correct": int(correct), "ts": int(time.time())}
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute(
+            "INSERT INTO quiz_answers (user_id, topic, correct, ts) "
+            "VALUES (:user_id, :topic, :correct, :ts)", params,
+        )
+        conn.execute(_UPSERT_SCORE, params)
+        conn.execute(_UPSERT_TOPIC, params)
+        row = conn.execute(
+            "SELECT score, answered, streak, best_streak "
+            "FROM quiz_scores WHERE user_id = ?", (user_id,),
+        ).fetchone()
+    return Score(*row)
+
+
+def _top(conn: sqlite3.Connection, limit: int) -> List[Leader]:
+    rows = _conn(conn).execute(
+        "SELECT name, score, answered, best_streak FROM quiz_scores "
+        "ORDER BY score DESC, best_streak DESC LIMIT ?", (limit,),
+    ).fetchall()
+    return [Leader(*row) for row in rows]
+
+
+def _topics(conn: sqlite3.Connection, user_id: int) -> dict[str, tuple[int, int]]:
+    rows = _conn(conn).execute(
+        "SELECT topic, answered, correct FROM quiz_topic_stats WHERE user_id = ?",
+        (user_id,),
+    ).fetchall()
+    return {topic: (answered, correct) for topic, answered, correct in rows}
+
+
+async def record_answer(user_id: int, name: str,
+                        topic: str, correct: bool) -> Score:
+    """Записать ответ и инкрементально обновить агрегаты.
+
+    Returns
+    -------
+    Score
+        Очки, число ответов, текущая и лучшая серия пользователя.
+    """
+    return await db.call(_record, user_id, name, topic, correct)
+
+
+async def leaderboard(limit: int = 10) -> List[Leader]:
+    """Вернуть `limit` лучших игроков по очкам (затем по лучшей серии)."""
+    return await db.call(_top, limit)
+
+
+async def topic_stats(user_id: int) -> dict[str, tuple[int, int]]:
+    """Вернуть `{topic: (answered, correct)}` для пользователя."""
+    return await db.call(_topics, user_id)
@@ -0,0 +1,151 @@
+"""
+services.recorder
+=================
+
+Запись входящих апдейтов в сжатый журнал для офлайн-нагрузочных
+прогонов (`python -m services.replay`).
+
+Включается переменной `UPDATE_LOG` (например, `data/updates.jsonl.gz`).
+`register(app)` добавляет `TypeHandler` в группу `-1`: он видит каждый
+апдейт раньше остальных обработчиков и ничего не меняет в их работе.
+
+Формат — gzip-JSONL, по строке на апдейт: `{"ts": unix-время, "update": {...}}`.
+Строки копятся в памяти и раз в `UPDATE_LOG_FLUSH` секунд (по умолчанию 1)
+дописываются в файл отдельным gzip-членом из фонового потока, так что
+event loop не ждёт диск, а оборванная запись теряет не больше одной
+пачки. Склеенные gzip-члены `gzip.open` читает как один поток.
+
+Анонимизация
+------------
+* id пользователей и чатов заменяются ключевым blake2b-хэшем
+  (ключ — `UPDATE_LOG_SALT`; без него случайный на каждый запуск):
+  один и тот же пользователь внутри журнала остаётся одним и тем же.
+  Хэшируются `id` внутри любых User/Chat-полей (`from`, `chat`,
+  `new_chat_members`, `left_chat_member`, `via_bot`,
+  `forward_origin.sender_user`/`sender_chat`/`chat`, …) и поля
+  `user_id`/`chat_id` на любой глубине;
+* имена, username-ы, телефоны и названия чатов вырезаются;
+* текст сообщений заменяется строкой той же длины — форма нагрузки
+  (длина переводов, склейка сообщений) сохраняется, содержимое нет;
+  у команд остаётся только сама команда (`/start payload` → `/start`),
+  `callback_data` — как есть, иначе апдейт не попадёт в тот же
+  обработчик.
+"""
+
+from __future__ import annotations
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from services import runtime
+
+logger = logging.getLogger(__name__)
+
+LOG_PATH = os.getenv("UPDATE_LOG", "")
+FLUSH_SECONDS = float(os.getenv("UPDATE_LOG_FLUSH", "1"))
+_SALT = os.getenv("UPDATE_LOG_SALT", "").encode() or secrets.token_bytes(16)
+
+_ID_OWNERS = {"from", "chat", "user", "users", "sender_chat", "forward_from",
+              "forward_from_chat", "new_chat_members", "left_chat_member", "via_bot",
+              "sender_user", "sender_business_bot", "old_chat_member", "new_chat_member"}
+_ID_KEYS = {"user_id", "chat_id", "migrate_to_chat_id", "migrate_from_chat_id"}
+_DROP = {"last_name", "username", "title", "bio", "phone_number", "contact",
+         "location", "venue", "invite_link"}
+_TEXT = {"text", "caption"}
+
+_buffer: List[str] = []
+_flusher: Optional[asyncio.Task] = None
+
+
+def _pseudo_id(value: int) -> int:
+    digest = hashlib.blake2b(str(value).encode(), key=_SALT[:64], digest_size=5).digest()
+    pseudo = int.from_bytes(digest, "big") or 1
+    return -pseudo if value < 0 else pseudo
+
+
+def anonymise(obj: Any, owner: Optional[str] = None) -> Any:
+    """Обезличить `Update.to_dict()` (рекурсивно, без изменения исходника)."""
+    if isinstance(obj, list):
+        return [anonymise(item, owner) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    out = {}
+    for key, value in obj.items():
+        if key in _DROP:
+            continue
+        if isinstance(value, int) and (key in _ID_KEYS
+                                       or key == "id" and owner in _ID_OWNERS):
+            out[key] = _pseudo_id(value)
+        elif key == "first_name":
+            out[key] = "user"
+        elif key in _TEXT and isinstance(value, str):
+            out[key] = (value.split() or ["/"])[0] if value.startswith("/") else "x" * len(value)
+        else:
+            out[key] = anonymise(value, key)
+    return out
+
+
+async def record(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`TypeHandler`-колбэк: поставить апдейт в очередь записи."""
+    line = runtime.dumps({"ts": round(time.time(), 3),
+                          "update": anonymise(update.to_dict())})
+    _buffer.append(line)
+    global _flusher
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.create_task(_flush_forever(), name="update-log")
+
+
+def _append(path: Path, lines: List[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as fh:
+        fh.write("\n".join(lines) + "\n")
+
+
+async def flush() -> int:
+    """Дописать накопленные апдейты в журнал.
+
+    Returns
+    -------
+    int
+        Число записанных апдейтов.
+    """
+    if not _buffer or not LOG_PATH:
+        return 0
+    lines = _buffer[:]
+    del _buffer[:len(lines)]
+    try:
+        await asyncio.to_thread(_append, Path(LOG_PATH), lines)
+    except OSError as exc:
+        logger.warning("Update log write failed: %s", exc)
+        return 0
+    return len(lines)
+
+
+async def _flush_forever() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_SECONDS)
+        await flush()
+
+
+def register(app: Application) -> bool:
+    """Подключить запись, если задан `UPDATE_LOG`.
+
+    Returns
+    -------
+    bool
+        `True`, если запись включена.
+    """
+    if not LOG_PATH:
+        return False
+    app.add_handler(TypeHandler(Update, record), group=-1)
+    logger.info("Recording updates to %s", LOG_PATH)
+    return True
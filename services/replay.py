@@ -0,0 +1,311 @@
+"""
+services.replay
+===============
+
+Нагрузочный прогон бота по журналу апдейтов (`services.recorder`).
+
+    python -m services.replay data/updates.jsonl.gz                # 1×
+    python -m services.replay data/updates.jsonl.gz --speed 10     # 10×
+    python -m services.replay data/updates.jsonl.gz --speed max --limit 100000
+
+Апдейты подаются в настоящий `main.build_app()`, но вместо сетей
+подставлены заглушки:
+
+* Telegram — `StubRequest` (`telegram.request.BaseRequest`): отвечает
+  на любой метод Bot API правдоподобным JSON через `--telegram-ms`;
+* OpenAI — `StubOpenAI` вместо `services.openai_client.client`:
+  отвечает через `--openai-ms` (±50 %) с `usage`, а для квиза
+  и пакетного перевода — валидным JSON.
+
+Журнал читается потоково (`gzip.open` построчно), а между читателем
+и обработкой — очередь на `--window` апдейтов, поэтому память
+не зависит от размера журнала. Апдейты, как и в боевом PTB,
+обрабатываются по одному; ответы из фоновых задач чата
+(`services.tasks`) досчитываются параллельно.
+
+С `FAST_RUNTIME=1` прогон идёт на uvloop/orjson (`services.runtime`).
+
+Отчёт: пропускная способность, CPU на апдейт и p50/p95/p99/max задержки по меткам
+обработчиков (`cmd:/start`, `cb:quiz_ans`, `text`, …). Задержка —
+от момента, когда апдейт «пришёл» по расписанию журнала (при
+`--speed max` — когда его взяли в обработку), до конца обработчика
+и всех фоновых задач, которые он запустил.
+
+По умолчанию прогон пишет в отдельную базу (`--db`, во временном
+каталоге) и без квот `services.usage` (`--quotas`, чтобы включить).
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+from services import runtime, ui
+from services.codec import pack
+from services.router import split_callback
+
+_BOT = {"id": 1, "is_bot": True, "first_name": "replay", "username": "replay_bot"}
+
+
+class StubRequest(BaseRequest):
+    """Bot API без сети: каждый метод отвечает через `latency` секунд."""
+
+    parse_json_payload = staticmethod(runtime.parse_payload)
+
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _message(self, params: Dict[str, Any], photo: bool) -> Dict[str, Any]:
+        msg_id = next(self._ids)
+        message = {
+            "message_id": params.get("message_id") or msg_id,
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id") or 1, "type": "private"},
+            "from": _BOT,
+        }
+        if photo:
+            message["photo"] = [{"file_id": f"stub{msg_id}", "file_unique_id": f"u{msg_id}",
+                                 "width": 1280, "height": 720}]
+            message["caption"] = params.get("caption", "")
+        else:
+            message["text"] = params.get("text", "")
+        return message
+
+    async def do_request(self, url: str, method: str,
+                         request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        name = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if name == "getMe":
+            result: Any = _BOT
+        elif name in ("sendPhoto", "editMessageMedia", "editMessageCaption"):
+            result = self._message(params, photo=True)
+        elif name in ("sendMessage", "editMessageText"):
+            result = self._message(params, photo=False)
+        else:
+            result = True
+        return 200, runtime.dumps({"ok": True, "result": result}).encode()
+
+
+class StubOpenAI:
+    """Замена `openai.AsyncOpenAI` с `chat.completions.create`."""
+
+    def __init__(self, latency: float = 1.0) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, *, model: str, messages, max_tokens: Optional[int] = None,
+                     **_: Any) -> Any:
+        self.calls += 1
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        prompt = messages[-1]["content"]
+        if '"q"' in prompt:
+            content = json.dumps({"q": f"Вопрос {self.calls}?",
+                                  "options": ["А", "Б", "В"], "answer": 1},
+                                 ensure_ascii=False)
+        elif "несколько языков" in prompt:
+            codes = re.findall(r'"(lang_\w+)"', prompt)
+            content = json.dumps({code: "перевод" for code in codes}, ensure_ascii=False)
+        else:
+            content = "ответ " * min(max_tokens or 200, 200)
+        completion = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason="stop",
+                                     message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=len(prompt) // 4,
+                                  completion_tokens=completion),
+        )
+
+
+def read_log(path: Path) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """Потоково читать журнал: `(ts, update_dict)` по одному."""
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                row = runtime.loads(line)
+                yield row["ts"], row["update"]
+
+
+_SCRIPT = ("/start", "/random", ui.CB_RANDOM_MORE, "/quiz", pack(ui.CB_QUIZ_TOPIC, 0),
+           "/gpt", "Расскажи про чёрные дыры", ui.CB_GPT_STOP)
+
+
+def synthetic_updates(count: int, chats: int = 500) -> Iterator[Dict[str, Any]]:
+    """Синтетические апдейты для бенчмарков (`services.runtime`).
+
+    `chats` чатов по кругу проходят один сценарий: меню, факт,
+    «ещё факт», квиз, тема, ChatGPT, вопрос, выход.
+    """
+    for i in range(count):
+        chat_id = i % chats + 1
+        step = _SCRIPT[(i // chats) % len(_SCRIPT)]
+        user = {"id": chat_id, "is_bot": False, "first_name": "user"}
+        chat = {"id": chat_id, "type": "private"}
+        if step.startswith("/") or " " in step:
+            message = {"message_id": i + 1, "date": 0, "chat": chat, "from": user,
+                       "text": step}
+            if step.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0,
+                                        "length": len(step)}]
+            yield {"update_id": i + 1, "message": message}
+        else:
+            card = {"message_id": i + 1, "date": 0, "chat": chat, "from": _BOT,
+                    "caption": "x", "photo": [{"file_id": "stub", "file_unique_id": "u",
+                                               "width": 1280, "height": 720}]}
+            yield {"update_id": i + 1,
+                   "callback_query": {"id": str(i + 1), "from": user, "chat_instance": "c",
+                                      "data": step, "message": card}}
+
+
+def label(data: Dict[str, Any]) -> str:
+    """Метка обработчика для отчёта."""
+    if "callback_query" in data:
+        return "cb:" + split_callback(data["callback_query"].get("data") or "")[0]
+    text = (data.get("message") or {}).get("text") or ""
+    if text.startswith("/"):
+        return "cmd:" + text.split()[0].split("@")[0]
+    return "text"
+
+
+def _chat_id(data: Dict[str, Any]) -> Optional[int]:
+    message = data.get("message") or (data.get("callback_query") or {}).get("message")
+    return (message or {}).get("chat", {}).get("id")
+
+
+async def replay(path: Path, speed: Optional[float], limit: Optional[int],
+                 window: int, telegram_ms: float, openai_ms: float) -> None:
+    import main
+    from telegram import Update
+    from services import metrics, openai_client
+    from services.tasks import tasks
+
+    openai_stub = StubOpenAI(openai_ms / 1000)
+    openai_client.client = openai_stub
+    request = StubRequest(telegram_ms / 1000)
+    app = main.build_app(request=request)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=window)
+    pending = set()
+    started = time.monotonic()
+    cpu_started = time.process_time()
+
+    async def feed() -> None:
+        first: Optional[float] = None
+        for ts, data in itertools.islice(read_log(path), limit):
+            first = ts if first is None else first
+            if speed:
+                delay = (ts - first) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await queue.put((time.monotonic(), data))
+        await queue.put(None)
+
+    async def finish(name: str, arrived: float, background) -> None:
+        await asyncio.gather(*background, return_exceptions=True)
+        metrics.observe("replay.latency_ms", (time.monotonic() - arrived) * 1000,
+                        handler=name)
+
+    feeder = asyncio.create_task(feed())
+    processed = 0
+    while (item := await queue.get()) is not None:
+        arrived, data = item
+        if not speed:
+            arrived = time.monotonic()
+        name = label(data)
+        chat_id = _chat_id(data)
+        before = set(tasks.of(chat_id)) if chat_id is not None else set()
+        try:
+            await app.process_update(Update.de_json(data, app.bot))
+        except Exception as exc:                        # noqa: BLE001
+            metrics.inc("replay.errors", handler=name)
+            print(f"! {name}: {exc!r}")
+        spawned = [t for t in tasks.of(chat_id) if t not in before] if chat_id else []
+        waiter = asyncio.create_task(finish(name, arrived, spawned))
+        pending.add(waiter)
+        waiter.add_done_callback(pending.discard)
+        processed += 1
+
+    await feeder
+    await asyncio.gather(*pending)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    await app.shutdown()
+
+    print(f"\n{processed} updates in {elapsed:.1f}s — {processed / elapsed:.1f} upd/s; "
+          f"Bot API calls: {request.calls}, OpenAI calls: {openai_stub.calls}")
+    print(f"CPU: {cpu * 1000 / max(processed, 1):.2f} ms/upd ({runtime.describe()})")
+    print(f"{'handler':<24}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  ms")
+    rows = [(key, value) for key, value in metrics.snapshot().items()
+            if key.startswith("replay.latency_ms")]
+    for key, summary in sorted(rows, key=lambda kv: -kv[1]["count"]):
+        name = key.split('handler="', 1)[1].rstrip('"}')
+        print(f"{name:<24}{summary['count']:>8}{summary['p50']:>10.0f}"
+              f"{summary['p95']:>10.0f}{summary['p99']:>10.0f}{summary['max']:>10.0f}")
+
+
+def _cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("log", type=Path, help="журнал UPDATE_LOG (gzip-JSONL)")
+    parser.add_argument("--speed", default="1",
+                        help="множитель скорости (1, 10, …) или max — без пауз")
+    parser.add_argument("--limit", type=int, help="сколько апдейтов проиграть")
+    parser.add_argument("--window", type=int, default=10_000,
+                        help="сколько апдейтов читать наперёд")
+    parser.add_argument("--telegram-ms", type=float, default=50,
+                        help="задержка заглушки Bot API, мс")
+    parser.add_argument("--openai-ms", type=float, default=1500,
+                        help="средняя задержка заглушки OpenAI, мс")
+    parser.add_argument("--db", help="SQLite-база прогона (по умолчанию временная)")
+    parser.add_argument("--quotas", action="store_true",
+                        help="применять квоты services.usage")
+    args = parser.parse_args()
+
+    os.environ.setdefault("TG_BOT_TOKEN", "0:replay")
+    os.environ.setdefault("CHATGPT_TOKEN", "replay")
+    os.environ["BOT_DB_PATH"] = args.db or str(Path(tempfile.mkdtemp()) / "replay.db")
+    os.environ["UPDATE_LOG"] = ""
+    if not args.quotas:
+        from services import usage
+        usage.QUOTAS.clear()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    runtime.install()
+    asyncio.run(replay(args.log, speed, args.limit, args.window,
+                       args.telegram_ms, args.openai_ms))
+
+
+if __name__ == "__main__":
+    _cli()
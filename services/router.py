@@ -0,0 +1,220 @@
+"""
+services.router
+===============
+
+Маршрутизатор callback-запросов по **префиксу** `callback_data`.
+
+Раньше каждая кнопка регистрировалась отдельным `CallbackQueryHandler`
+с регулярным выражением, и PTB проверял их по очереди — как на верхнем
+уровне `Application`, так и внутри состояний `ConversationHandler`.
+`CallbackRouter` заменяет такой список одним обработчиком:
+
+* префикс (`quiz_ans`, `cook_kcal`, `persona_einstein`, …) ищется
+  в словаре за O(1);
+* аргументы после `services.ui.CB_SEP` разбираются один раз и кладутся
+  в `context.args`, поэтому обработчикам не нужен `q.data.split(":")`;
+  для маршрутов с `packed=True` нагрузка декодируется `services.codec`
+  в кортеж чисел и проверяется, а битые/устаревшие кнопки отсекаются
+  до вызова обработчика;
+* попытка занять один и тот же префикс дважды приводит к `ValueError`
+  ещё при сборке приложения (`add` и `assert_unique`) — в том числе
+  если префикс маршрутизатора перехватывает обычный
+  `CallbackQueryHandler` с шаблоном того же уровня.
+
+Пример
+------
+>>> router = CallbackRouter("cook")
+>>> router.add(ui.CB_COOK_PREFIX, kcal).add(ui.CB_COOK_BACK, back)
+>>> app.add_handler(router.handler())
+"""
+
+from __future__ import annotations
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler, CallbackQueryHandler, ContextTypes, ConversationHandler
+
+from services.codec import CallbackDataError, decode_payload
+from services.ui import CB_SEP
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[Any]]
+
+STALE_BUTTON = "⌛ Кнопка устарела, откройте раздел заново."
+
+
+def split_callback(data: str) -> Tuple[str, List[str]]:
+    """Разделить `callback_data` на префикс и список аргументов.
+
+    >>> split_callback("quiz_ans:17:2")
+    ('quiz_ans', ['17', '2'])
+    >>> split_callback("main_menu")
+    ('main_menu', [])
+    """
+    prefix, _, payload = data.partition(CB_SEP)
+    return prefix, payload.split(CB_SEP) if payload else []
+
+
+class CallbackRouter:
+    """Таблица «префикс → обработчик» для одного уровня диспетчеризации.
+
+    Parameters
+    ----------
+    name:
+        Человекочитаемое имя (`"quiz.ask"`, `"root"`), используется
+        в сообщениях о конфликтах и в логах.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._routes: Dict[str, Callback] = {}
+        self._packed: Dict[str, Optional[int]] = {}
+
+    @property
+    def prefixes(self) -> Iterable[str]:
+        """Все префиксы, занятые этим маршрутизатором."""
+        return self._routes.keys()
+
+    def add(self, prefix: str, callback: Callback, *,
+            packed: bool = False,
+            arity: Optional[int] = None) -> "CallbackRouter":
+        """Закрепить `prefix` за `callback`.
+
+        Parameters
+        ----------
+        prefix:
+            Префикс `callback_data` (константа из `services.ui`).
+        callback:
+            Обработчик PTB-сигнатуры `(update, context)`.
+        packed:
+            Аргументы закодированы `services.codec.pack`; в `context.args`
+            попадёт кортеж `int`.
+        arity:
+            Ожидаемое число упакованных значений (только для `packed`).
+
+        Raises
+        ------
+        ValueError
+            Префикс содержит разделитель или уже занят другим обработчиком.
+        """
+        if not prefix or CB_SEP in prefix:
+            raise ValueError(f"[{self.name}] некорректный префикс {prefix!r}")
+        if prefix in self._routes:
+            owner = self._routes[prefix]
+            raise ValueError(
+                f"[{self.name}] callback «{prefix}» уже обрабатывает "
+                f"{owner.__module__}.{owner.__qualname__}"
+            )
+        self._routes[prefix] = callback
+        if packed:
+            self._packed[prefix] = arity
+        return self
+
+    def matches(self, data: object) -> bool:
+        """Предикат для `CallbackQueryHandler(pattern=...)`."""
+        if not isinstance(data, str):
+            return False
+        return data.partition(CB_SEP)[0] in self._routes
+
+    async def dispatch(self, update: Update,
+                       context: ContextTypes.DEFAULT_TYPE) -> Any:
+        """Вызвать обработчик префикса, предварительно заполнив `context.args`.
+
+        Кнопка с повреждённой упакованной нагрузкой только подтверждается
+        уведомлением, обработчик не вызывается.
+        """
+        data = update.callback_query.data
+        prefix, _, payload = data.partition(CB_SEP)
+        if prefix in self._packed:
+            try:
+                context.args = decode_payload(payload, self._packed[prefix])
+            except CallbackDataError as exc:
+                logger.warning("[%s] bad callback %r: %s", self.name, data, exc)
+                await update.callback_query.answer(STALE_BUTTON)
+                return None
+        else:
+            context.args = payload.split(CB_SEP) if payload else []
+        return await self._routes[prefix](update, context)
+
+    def handler(self) -> CallbackQueryHandler:
+        """Единственный `CallbackQueryHandler`, обслуживающий все префиксы."""
+        return CallbackQueryHandler(self.dispatch, pattern=self.matches)
+
+
+def _routers_of(handler: BaseHandler) -> Iterator[CallbackRouter]:
+    owner = getattr(handler.callback, "__self__", None)
+    if isinstance(owner, CallbackRouter):
+        yield owner
+
+
+def _claims(handler: CallbackQueryHandler, prefix: str) -> bool:
+    """Перехватит ли обычный `CallbackQueryHandler` кнопки префикса."""
+    pattern = handler.pattern
+    samples = (prefix, f"{prefix}{CB_SEP}0")
+    if pattern is None:
+        return True
+    if isinstance(pattern, re.Pattern):
+        return any(pattern.match(data) for data in samples)
+    if isinstance(pattern, type):
+        return False
+    return any(pattern(data) for data in samples)
+
+
+def _check_level(handlers: Iterable[BaseHandler], where: str) -> None:
+    handlers = list(handlers)
+    owners: Dict[str, str] = {}
+    for handler in handlers:
+        for router in _routers_of(handler):
+            for prefix in router.prefixes:
+                if prefix in owners:
+                    raise ValueError(
+                        f"{where}: callback «{prefix}» заявлен и в "
+                        f"«{owners[prefix]}», и в «{router.name}»"
+                    )
+                owners[prefix] = router.name
+    for handler in handlers:
+        if not isinstance(handler, CallbackQueryHandler) or any(_routers_of(handler)):
+            continue
+        for prefix, owner in owners.items():
+            if _claims(handler, prefix):
+                callback = handler.callback
+                raise ValueError(
+                    f"{where}: callback «{prefix}» из «{owner}» перехватывает "
+                    f"и {callback.__module__}.{callback.__qualname__}"
+                )
+
+
+def assert_unique(handlers: Iterable[BaseHandler]) -> None:
+    """Проверить, что на каждом уровне диспетчеризации префиксы не пересекаются.
+
+    Уровень — это верхний список обработчиков `Application` вместе
+    с entry points всех `ConversationHandler`, а также каждое состояние
+    и `fallbacks` отдельного разговора. Одинаковый префикс на *разных*
+    уровнях допустим (например, «Главное меню» внутри диалога и снаружи).
+
+    Обычный `CallbackQueryHandler` (не маршрутизатор) на том же уровне
+    проверяется по шаблону: строка/регулярное выражение или предикат
+    не должны совпадать с `callback_data` чужого префикса, а обработчик
+    без шаблона перехватывает все префиксы.
+
+    Raises
+    ------
+    ValueError
+        Найден префикс, который заявили два маршрутизатора одного уровня
+        или маршрутизатор и обычный обработчик.
+    """
+    handlers = list(handlers)
+    top: List[BaseHandler] = []
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            top.extend(handler.entry_points)
+            for state, state_handlers in handler.states.items():
+                _check_level(state_handlers, f"{handler.name or 'conversation'}[{state}]")
+            _check_level(handler.fallbacks, f"{handler.name or 'conversation'}[fallbacks]")
+        else:
+            top.append(handler)
+    _check_level(top, "application")
+    logger.debug("Callback routes checked: %d handlers", len(handlers))
@@ -0,0 +1,180 @@
+"""
+services.runtime
+================
+
+Необязательный «быстрый рантайм»: uvloop вместо стандартного event loop
+и orjson вместо `json` там, где это позволяют библиотеки.
+
+Включается `FAST_RUNTIME=1` и требует необязательных пакетов
+(`pip install uvloop orjson`, см. requirements.txt). Если пакета нет,
+соответствующая часть молча остаётся стандартной — бот работает
+так же, только медленнее:
+
+* `install()` (в `main.py` до запуска polling) ставит политику
+  `uvloop.EventLoopPolicy`;
+* `JSONRequest` — транспорт Bot API (`HTTPXRequest`), разбирающий
+  ответы Telegram через `orjson.loads`. Невалидный ответ
+  разбирается ещё раз штатным `BaseRequest.parse_json_payload`,
+  чтобы ошибка была прежней (`TelegramError`). Тела запросов PTB
+  кодирует `json.dumps` по параметрам внутри `RequestParameter`,
+  подменить это без патча PTB нельзя — но там мелкие значения
+  (`reply_markup` и т. п.), основной объём — ответы `getUpdates`;
+* `loads()` / `dumps()` — для своего JSON: вопросы квиза, пакетный
+  перевод, журнал апдейтов, банк вопросов. Ошибки разбора orjson —
+  подкласс `ValueError`, поэтому обработка ошибок не меняется.
+
+Замер эффекта:
+
+    python -m services.runtime --updates 20000
+
+генерирует синтетический журнал апдейтов и дважды прогоняет его
+через `services.replay --speed max` (обычный рантайм и быстрый),
+печатая пропускную способность и CPU на апдейт, а перед этим —
+микробенчмарк разбора ответа `getUpdates`.
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from telegram.request import BaseRequest, HTTPXRequest
+
+try:                                    # необязательные ускорители
+    import orjson
+except ImportError:                     # pragma: no cover
+    orjson = None
+try:
+    import uvloop
+except ImportError:                     # pragma: no cover
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+FAST = os.getenv("FAST_RUNTIME", "") not in ("", "0")
+_orjson = orjson if FAST else None
+
+
+def loads(data: str | bytes) -> Any:
+    """`json.loads` (через orjson в быстром режиме)."""
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Компактный JSON без `\\u`-экранирования кириллицы."""
+    if _orjson is not None:
+        return _orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def parse_payload(payload: bytes) -> Dict[str, Any]:
+    """Разобрать ответ Bot API (замена `BaseRequest.parse_json_payload`)."""
+    if _orjson is not None:
+        try:
+            return _orjson.loads(payload)
+        except _orjson.JSONDecodeError:
+            pass
+    return BaseRequest.parse_json_payload(payload)
+
+
+class JSONRequest(HTTPXRequest):
+    """`HTTPXRequest` с разбором ответов через `parse_payload`."""
+
+    __slots__ = ()
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> Dict[str, Any]:
+        return parse_payload(payload)
+
+
+def describe() -> str:
+    """Что из быстрого рантайма сейчас действует."""
+    loop = "uvloop" if FAST and uvloop is not None else "asyncio"
+    codec = "orjson" if _orjson is not None else "json"
+    return f"loop={loop} json={codec}"
+
+
+def install() -> None:
+    """Включить uvloop, если задан `FAST_RUNTIME` (до создания event loop)."""
+    if not FAST:
+        return
+    missing = [name for name, mod in (("uvloop", uvloop), ("orjson", orjson)) if mod is None]
+    if missing:
+        logger.warning("FAST_RUNTIME: не установлены %s, используется стандартная "
+                       "реализация", ", ".join(missing))
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Runtime: %s", describe())
+
+
+# ───────────────────────────── бенчмарк ─────────────────────────────
+
+def _updates_payload(count: int) -> bytes:
+    from services.replay import synthetic_updates
+    return json.dumps({"ok": True, "result": list(synthetic_updates(count))},
+                      ensure_ascii=False).encode()
+
+
+def _bench_parse(count: int) -> None:
+    payload = _updates_payload(100)
+    rounds = max(count // 100, 1)
+    decoders = {"json": lambda p: BaseRequest.parse_json_payload(p)}
+    if orjson is not None:
+        decoders["orjson"] = orjson.loads
+    print(f"Разбор ответа getUpdates на 100 апдейтов ({len(payload) // 1024} КБ), "
+          f"{rounds} раз:")
+    for name, decode in decoders.items():
+        started = time.perf_counter()
+        for _ in range(rounds):
+            decode(payload)
+        per = (time.perf_counter() - started) / rounds / 100 * 1e6
+        print(f"  {name:<8}{per:>8.1f} мкс/апдейт")
+
+
+def _run_replay(log: Path, count: int, fast: bool) -> str:
+    env = dict(os.environ, FAST_RUNTIME="1" if fast else "0")
+    out = subprocess.run(
+        [sys.executable, "-m", "services.replay", str(log), "--speed", "max",
+         "--telegram-ms", "0", "--openai-ms", "0", "--limit", str(count)],
+        env=env, capture_output=True, text=True, check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+    ).stdout
+    summary = re.search(r"^\d+ updates in .*$", out, re.M)
+    cpu = re.search(r"^CPU: .*$", out, re.M)
+    return " | ".join(m.group(0) for m in (summary, cpu) if m)
+
+
+def _cli() -> None:
+    parser = argparse.ArgumentParser(description="Замер uvloop/orjson против stdlib")
+    parser.add_argument("--updates", type=int, default=20_000,
+                        help="сколько синтетических апдейтов прогнать")
+    args = parser.parse_args()
+
+    print(f"uvloop: {'есть' if uvloop else 'нет'}, orjson: {'есть' if orjson else 'нет'}\n")
+    _bench_parse(args.updates)
+
+    from services.replay import synthetic_updates
+    log = Path(tempfile.mkdtemp()) / "synthetic.jsonl.gz"
+    with gzip.open(log, "wt", encoding="utf-8") as fh:
+        for i, update in enumerate(synthetic_updates(args.updates)):
+            fh.write(json.dumps({"ts": i / 100, "update": update}, ensure_ascii=False) + "\n")
+    print(f"\nПрогон {args.updates} апдейтов через services.replay --speed max:")
+    for fast in (False, True):
+        print(f"  {'FAST_RUNTIME=1' if fast else 'стандартный    '}  "
+              f"{_run_replay(log, args.updates, fast)}")
+
+
+if __name__ == "__main__":
+    _cli()
@@ -0,0 +1,275 @@
+"""
+services.sessions
+=================
+
+Типизированные сессии режимов вместо свободных ключей `context.user_data`.
+
+Раньше режимы складывали состояние в `context.user_data` под ключами
+`"topic"`, `"answered"`, `"persona"`, `"lang_codes"`. Это словарь
+на каждого пользователя (около 200+ байт ещё до первого ключа),
+который PTB не освобождает никогда; ключи разных режимов живут
+в одном пространстве имён, а сами диалоги при этом ведутся по чату
+(`per_chat=True, per_user=False`).
+
+Здесь у каждого режима свой класс со `__slots__` (`QuizSession`,
+`TalkSession`, `TranslatorSession`) — несколько полей без `__dict__`,
+— и своё хранилище `SessionStore`, ключ которого — `chat_id`:
+
+* `get(chat_id)` возвращает сессию чата, создавая её при первом
+  обращении, и отмечает время последнего использования;
+* сессии, не использовавшиеся дольше `SESSION_TTL` секунд (по умолчанию
+  6 часов), вытесняются лениво — с «холодного» конца LRU при каждом
+  обращении, поэтому без фонового таймера;
+* число сессий в одном хранилище не превышает `SESSION_MAX`
+  (по умолчанию 100 000): при переполнении вытесняется самая старая.
+
+Вытеснения считаются в `services.metrics` как
+`sessions.evicted{mode=..., reason=ttl|size}`.
+
+Сохранение
+----------
+Сессия сериализуется в короткий JSON-массив значений своих слотов
+(`["hist",123]`, `[["lang_en","lang_de"]]`). `save()` при остановке
+бота (хук `services.lifecycle`) записывает живые сессии в таблицу
+`sessions` (`services.db`) и удаляет истёкшие, а также завершённые
+(`drop()`) и вытесненные по размеру, `load()` при старте
+поднимает те, чей TTL ещё не истёк, — например, выбранные
+в переводчике языки переживают перезапуск. В кластерном режиме
+(`services.cluster`) воркер поднимает только сессии своих чатов.
+"""
+
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, List, Optional, Set, Tuple, Type, TypeVar
+
+from services import metrics
+from services.cluster import owns
+from services.db import db
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+
+
+class Session:
+    """База сессий: время последнего обращения и (де)сериализация слотов."""
+
+    __slots__ = ("touched",)
+    fields: Tuple[str, ...] = ()
+
+    def __init__(self) -> None:
+        self.touched = 0.0
+
+    def dump(self) -> str:
+        """Компактная форма: JSON-массив значений `fields`."""
+        return json.dumps([getattr(self, name) for name in self.fields],
+                          ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def restore(cls, raw: str) -> "Session":
+        """Обратная операция к `dump()`."""
+        session = cls()
+        for name, value in zip(cls.fields, json.loads(raw)):
+            setattr(session, name, tuple(value) if isinstance(value, list) else value)
+        return session
+
+
+class QuizSession(Session):
+    """Квиз: текущая тема и ключ вопроса, на который уже ответили."""
+
+    __slots__ = fields = ("topic", "answered")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.topic: Optional[str] = None
+        self.answered: Optional[int] = None
+
+
+class TalkSession(Session):
+    """Диалог с личностью: выбранная персона."""
+
+    __slots__ = fields = ("persona",)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.persona: Optional[str] = None
+
+
+class TranslatorSession(Session):
+    """Переводчик: коды выбранных языков в порядке нажатия."""
+
+    __slots__ = fields = ("lang_codes",)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lang_codes: Tuple[str, ...] = ()
+
+
+S = TypeVar("S", bound=Session)
+
+
+class SessionStore(Generic[S]):
+    """Ограниченное LRU-хранилище сессий одного режима с idle-TTL.
+
+    Parameters
+    ----------
+    mode:
+        Имя режима — метка метрик и ключ в таблице `sessions`.
+    factory:
+        Класс сессии.
+    maxsize:
+        Жёсткий потолок числа сессий.
+    ttl:
+        Сколько секунд простоя сессия переживает.
+    """
+
+    def __init__(self, mode: str, factory: Type[S],
+                 maxsize: int = SESSION_MAX, ttl: float = SESSION_TTL) -> None:
+        self.mode = mode
+        self.factory = factory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: "OrderedDict[int, S]" = OrderedDict()
+        self.dropped: Set[int] = set()      # чаты, чьи строки `save()` удалит
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _expire(self, now: float) -> None:
+        items = self._items
+        expired = 0
+        while items:
+            session = next(iter(items.values()))
+            if now - session.touched <= self.ttl:
+                break
+            items.popitem(last=False)
+            expired += 1
+        if expired:
+            metrics.inc("sessions.evicted", expired, mode=self.mode, reason="ttl")
+
+    def _put(self, chat_id: int, session: S) -> None:
+        self._items[chat_id] = session
+        self.dropped.discard(chat_id)
+        if len(self._items) > self.maxsize:
+            self.dropped.add(self._items.popitem(last=False)[0])
+            metrics.inc("sessions.evicted", mode=self.mode, reason="size")
+
+    def get(self, chat_id: int) -> S:
+        """Сессия чата (новая, если её нет или она истекла)."""
+        now = time.time()
+        self._expire(now)
+        session = self._items.get(chat_id)
+        if session is None:
+            session = self.factory()
+            self._put(chat_id, session)
+        else:
+            self._items.move_to_end(chat_id)
+        session.touched = now
+        return session
+
+    def peek(self, chat_id: int) -> Optional[S]:
+        """Сессия чата без создания и без продления TTL."""
+        session = self._items.get(chat_id)
+        if session is None or time.time() - session.touched > self.ttl:
+            return None
+        return session
+
+    def drop(self, chat_id: int) -> None:
+        """Забыть сессию чата (и её строку в базе при следующем `save()`)."""
+        self._items.pop(chat_id, None)
+        self.dropped.add(chat_id)
+
+    def rows(self) -> List[Tuple[str, int, int, str]]:
+        """Живые сессии как строки таблицы `sessions`."""
+        self._expire(time.time())
+        return [(self.mode, chat_id, int(s.touched), s.dump())
+                for chat_id, s in self._items.items()]
+
+    def restore(self, chat_id: int, touched: float, raw: str) -> None:
+        """Вернуть сохранённую сессию (строки должны идти по возрастанию `touched`)."""
+        session = self.factory.restore(raw)
+        session.touched = touched
+        self._put(chat_id, session)
+
+
+quiz = SessionStore("quiz", QuizSession)
+talk = SessionStore("talk", TalkSession)
+translator = SessionStore("translator", TranslatorSession)
+
+STORES: Dict[str, SessionStore[Any]] = {s.mode: s for s in (quiz, talk, translator)}
+
+
+# ───────────────────────────── SQLite ─────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    mode    TEXT    NOT NULL,
+    chat_id INTEGER NOT NULL,
+    touched INTEGER NOT NULL,
+    data    TEXT    NOT NULL,
+    PRIMARY KEY (mode, chat_id)
+) WITHOUT ROWID;
+"""
+
+
+def _read(conn: sqlite3.Connection, since: int) -> List[tuple]:
+    db.ensure_schema("sessions", _SCHEMA)
+    return conn.execute(
+        "SELECT mode, chat_id, touched, data FROM sessions "
+        "WHERE touched >= ? ORDER BY touched", (since,),
+    ).fetchall()
+
+
+def _upsert(conn: sqlite3.Connection, rows: List[tuple], dropped: List[tuple],
+            expired: int) -> None:
+    db.ensure_schema("sessions", _SCHEMA)
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM sessions WHERE touched < ?", (expired,))
+        conn.executemany("DELETE FROM sessions WHERE mode = ? AND chat_id = ?", dropped)
+        conn.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", rows)
+
+
+async def load() -> int:
+    """Поднять из базы сессии, чей TTL ещё не истёк.
+
+    Returns
+    -------
+    int
+        Число восстановленных сессий.
+    """
+    rows = await db.call(_read, int(time.time() - SESSION_TTL))
+    restored = 0
+    for mode, chat_id, touched, raw in rows:
+        store = STORES.get(mode)
+        if store is None or not owns(chat_id):
+            continue
+        try:
+            store.restore(chat_id, touched, raw)
+        except (ValueError, TypeError):
+            continue
+        restored += 1
+    return restored
+
+
+async def save() -> int:
+    """Записать живые сессии всех режимов в таблицу `sessions`
+    и удалить строки завершённых.
+
+    Returns
+    -------
+    int
+        Число записанных сессий.
+    """
+    rows = [row for store in STORES.values() for row in store.rows()]
+    dropped = {store: set(store.dropped) for store in STORES.values()}
+    await db.call(_upsert, rows,
+                  [(store.mode, chat_id) for store, chats in dropped.items()
+                   for chat_id in chats],
+                  int(time.time() - SESSION_TTL))
+    for store, chats in dropped.items():
+        store.dropped -= chats
+    return len(rows)
@@ -0,0 +1,246 @@
+"""
+services.store
+==============
+
+Дисковое хранилище ответов OpenAI, переживающее перезапуски.
+
+Кэши ответов жили только в памяти: деплой выбрасывал всё, за что уже
+заплачено. Здесь ответы лежат в таблице `responses` общей SQLite-базы
+(`services.db`, WAL):
+
+* **ключ по содержимому** — blake2b от пространства имён и частей
+  запроса (`get("menu", prompt)`, `get("translate", lang, text)`),
+  поэтому изменённый промпт сам по себе даёт новый ключ;
+* **TTL** по пространствам имён — `STORE_TTLS` (JSON-строка или путь
+  к JSON-файлу, как `USAGE_QUOTAS`), по умолчанию `translate` — 30 дней,
+  `menu` — сутки; `0` отключает пространство;
+* **индекс в памяти** — ключ → (срок, размер) в порядке последнего
+  использования. Промах определяется без диска, а при старте `load()`
+  читает только покрывающий индекс `responses_used` (без самих
+  ответов), поэтому старт быстрый и при сотнях мегабайт ответов;
+* **уплотнение** — раз в `STORE_COMPACT_SECONDS` (по умолчанию час)
+  и при превышении `STORE_MAX_MB` (по умолчанию 64 МБ) удаляются
+  истёкшие записи, а затем самые давно использованные, пока объём
+  не станет ≤ 90 % лимита. Освободившиеся страницы SQLite использует
+  повторно, файл не растёт.
+
+Время последнего использования копится в памяти и пишется в базу при
+уплотнении и при остановке (`stop`, хук `services.lifecycle`).
+Метрики: `store.hits{ns}`, `store.misses{ns}`, `store.evicted{reason}`,
+gauge `store.bytes`.
+
+В кластерном режиме (`services.cluster`) индекс у каждого воркера свой:
+ответ, сохранённый соседом после старта, виден после перезапуска.
+"""
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from services import metrics, runtime
+from services.db import db
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(float(os.getenv("STORE_MAX_MB", "64")) * 1024 * 1024)
+COMPACT_SECONDS = float(os.getenv("STORE_COMPACT_SECONDS", "3600"))
+
+TTLS: Dict[str, float] = {
+    "translate": 30 * 86_400,
+    "menu":      86_400,
+}
+
+
+def _load_overrides(raw: str) -> None:
+    path = Path(raw)
+    text = path.read_text(encoding="utf-8") if path.is_file() else raw
+    TTLS.update({ns: float(ttl) for ns, ttl in json.loads(text).items()})
+
+
+if os.getenv("STORE_TTLS"):
+    _load_overrides(os.environ["STORE_TTLS"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key     BLOB    PRIMARY KEY,
+    ns      TEXT    NOT NULL,
+    value   TEXT    NOT NULL,
+    size    INTEGER NOT NULL,
+    expires INTEGER NOT NULL,
+    used    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used, key, expires, size);
+"""
+
+_index: "OrderedDict[bytes, Tuple[int, int]]" = OrderedDict()   # key → (expires, size)
+_used: Set[bytes] = set()                     # ключи, чьё время использования не записано
+_bytes = 0
+_compactor: Optional[asyncio.Task] = None
+
+
+def key(namespace: str, *parts: object) -> bytes:
+    """Ключ по содержимому запроса."""
+    raw = runtime.dumps([namespace, *parts]).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def _forget(k: bytes) -> None:
+    global _bytes
+    entry = _index.pop(k, None)
+    if entry is not None:
+        _bytes -= entry[1]
+    _used.discard(k)
+
+
+# ───────────────────────────── SQLite ─────────────────────────────
+
+def _read_index(conn: sqlite3.Connection, now: int) -> List[tuple]:
+    db.ensure_schema("responses", _SCHEMA)
+    return conn.execute(
+        "SELECT key, expires, size FROM responses INDEXED BY responses_used "
+        "WHERE used >= 0 AND expires > ? ORDER BY used", (now,),
+    ).fetchall()
+
+
+def _read_value(conn: sqlite3.Connection, k: bytes) -> Optional[str]:
+    db.ensure_schema("responses", _SCHEMA)
+    row = conn.execute("SELECT value FROM responses WHERE key = ?", (k,)).fetchone()
+    return row[0] if row else None
+
+
+def _write(conn: sqlite3.Connection, row: tuple) -> None:
+    db.ensure_schema("responses", _SCHEMA)
+    conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", row)
+
+
+def _sync(conn: sqlite3.Connection, used: List[tuple], dead: List[tuple], now: int) -> int:
+    db.ensure_schema("responses", _SCHEMA)
+    with conn:
+        conn.execute("BEGIN")
+        conn.executemany("UPDATE responses SET used = ? WHERE key = ?", used)
+        conn.executemany("DELETE FROM responses WHERE key = ?", dead)
+        return conn.execute("DELETE FROM responses WHERE expires <= ?", (now,)).rowcount
+
+
+# ───────────────────────────── API ─────────────────────────────
+
+def has(namespace: str, *parts: object) -> bool:
+    """Есть ли неистёкший ответ (только по индексу, без диска)."""
+    entry = _index.get(key(namespace, *parts))
+    return entry is not None and entry[0] > time.time()
+
+
+async def get(namespace: str, *parts: object) -> Optional[str]:
+    """Сохранённый ответ или `None` (промах без обращения к диску)."""
+    if not TTLS.get(namespace):
+        return None
+    k = key(namespace, *parts)
+    entry = _index.get(k)
+    value = None
+    if entry is not None and entry[0] > time.time():
+        value = await db.call(_read_value, k)
+    if value is None:
+        if entry is not None:
+            _forget(k)
+        metrics.inc("store.misses", ns=namespace)
+        return None
+    if k in _index:
+        _index.move_to_end(k)
+        _used.add(k)
+    metrics.inc("store.hits", ns=namespace)
+    return value
+
+
+async def put(namespace: str, value: str, *parts: object,
+              ttl: Optional[float] = None) -> None:
+    """Сохранить ответ на `ttl` секунд (по умолчанию — `TTLS[namespace]`)."""
+    global _bytes
+    ttl = TTLS.get(namespace, 0) if ttl is None else ttl
+    if not ttl or not value:
+        return
+    k = key(namespace, *parts)
+    now = int(time.time())
+    size = len(value.encode("utf-8"))
+    await db.call(_write, (k, namespace, value, size, int(now + ttl), now))
+    _forget(k)
+    _index[k] = (int(now + ttl), size)
+    _bytes += size
+    metrics.set_gauge("store.bytes", _bytes)
+    if _bytes > MAX_BYTES:
+        await compact()
+
+
+async def compact() -> int:
+    """Удалить истёкшие и лишние по объёму записи, записать время использования.
+
+    Returns
+    -------
+    int
+        Сколько записей удалено.
+    """
+    now = int(time.time())
+    expired = [k for k, (expires, _) in _index.items() if expires <= now]
+    for k in expired:
+        _forget(k)
+    evicted = []
+    while _bytes > MAX_BYTES * 0.9 and _index:
+        k = next(iter(_index))
+        _forget(k)
+        evicted.append((k,))
+    used = [(now, k) for k in _used]
+    _used.clear()
+    removed = await db.call(_sync, used, evicted, now)
+    metrics.inc("store.evicted", removed, reason="ttl")
+    metrics.inc("store.evicted", len(evicted), reason="size")
+    metrics.set_gauge("store.bytes", _bytes)
+    return removed + len(evicted)
+
+
+async def stop() -> None:
+    """Остановить уплотнение и записать время использования
+    (хук `services.lifecycle`)."""
+    if _compactor is not None and not _compactor.done():
+        _compactor.cancel()
+        await asyncio.gather(_compactor, return_exceptions=True)
+    if _used:
+        used = [(int(time.time()), k) for k in _used]
+        _used.clear()
+        await db.call(_sync, used, [], 0)
+
+
+async def _compact_forever() -> None:
+    while True:
+        await asyncio.sleep(COMPACT_SECONDS)
+        try:
+            await compact()
+        except Exception as exc:                      # noqa: BLE001
+            logger.warning("Response store compaction failed: %s", exc)
+
+
+async def load() -> int:
+    """Поднять индекс из базы и запустить периодическое уплотнение.
+
+    Returns
+    -------
+    int
+        Число записей в индексе.
+    """
+    global _bytes, _compactor
+    rows = await db.call(_read_index, int(time.time()))
+    for k, expires, size in rows:
+        _index[k] = (expires, size)
+        _bytes += size
+    metrics.set_gauge("store.bytes", _bytes)
+    if _compactor is None or _compactor.done():
+        _compactor = asyncio.get_running_loop().create_task(
+            _compact_forever(), name="store-compact")
+    logger.info("Response store: %d entries, %.1f MB", len(_index), _bytes / 2**20)
+    return len(_index)
@@ -0,0 +1,187 @@
+"""
+services.sweeper
+================
+
+Завершение брошенных диалогов по простою.
+
+Ни один `ConversationHandler` (gpt, talk, quiz, translator) не задаёт
+`conversation_timeout`: чат, ушедший из режима без «Главного меню»,
+навсегда остаётся в словаре состояний диалога (и в сессиях
+`services.sessions`). Штатный таймаут PTB требует `JobQueue`
+(экстра `job-queue` с APScheduler) и заводит по задаче на каждый
+апдейт, поэтому здесь своя очередь сроков:
+
+* `touch` (`TypeHandler` в группе `-2`, раньше `services.recorder`)
+  на каждый апдейт записывает время последней активности чата;
+  в кучу сроков чат попадает, только если его там ещё нет, —
+  O(1) на апдейт, O(log n) на чат за интервал простоя;
+* фоновая задача спит до ближайшего срока, достаёт чат из кучи и
+  сверяет его последнюю активность с таймаутом каждого режима,
+  в котором чат сейчас находится: просроченные диалоги завершаются
+  (`ConversationHandler.END`, сессия режима удаляется, незавершённые
+  генерации чата отменяются — `services.tasks`), для остальных
+  срок переносится на «последняя активность + таймаут». Чат без
+  открытых диалогов забывается. Полных проходов по всем чатам нет.
+
+Таймауты в секундах задаются по режимам в `SESSION_IDLE_TIMEOUTS`
+(JSON-строка или путь к JSON-файлу, как `USAGE_QUOTAS`); `0` — режим
+не завершается. Если задан `SESSION_END_NOTICE=1`, чату отправляется
+короткое беззвучное уведомление о завершении.
+
+Завершения считаются в `services.metrics` как `sweeper.ended{mode=...}`.
+"""
+
+from __future__ import annotations
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application, ContextTypes, ConversationHandler, TypeHandler
+
+from services import metrics, sessions
+from services.tasks import tasks
+
+logger = logging.getLogger(__name__)
+
+TIMEOUTS: Dict[str, float] = {
+    "gpt":        30 * 60,
+    "talk":       30 * 60,
+    "quiz":       15 * 60,
+    "translator": 60 * 60,
+}
+NOTICE = os.getenv("SESSION_END_NOTICE", "") not in ("", "0")
+NOTICE_TEXT = "⌛ Сеанс завершён из-за неактивности. /start — главное меню."
+
+
+def _load_overrides(raw: str) -> None:
+    path = Path(raw)
+    text = path.read_text(encoding="utf-8") if path.is_file() else raw
+    TIMEOUTS.update({mode: float(sec) for mode, sec in json.loads(text).items()})
+
+
+if os.getenv("SESSION_IDLE_TIMEOUTS"):
+    _load_overrides(os.environ["SESSION_IDLE_TIMEOUTS"])
+
+_handlers: Dict[str, ConversationHandler] = {}
+_heap: List[Tuple[float, int]] = []        # (срок проверки, chat_id)
+_seen: Dict[int, float] = {}               # chat_id → последняя активность; ровно одна запись в куче
+_wake = asyncio.Event()
+_runner: Optional[asyncio.Task] = None
+
+
+def _schedule(deadline: float, chat_id: int) -> None:
+    heapq.heappush(_heap, (deadline, chat_id))
+    if _heap[0][1] == chat_id:
+        _wake.set()
+
+
+async def touch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """`TypeHandler`-колбэк: отметить активность чата."""
+    chat = update.effective_chat
+    if chat is None or not _handlers:
+        return
+    now = time.monotonic()
+    if chat.id not in _seen:
+        _schedule(now + min(TIMEOUTS[mode] for mode in _handlers), chat.id)
+    _seen[chat.id] = now
+
+
+async def _expire(app: Application, chat_id: int) -> None:
+    last = _seen.get(chat_id)
+    if last is None:
+        return
+    now = time.monotonic()
+    key = (chat_id,)
+    ended: List[str] = []
+    recheck: Optional[float] = None
+    for mode, handler in _handlers.items():
+        # Публичного способа завершить чужой диалог в PTB нет;
+        # штатный таймаут делает то же самое через `_update_state(END)`.
+        if key not in handler._conversations:
+            continue
+        deadline = last + TIMEOUTS[mode]
+        if deadline <= now:
+            handler._conversations.pop(key, None)
+            store = sessions.STORES.get(mode)
+            if store is not None:
+                store.drop(chat_id)
+            metrics.inc("sweeper.ended", mode=mode)
+            ended.append(mode)
+        else:
+            recheck = deadline if recheck is None else min(recheck, deadline)
+
+    if ended:
+        tasks.cancel(chat_id)
+    if recheck is None:
+        del _seen[chat_id]
+        app.drop_chat_data(chat_id)
+    else:
+        _schedule(recheck, chat_id)
+
+    if ended and NOTICE:
+        try:
+            await app.bot.send_message(chat_id, NOTICE_TEXT, disable_notification=True)
+        except TelegramError as exc:
+            logger.debug("Idle notice to %s failed: %s", chat_id, exc)
+
+
+async def _run(app: Application) -> None:
+    while True:
+        _wake.clear()
+        if not _heap:
+            await _wake.wait()
+            continue
+        delay = _heap[0][0] - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(_wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        _, chat_id = heapq.heappop(_heap)
+        try:
+            await _expire(app, chat_id)
+        except Exception as exc:                      # noqa: BLE001
+            logger.exception("Idle sweep of chat %s failed: %s", chat_id, exc)
+        metrics.set_gauge("sweeper.tracked", len(_seen))
+
+
+def register(app: Application) -> int:
+    """Найти диалоги с таймаутом среди обработчиков `app` и подключить `touch`.
+
+    Вызывается после регистрации всех `ConversationHandler`.
+
+    Returns
+    -------
+    int
+        Число диалогов под присмотром.
+    """
+    for handler in app.handlers.get(0, []):
+        if isinstance(handler, ConversationHandler) and TIMEOUTS.get(handler.name or ""):
+            _handlers[handler.name] = handler
+    if _handlers:
+        # В группе обрабатывает апдейт только первый подошедший
+        # обработчик, поэтому не `-1`, где `TypeHandler` записи апдейтов.
+        app.add_handler(TypeHandler(Update, touch), group=-2)
+    return len(_handlers)
+
+
+def start(app: Application) -> None:
+    """Запустить фоновую очистку (из `post_init`)."""
+    global _runner
+    if _handlers and (_runner is None or _runner.done()):
+        _runner = asyncio.get_running_loop().create_task(_run(app), name="idle-sweeper")
+
+
+async def stop() -> None:
+    """Остановить фоновую очистку (хук `services.lifecycle`)."""
+    if _runner is not None and not _runner.done():
+        _runner.cancel()
+        await asyncio.gather(_runner, return_exceptions=True)
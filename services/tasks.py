@@ -0,0 +1,88 @@
+"""
+services.tasks
+==============
+
+Реестр фоновых генераций по чатам.
+
+Ответы ChatGPT в чат-режимах и недельное меню готовятся в фоновых
+задачах (`services.debounce`, `handlers.cook`), чтобы обработчик PTB
+не держал очередь апдейтов. Каждая такая задача регистрируется здесь
+под `chat_id`. Когда пользователь уходит из режима («🚪 Закончить»,
+«🔚 Закончить диалог», «🔙 Главное меню», `/start`), `cancel(chat_id)`
+отменяет все его генерации:
+
+* `CancelledError` доходит до `await` внутри OpenAI SDK, и httpx
+  закрывает HTTP-запрос — токены, которые никто не увидит, больше
+  не генерируются;
+* ответ не приходит в диалог, из которого пользователь уже вышел;
+* освобождаются слоты конкурентности.
+"""
+
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Coroutine, Dict, Optional, Set, Tuple
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTasks:
+    """`chat_id → множество незавершённых задач`."""
+
+    def __init__(self) -> None:
+        self._tasks: Dict[int, Set[asyncio.Task]] = {}
+
+    def track(self, chat_id: int, task: asyncio.Task) -> asyncio.Task:
+        """Зарегистрировать уже созданную задачу чата."""
+        self._tasks.setdefault(chat_id, set()).add(task)
+        task.add_done_callback(lambda t: self._done(chat_id, t))
+        return task
+
+    def spawn(self, chat_id: int, coro: Coroutine, *,
+              name: Optional[str] = None) -> asyncio.Task:
+        """Запустить корутину фоновой задачей чата."""
+        return self.track(chat_id, asyncio.create_task(coro, name=name))
+
+    def _done(self, chat_id: int, task: asyncio.Task) -> None:
+        tasks = self._tasks.get(chat_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[chat_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background task %s failed", task.get_name(),
+                         exc_info=task.exception())
+
+    def cancel(self, chat_id: int) -> int:
+        """Отменить все незавершённые задачи чата.
+
+        Returns
+        -------
+        int
+            Сколько задач было отменено.
+        """
+        cancelled = 0
+        for task in list(self._tasks.get(chat_id, ())):
+            if task.cancel():
+                cancelled += 1
+        if cancelled:
+            metrics.inc("tasks.cancelled", cancelled)
+            logger.info("Cancelled %d generation(s) in chat %s", cancelled, chat_id)
+        return cancelled
+
+    def all(self) -> Tuple[asyncio.Task, ...]:
+        """Незавершённые задачи всех чатов."""
+        return tuple(task for chat in self._tasks.values() for task in chat)
+
+    def of(self, chat_id: int) -> Tuple[asyncio.Task, ...]:
+        """Незавершённые задачи чата."""
+        return tuple(self._tasks.get(chat_id, ()))
+
+    def inflight(self) -> int:
+        """Общее число незавершённых задач."""
+        return sum(len(tasks) for tasks in self._tasks.values())
+
+
+tasks = ChatTasks()
@@ -25,6 +25,10 @@ services.ui
 
 from telegram import InlineKeyboardButton as Btn, InlineKeyboardMarkup as Mk
 
+# Разделитель «префикс:аргумент:…». Префикс — ключ маршрутизации
+# в `services.router`, всё после него — аргументы обработчика.
+from services.codec import SEP as CB_SEP, pack
+
 CB_MAIN_MENU     = "main_menu"          # 🔙 «Главное меню»
 CB_GPT           = "main_gpt"           # 🤖 ChatGPT-диалог
 CB_RANDOM_FACT   = "main_rand_fact"     # 🧠 Случайный факт
@@ -41,8 +45,26 @@ CB_P_OPPENHEIMER = "persona_oppenheimer"
 CB_P_KURCHATOV   = "persona_kurchatov"
 CB_END_TALK      = "end_talk"
 
-CB_COOK_PREFIX   = "cook_kcal"          # Префикс: cook_kcal:<n>
+CB_COOK_PREFIX   = "cook_kcal"          # Префикс: pack(cook_kcal, n)
 CB_COOK_BACK     = "cook_back"          # «Выбрать другой лимит»
+COOK_KCAL_PRESETS = (1000, 1500, 2000, 2500, 3000)   # кнопки /cook, их меню прогреваются
+
+CB_RANDOM_MORE   = "random_more"        # 🧠 «Ещё факт»
+CB_RANDOM_FINISH = "random_finish"      # 🔚 «Закончить» под фактом
+
+CB_GPT_STOP      = "gpt_stop"           # 🚪 «Закончить» в ChatGPT-диалоге
+
+CB_QUIZ_TOPIC    = "quiz_topic"         # Префикс: pack(quiz_topic, topic_idx)
+CB_QUIZ_ANS      = "quiz_ans"           # Префикс: pack(quiz_ans, q_id, idx)
+CB_QUIZ_NEXT     = "quiz_next"          # Префикс: pack(quiz_next, topic_idx)
+CB_QUIZ_FINISH   = "quiz_finish"
+CB_QUIZ_TOP      = "quiz_top"           # 🏆 «Рейтинг»
+
+CB_LANG_EN       = "lang_en"
+CB_LANG_ES       = "lang_es"
+CB_LANG_ZH       = "lang_zh"
+CB_LANG_DONE     = "lang_done"          # ✅ «Готово» в мультивыборе языков
+CB_TRANSLATOR_CHANGE = "translator_change"   # 🌐 «Сменить язык»
 
 
 def get_main_menu_keyboard() -> Mk:
@@ -116,14 +138,12 @@ def get_cook_kcal_keyboard() -> Mk:
         -------
         telegram.InlineKeyboardMarkup
             * 1000 ккал, 1500 ккал, 2000 ккал, 2500 ккал, 3000 ккал
+              (`COOK_KCAL_PRESETS`) по две в ряд;
             * Плюс кнопка возврата в «Главное меню».
     """
-    return Mk([
-        [Btn("1000 ккал", callback_data=f"{CB_COOK_PREFIX}:1000"),
-         Btn("1500 ккал", callback_data=f"{CB_COOK_PREFIX}:1500")],
-        [Btn("2000 ккал", callback_data=f"{CB_COOK_PREFIX}:2000"),
-         Btn("2500 ккал", callback_data=f"{CB_COOK_PREFIX}:2500")],
-        [Btn("3000 ккал", callback_data=f"{CB_COOK_PREFIX}:3000")],
+    buttons = [Btn(f"{kcal} ккал", callback_data=pack(CB_COOK_PREFIX, kcal))
+               for kcal in COOK_KCAL_PRESETS]
+    return Mk([buttons[i:i + 2] for i in range(0, len(buttons), 2)] + [
         [Btn("🔙 Главное меню", callback_data=CB_MAIN_MENU)],
     ])
 
@@ -144,3 +164,16 @@ def get_cook_result_keyboard() -> Mk:
         [Btn("🔄 Выбрать другой лимит", callback_data=CB_COOK_BACK)],
         [Btn("🔙 Главное меню",         callback_data=CB_MAIN_MENU)],
     ])
+
+
+def get_back_keyboard() -> Mk:
+    """
+        Одна кнопка «🔙 Главное меню» — например, под сообщением
+        «⏳ Готовлю меню…», чтобы из ожидания можно было выйти
+        (незавершённая генерация при этом отменяется).
+
+        Returns
+        -------
+        telegram.InlineKeyboardMarkup
+    """
+    return Mk([[Btn("🔙 Главное меню", callback_data=CB_MAIN_MENU)]])
@@ -0,0 +1,317 @@
+"""
+services.usage
+==============
+
+Учёт расхода OpenAI по пользователям и задачам, дневные квоты
+и ограничение частоты запросов.
+
+* `check(user_id, task)` вызывается один раз на действие пользователя
+  (`ask_chatgpt`, `translate_many`) **до** обращения к OpenAI и бросает
+  `QuotaExceeded`, если пользователь исчерпал дневную квоту
+  запросов/токенов или превысил частоту запросов в скользящем окне
+  `USAGE_RATE_WINDOW` секунд (по умолчанию 60). Проверка — O(1)
+  по словарям в памяти, без обращения к диску. Если обращение
+  к OpenAI потом упало, `refund(...)` возвращает занятый слот окна.
+* `record(...)` после каждого ответа добавляет `resp.usage` к дневным
+  счётчикам в памяти и к «хвосту» несохранённых приращений; запрос
+  считается один раз на вызов `ask_chatgpt`, дозапросы продолжения
+  добавляют только токены.
+* Хвост раз в `USAGE_FLUSH_SECONDS` (по умолчанию 30) одним
+  `executemany` UPSERT-ом сливается в таблицу `usage_daily`
+  (`services.db`); заодно забываются окна частоты без запросов
+  за последние `USAGE_RATE_WINDOW` секунд. При старте `load()`
+  поднимает сегодняшние счётчики из базы, поэтому перезапуск бота
+  квоты не обнуляет.
+
+Квоты
+-----
+Ключ `"*"` ограничивает пользователя суммарно по всем задачам,
+ключи задач (`menu`, `chat`, …) — дополнительно по отдельной задаче.
+`0` — без ограничения. Переопределяются через `USAGE_QUOTAS`
+(JSON-строка или путь к JSON-файлу), как `OPENAI_PROFILES`:
+
+    {"*": {"tokens": 200000}, "menu": {"requests": 5, "rate": 1}}
+
+Обращения без `user_id` (прогрев банка квиза и т. п.) учитываются
+под пользователем `0` и квотами не ограничиваются.
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from services import metrics
+from services.db import db
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOW = float(os.getenv("USAGE_RATE_WINDOW", "60"))
+FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+
+TOTAL = "*"
+
+
+class Quota(NamedTuple):
+    """Дневные лимиты и частота запросов; `0` — без ограничения."""
+    tokens: int = 0
+    requests: int = 0
+    rate: int = 0                   # запросов за RATE_WINDOW секунд
+
+
+QUOTAS: Dict[str, Quota] = {
+    TOTAL:  Quota(tokens=150_000, requests=400, rate=12),
+    "menu": Quota(requests=20, rate=2),
+}
+
+
+class QuotaExceeded(RuntimeError):
+    """Запрос отклонён до отправки в OpenAI.
+
+    Текст исключения можно показывать пользователю как есть.
+
+    Attributes
+    ----------
+    retry_after:
+        Через сколько секунд имеет смысл повторить запрос.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day               TEXT    NOT NULL,
+    user_id           INTEGER NOT NULL,
+    task              TEXT    NOT NULL,
+    requests          INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, task)
+) WITHOUT ROWID;
+"""
+
+_UPSERT = """
+INSERT INTO usage_daily (day, user_id, task, requests, prompt_tokens, completion_tokens)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, user_id, task) DO UPDATE SET
+    requests          = requests          + excluded.requests,
+    prompt_tokens     = prompt_tokens     + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens
+"""
+
+_Key = Tuple[int, str]
+
+_day = ""
+_totals: Dict[_Key, List[int]] = {}       # (user, task|"*") → [requests, prompt, completion]
+_pending: Dict[tuple, List[int]] = {}     # несохранённые приращения (day, user, task)
+_windows: Dict[_Key, Deque[float]] = {}   # времена последних `rate` запросов
+_flusher: Optional[asyncio.Task] = None
+
+
+def _load_overrides(raw: str) -> None:
+    path = Path(raw)
+    text = path.read_text(encoding="utf-8") if path.is_file() else raw
+    for task, fields in json.loads(text).items():
+        QUOTAS[task] = QUOTAS.get(task, Quota())._replace(**fields)
+
+
+if os.getenv("USAGE_QUOTAS"):
+    _load_overrides(os.environ["USAGE_QUOTAS"])
+
+
+def _today() -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+def _rollover() -> None:
+    """Сбросить дневные счётчики при смене суток (UTC)."""
+    global _day
+    today = _today()
+    if today != _day:
+        _day = today
+        _totals.clear()
+
+
+def check(user_id: Optional[int], task: str) -> Optional[float]:
+    """Пропустить запрос или бросить `QuotaExceeded`.
+
+    Пропущенный запрос занимает слот в окне частоты.
+
+    Returns
+    -------
+    float | None
+        Отметка занятого слота для `refund()`; `None` без пользователя.
+    """
+    if user_id is None:
+        return None
+    _rollover()
+    now = time.monotonic()
+    keys = ((user_id, TOTAL), (user_id, task))
+    for key in keys:
+        quota = QUOTAS.get(key[1])
+        if quota is None:
+            continue
+        used = _totals.get(key)
+        if used and ((quota.requests and used[0] >= quota.requests)
+                     or (quota.tokens and used[1] + used[2] >= quota.tokens)):
+            metrics.inc("usage.rejected", task=task, reason="daily")
+            raise QuotaExceeded(
+                "⏳ Дневной лимит запросов исчерпан. Попробуйте завтра.",
+                retry_after=86_400 - time.time() % 86_400,
+            )
+        window = _windows.get(key)
+        if quota.rate and window is not None and len(window) >= quota.rate:
+            wait = RATE_WINDOW - (now - window[0])
+            if wait > 0:
+                metrics.inc("usage.rejected", task=task, reason="rate")
+                raise QuotaExceeded(
+                    f"⏳ Слишком много запросов. Попробуйте через {int(wait) + 1} с.",
+                    retry_after=wait,
+                )
+    for key in keys:
+        quota = QUOTAS.get(key[1])
+        if quota is not None and quota.rate:
+            window = _windows.get(key)
+            if window is None or window.maxlen != quota.rate:
+                window = _windows[key] = deque(window or (), maxlen=quota.rate)
+            window.append(now)
+    return now
+
+
+def refund(user_id: Optional[int], task: str, stamp: Optional[float]) -> None:
+    """Вернуть слот окна частоты, занятый `check()`, если запрос не удался."""
+    if user_id is None or stamp is None:
+        return
+    for key in ((user_id, TOTAL), (user_id, task)):
+        window = _windows.get(key)
+        if window is not None and stamp in window:
+            window.remove(stamp)
+
+
+def _prune_windows() -> None:
+    """Забыть окна частоты, в которых нет запросов моложе `RATE_WINDOW`."""
+    horizon = time.monotonic() - RATE_WINDOW
+    for key in [key for key, window in _windows.items() if not window or window[-1] < horizon]:
+        del _windows[key]
+
+
+def _bump(table: Dict[tuple, List[int]], key: tuple, requests: int,
+          prompt: int, completion: int) -> None:
+    row = table.get(key)
+    if row is None:
+        table[key] = [requests, prompt, completion]
+    else:
+        row[0] += requests
+        row[1] += prompt
+        row[2] += completion
+
+
+def record(user_id: Optional[int], task: str,
+           prompt_tokens: int, completion_tokens: int, *, requests: int = 1) -> None:
+    """Учесть один ответ OpenAI (`resp.usage`).
+
+    Дозапросы продолжения оборванного ответа передают `requests=0`:
+    их токены учитываются, а запрос пользователя считается один раз.
+    """
+    _rollover()
+    uid = user_id or 0
+    _bump(_totals, (uid, task), requests, prompt_tokens, completion_tokens)
+    _bump(_totals, (uid, TOTAL), requests, prompt_tokens, completion_tokens)
+    _bump(_pending, (_day, uid, task), requests, prompt_tokens, completion_tokens)
+    metrics.inc("usage.tokens", prompt_tokens + completion_tokens, task=task)
+    _ensure_flusher()
+
+
+def used(user_id: int, task: str = TOTAL) -> Tuple[int, int]:
+    """`(запросов, токенов)` пользователя за сегодня."""
+    _rollover()
+    row = _totals.get((user_id, task))
+    return (row[0], row[1] + row[2]) if row else (0, 0)
+
+
+# ───────────────────────────── SQLite ─────────────────────────────
+
+def _load_day(conn: sqlite3.Connection, day: str) -> List[tuple]:
+    db.ensure_schema("usage", _SCHEMA)
+    return conn.execute(
+        "SELECT user_id, task, requests, prompt_tokens, completion_tokens "
+        "FROM usage_daily WHERE day = ?", (day,),
+    ).fetchall()
+
+
+def _write(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    db.ensure_schema("usage", _SCHEMA)
+    with conn:
+        conn.execute("BEGIN")
+        conn.executemany(_UPSERT, rows)
+
+
+async def load() -> int:
+    """Поднять сегодняшние счётчики из базы и запустить периодический сброс.
+
+    Returns
+    -------
+    int
+        Число загруженных строк `usage_daily`.
+    """
+    _rollover()
+    rows = await db.call(_load_day, _day)
+    for uid, task, requests, prompt, completion in rows:
+        for key in ((uid, task), (uid, TOTAL)):
+            row = _totals.setdefault(key, [0, 0, 0])
+            row[0] += requests
+            row[1] += prompt
+            row[2] += completion
+    _ensure_flusher()
+    return len(rows)
+
+
+async def flush() -> int:
+    """Слить накопленные приращения в `usage_daily`.
+
+    Returns
+    -------
+    int
+        Число записанных строк.
+    """
+    global _pending
+    _prune_windows()
+    if not _pending:
+        return 0
+    batch, _pending = _pending, {}
+    rows = [(*key, *row) for key, row in batch.items()]
+    try:
+        await db.call(_write, rows)
+    except Exception as exc:                          # noqa: BLE001
+        logger.warning("Usage flush failed, will retry: %s", exc)
+        for key, row in batch.items():
+            pending = _pending.setdefault(key, [0, 0, 0])
+            for i, value in enumerate(row):
+                pending[i] += value
+        return 0
+    return len(rows)
+
+
+async def _flush_forever() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_SECONDS)
+        await flush()
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is None or _flusher.done():
+        try:
+            _flusher = asyncio.get_running_loop().create_task(
+                _flush_forever(), name="usage-flush")
+        except RuntimeError:                          # нет event loop (CLI)
+            _flusher = None
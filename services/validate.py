@@ -0,0 +1,249 @@
+"""
+services.validate
+=================
+
+Дешёвая локальная проверка и починка ответов ChatGPT перед отправкой.
+
+Текст модели уходил в Telegram как есть. Непарная `*` или `_`
+в сообщении с `parse_mode="Markdown"` — и Telegram отклоняет его
+целиком («Can't parse entities»), а повторная генерация стоит денег
+и секунд. Здесь ответ чинится на месте, без повторного запроса:
+
+* `markdown()` — приводит «GitHub-разметку» модели к legacy Markdown
+  Telegram (`**жирный**` → `*жирный*`, заголовки `###` → жирная строка,
+  маркеры списков `* ` → `• `), затем балансирует сущности: маркер
+  без пары и `[` без ссылки экранируются, незакрытый блок кода
+  закрывается;
+* `quiz()` — разбирает JSON вопроса викторины (в т. ч. внутри
+  ```json-блока), приводит ответ-букву или ответ-текст к индексу,
+  обрезает лишние варианты и проверяет схему;
+* `menu()` — проверяет, что в недельном меню есть все семь дней,
+  и восполняет пропущенный день повтором соседнего;
+* `split()` — режет длинный текст на сообщения по границам абзацев
+  (лимит Telegram — 4096 символов, подписи — 1024).
+
+Каждая починка считается в `services.metrics` как
+`validate.repairs{kind=...}`.
+"""
+
+from __future__ import annotations
+import re
+from typing import List, Tuple
+
+from services import metrics, runtime
+
+QuizItem = Tuple[str, List[str], int]
+
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+DAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+_LINK = re.compile(r"\[[^\]\n]+\]\([^)\s]+\)")
+_DOUBLE = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1", re.S)
+_HEADING = re.compile(r"^#{1,6}[ \t]+(.+?)[ \t#]*$", re.M)
+_BULLET = re.compile(r"^([ \t]*)[*+-][ \t]+", re.M)
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+_DAY_LINE = re.compile(r"^[ \t*_•]*(Пн|Вт|Ср|Чт|Пт|Сб|Вс)\b.*$", re.M)
+_SHOPPING = re.compile(r"^.*Список покупок.*$", re.M | re.I)
+_LETTERS = {"a": 0, "b": 1, "c": 2, "а": 0, "б": 1, "в": 2}
+
+
+def _repair(kind: str, count: int = 1) -> None:
+    if count:
+        metrics.inc("validate.repairs", count, kind=kind)
+
+
+def _normalise(text: str) -> str:
+    """GitHub-разметка модели → legacy Markdown Telegram."""
+    text, n = _HEADING.subn(r"*\1*", text)
+    _repair("heading", n)
+    text, n = _BULLET.subn(r"\1• ", text)
+    _repair("bullet", n)
+    text, n = _DOUBLE.subn(lambda m: m.group(1)[0] + m.group(2) + m.group(1)[0], text)
+    _repair("double", n)
+    return text
+
+
+def _balance(text: str) -> Tuple[str, int]:
+    """Экранировать непарные маркеры, закрыть незакрытый блок кода."""
+    out: List[str] = []
+    fixes = 0
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\" and i + 1 < n:
+            out.append(text[i:i + 2])
+            i += 2
+        elif text.startswith("```", i):
+            end = text.find("```", i + 3)
+            if end < 0:
+                out.append(text[i:] + "\n```")
+                fixes += 1
+                break
+            out.append(text[i:end + 3])
+            i = end + 3
+        elif ch in "*_`":
+            end = text.find(ch, i + 1)
+            if end < 0 or end == i + 1:
+                out.append("\\" + ch)
+                fixes += 1
+                i += 1
+            else:
+                out.append(text[i:end + 1])
+                i = end + 1
+        elif ch == "[":
+            link = _LINK.match(text, i)
+            if link:
+                out.append(link.group(0))
+                i = link.end()
+            else:
+                out.append("\\[")
+                fixes += 1
+                i += 1
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out), fixes
+
+
+def markdown(text: str, limit: int = MESSAGE_LIMIT) -> str:
+    """Подготовить текст к отправке с `parse_mode="Markdown"`.
+
+    Parameters
+    ----------
+    text:
+        Сырой ответ модели.
+    limit:
+        Максимальная длина результата (`CAPTION_LIMIT` для подписей).
+        Текст обрезается **до** балансировки, поэтому обрезка не
+        оставляет незакрытых сущностей.
+    """
+    text = _normalise(text.strip())
+    if len(text) > limit:
+        _repair("truncate")
+    result, fixes = _balance(text[:limit])
+    if len(result) > limit:
+        # Экранирование удлиняет текст: ищем самый длинный влезающий
+        # префикс двоичным поиском (вычитание перебора при густых
+        # экранах проскакивало до пустой строки).
+        fits, over = 0, min(limit, len(text))
+        result, fixes = "", 0
+        while over - fits > 1:
+            cut = (fits + over) // 2
+            candidate, candidate_fixes = _balance(text[:cut])
+            if len(candidate) <= limit:
+                fits, result, fixes = cut, candidate, candidate_fixes
+            else:
+                over = cut
+    _repair("entity", fixes)
+    return result
+
+
+def split(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Разрезать текст на части не длиннее `limit` по абзацам/строкам."""
+    parts: List[str] = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    if len(parts) > 1:
+        _repair("split", len(parts) - 1)
+    return parts
+
+
+def quiz(raw: str) -> QuizItem:
+    """Разобрать и проверить JSON вопроса викторины.
+
+    Returns
+    -------
+    tuple[str, list[str], int]
+        (`вопрос`, `три варианта`, `индекс правильного`).
+
+    Raises
+    ------
+    ValueError
+        Ответ не удаётся привести к схеме.
+    """
+    fenced = _FENCE.search(raw)
+    if fenced:
+        _repair("quiz_fence")
+        raw = fenced.group(1)
+    start, end = raw.find("{"), raw.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("no JSON object in quiz answer")
+    data = runtime.loads(raw[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("quiz JSON is not an object")
+
+    question = str(data.get("q") or data.get("question") or "").strip()
+    options = data.get("options")
+    if not question or not isinstance(options, list):
+        raise ValueError("quiz JSON does not match the schema")
+    options = [str(o).strip() for o in options]
+
+    answer = data.get("answer")
+    if isinstance(answer, str):
+        key = answer.strip().lower().rstrip(").")
+        if key.isdigit():
+            answer = int(key)
+        elif key in _LETTERS:
+            answer = _LETTERS[key]
+        elif answer.strip() in options:
+            answer = options.index(answer.strip())
+        else:
+            raise ValueError(f"quiz answer {answer!r} is not an option")
+        _repair("quiz_answer")
+    if isinstance(answer, bool) or not isinstance(answer, int):
+        raise ValueError("quiz answer is not an index")
+
+    if len(options) > 3 and 0 <= answer < 3:
+        options = options[:3]
+        _repair("quiz_options")
+    if (len(options) != 3 or not all(options)
+            or len(set(options)) != 3 or not 0 <= answer < 3):
+        raise ValueError("quiz JSON does not match the schema")
+    return question, options, answer
+
+
+def menu(text: str) -> str:
+    """Проверить недельное меню и восполнить пропущенные дни.
+
+    День без блока заменяется копией ближайшего предыдущего (или
+    следующего) дня с пометкой «как …» — лучше, чем заново
+    генерировать меню из-за одного пропуска. Текст без единого
+    заголовка дня возвращается как есть.
+    """
+    headers = list(_DAY_LINE.finditer(text))
+    present = {}
+    for idx, match in enumerate(headers):
+        day = match.group(1)
+        if day in present:
+            continue
+        end = headers[idx + 1].start() if idx + 1 < len(headers) else len(text)
+        shopping = _SHOPPING.search(text, match.end(), end)
+        present[day] = text[match.start():shopping.start() if shopping else end].rstrip()
+    missing = [day for day in DAYS if day not in present]
+    if not present or not missing:
+        return text
+
+    last = headers[-1]
+    shopping = _SHOPPING.search(text, last.start())
+    blocks = []
+    for i, day in enumerate(DAYS):
+        if day in present:
+            blocks.append(present[day])
+            continue
+        source = next((d for d in reversed(DAYS[:i]) if d in present), None) \
+            or next(d for d in DAYS[i + 1:] if d in present)
+        body = present[source].split("\n", 1)
+        blocks.append(f"{day} (как {source})" + ("\n" + body[1] if len(body) > 1 else ""))
+    _repair("menu_day", len(missing))
+    head = text[:headers[0].start()]
+    tail = text[shopping.start():] if shopping else ""
+    return head + "\n\n".join(blocks) + ("\n\n" + tail if tail else "")
@@ -0,0 +1,242 @@
+"""
+services.warmup
+===============
+
+Фоновый прогрев кэшируемого контента при старте и в часы низкой нагрузки.
+
+После деплоя первые пользователи `/random`, `/cook` и `/quiz` ждут
+полную генерацию. Планировщик (обычная asyncio-задача, как
+`services.sweeper`; `JobQueue` PTB требует отдельного extra) заранее
+готовит:
+
+* **факты** — буфер из `WARMUP_FACTS` (по умолчанию 20) фактов в памяти;
+  `take_fact()` отдаёт их по одному (`handlers.random`) с теми же
+  квотами `services.usage`, что и генерация; пустой буфер — обычная
+  генерация;
+* **вопросы квиза** — добирает банк (`services.quiz_bank`) до
+  `WARMUP_QUIZ` вопросов (по умолчанию 30) по каждой теме;
+* **меню** — для каждого пресета `ui.COOK_KCAL_PRESETS`, которого нет
+  в `services.store` (пространство `menu`).
+
+Когда
+-----
+Один проход при старте и проходы каждые `WARMUP_INTERVAL` секунд
+(по умолчанию 600) внутри окон `WARMUP_WINDOWS` — через запятую,
+по локальному времени сервера, окно может переходить через полночь
+(по умолчанию `03:00-06:00`, пусто — только при старте).
+
+Сколько
+-------
+На старт и на каждое окно — свой бюджет: не больше `WARMUP_MAX_REQUESTS`
+запросов (по умолчанию 60) и `WARMUP_MAX_TOKENS` токенов (по умолчанию
+100 000; запрос оценивается сверху — `max_tokens` профиля задачи
+с учётом дозапросов). Запросы идут строго по одному, и каждый ждёт,
+пока не закончатся запросы живых пользователей
+(`openai_client.in_flight()`), а сами запросы идут в фоновой полосе
+`services.gate` и уступают очередь живым, так что прогрев не занимает
+место живого трафика. Задачи чередуются (факт → вопрос → меню), чтобы
+небольшой бюджет не ушёл целиком на одну из них.
+
+В кластерном режиме общие для воркеров банк вопросов и меню греет
+только первый воркер (`cluster.leader()`), буфер фактов — каждый свой.
+
+Метрики: `warmup.requests{job}`, `warmup.failed{job}`, gauge `warmup.facts`.
+`WARMUP=0` выключает прогрев.
+"""
+
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from services import cluster, metrics, model_router, openai_client, quiz_bank, store, usage
+from services.ui import COOK_KCAL_PRESETS
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WARMUP", "1") not in ("", "0")
+FACTS = int(os.getenv("WARMUP_FACTS", "20"))
+QUIZ = int(os.getenv("WARMUP_QUIZ", "30"))
+INTERVAL = float(os.getenv("WARMUP_INTERVAL", "600"))
+MAX_REQUESTS = int(os.getenv("WARMUP_MAX_REQUESTS", "60"))
+MAX_TOKENS = int(os.getenv("WARMUP_MAX_TOKENS", "100000"))
+QUIET_POLL = 0.5
+
+
+def _parse_windows(raw: str) -> List[Tuple[dt.time, dt.time]]:
+    windows = []
+    for part in filter(None, (p.strip() for p in raw.split(","))):
+        start, end = part.split("-")
+        windows.append((dt.time.fromisoformat(start.strip()),
+                        dt.time.fromisoformat(end.strip())))
+    return windows
+
+
+WINDOWS = _parse_windows(os.getenv("WARMUP_WINDOWS", "03:00-06:00"))
+
+Step = Tuple[str, Callable[[], Awaitable[None]]]
+
+_facts: Deque[str] = deque()
+_topics: Dict[str, str] = {}
+_turn = 0
+_task: Optional[asyncio.Task] = None
+
+
+def take_fact(user_id: Optional[int]) -> Optional[str]:
+    """Заранее сгенерированный факт или `None`, если буфер пуст.
+
+    Выдача из буфера проходит те же квоты и лимит частоты, что и
+    генерация (`services.usage`, задача `fact`), и считается запросом
+    пользователя; токены уже учтены за прогревом.
+
+    Raises
+    ------
+    QuotaExceeded
+        Пользователь исчерпал квоту или слишком часто просит факты.
+    """
+    if not _facts:
+        return None
+    usage.check(user_id, "fact")
+    usage.record(user_id, "fact", 0, 0)
+    fact = _facts.popleft()
+    metrics.set_gauge("warmup.facts", len(_facts))
+    return fact
+
+
+# ───────────────────────────── окна ─────────────────────────────
+
+def _window_end(now: dt.datetime) -> Optional[dt.datetime]:
+    """Конец окна, в котором находится `now`, или `None`."""
+    for start, end in WINDOWS:
+        for day in (now.date() - dt.timedelta(days=1), now.date()):
+            opened = dt.datetime.combine(day, start)
+            closed = dt.datetime.combine(day, end)
+            if closed <= opened:
+                closed += dt.timedelta(days=1)
+            if opened <= now < closed:
+                return closed
+    return None
+
+
+def _until_window(now: dt.datetime) -> float:
+    """Секунды до начала ближайшего окна (0 — уже внутри)."""
+    if _window_end(now) is not None:
+        return 0.0
+    starts = []
+    for start, _ in WINDOWS:
+        opened = dt.datetime.combine(now.date(), start)
+        starts.append(opened if opened > now else opened + dt.timedelta(days=1))
+    return (min(starts) - now).total_seconds()
+
+
+# ───────────────────────────── задачи ─────────────────────────────
+
+def _cost(task: str) -> int:
+    profile = model_router.profile(task)
+    return (profile.max_tokens or 1000) * (1 + profile.continuations)
+
+
+async def _fact() -> None:
+    _facts.append(await openai_client.get_random_fact())
+    metrics.set_gauge("warmup.facts", len(_facts))
+
+
+async def _next_step() -> Optional[Step]:
+    """Следующая единица работы по очереди факт → вопрос → меню."""
+    global _turn
+    shared = cluster.leader()
+    candidates: List[Optional[Step]] = [None, None, None]
+    if len(_facts) < FACTS:
+        candidates[0] = ("fact", _fact)
+    if shared and _topics:
+        counts = {code: await quiz_bank.count(code) for code in _topics}
+        code = min(counts, key=counts.get)
+        if counts[code] < QUIZ:
+            async def _question(code: str = code) -> None:
+                await quiz_bank.add(code, await openai_client.get_quiz_question(
+                    _topics[code], strict=True))
+            candidates[1] = ("quiz", _question)
+    if shared and store.TTLS.get("menu"):
+        for kcal in COOK_KCAL_PRESETS:
+            if not store.has("menu", openai_client.menu_prompt(kcal)):
+                async def _menu(kcal: int = kcal) -> None:
+                    await openai_client.get_week_menu(kcal)
+                candidates[2] = ("menu", _menu)
+                break
+    for i in range(len(candidates)):
+        step = candidates[(_turn + i) % len(candidates)]
+        if step is not None:
+            _turn = (_turn + i + 1) % len(candidates)
+            return step
+    return None
+
+
+async def _pass(reason: str, budget: List[int], until: Optional[float] = None) -> int:
+    """Прогреть, пока есть работа, бюджет `[запросы, токены]` и время."""
+    done = 0
+    while budget[0] > 0 and budget[1] > 0 and (until is None or time.time() < until):
+        step = await _next_step()
+        if step is None:
+            break
+        while openai_client.in_flight():
+            await asyncio.sleep(QUIET_POLL)
+        job, produce = step
+        budget[0] -= 1
+        budget[1] -= _cost(job)
+        try:
+            await produce()
+        except Exception as exc:                      # noqa: BLE001
+            metrics.inc("warmup.failed", job=job)
+            logger.warning("Warm-up %s failed: %s", job, exc)
+            continue
+        metrics.inc("warmup.requests", job=job)
+        done += 1
+    if done:
+        logger.info("Warm-up (%s): %d items, facts buffered: %d", reason, done, len(_facts))
+    return done
+
+
+async def _run() -> None:
+    await _pass("startup", [MAX_REQUESTS, MAX_TOKENS])
+    while WINDOWS:
+        await asyncio.sleep(_until_window(dt.datetime.now()))
+        end = _window_end(dt.datetime.now())
+        if end is None:
+            continue
+        until = end.timestamp()
+        budget = [MAX_REQUESTS, MAX_TOKENS]
+        while time.time() < until:
+            await _pass("off-peak", budget, until)
+            await asyncio.sleep(max(min(INTERVAL, until - time.time()), 0))
+
+
+def start(quiz_topics: Dict[str, str]) -> bool:
+    """Запустить планировщик (из `post_init`).
+
+    Parameters
+    ----------
+    quiz_topics:
+        `{код: название}` тем квиза, например `handlers.quiz.TOPICS`.
+
+    Returns
+    -------
+    bool
+        `False`, если прогрев выключен или уже запущен.
+    """
+    global _task
+    if not ENABLED or (_task is not None and not _task.done()):
+        return False
+    _topics.update(quiz_topics)
+    _task = asyncio.get_running_loop().create_task(_run(), name="warmup")
+    return True
+
+
+async def stop() -> None:
+    """Остановить прогрев (хук `services.lifecycle`)."""
+    if _task is not None and not _task.done():
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)